@@ -0,0 +1,290 @@
+import os
+import json
+import zipfile
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from AmzB2CHelperFunc import CAmzB2CHelperFunc, dictMarketplaceCurrencies, strAlphaVantageApiKey
+from fxProvider import CFxProvider
+from AmzB2CProcess import CAMZB2C
+from logUtility import CLogUtility
+
+objLogger  = CLogUtility()
+
+class CAmzB2CBatch:
+    """
+    The CAmzB2CBatch class runs the sales order, invoice and credit note builders for one
+    marketplace report, or for several reports (e.g. the USA, Canada and Mexico reports of
+    the month-end close) at once, one report per process.
+
+    Methods:
+        - MGetChunkSize
+        - MProcessReport
+        - MProcessReportWithDiagnostics
+        - MProcessReports
+        - MZipOutputs
+    """
+
+    # Marketplaces the builders support, by the lower case strOrg
+    dictMarketplaces = {'usa': 'USA', 'canada': 'Canada', 'mexico': 'Mexico'}
+
+    tax_columns = [
+        'product sales tax', 'shipping credits tax', 'giftwrap credits tax', 'marketplace withheld tax'
+    ]
+    cols_to_sum = [
+        'product sales', 'product sales tax', 'shipping credits', 'shipping credits tax',
+        'gift wrap credits', 'giftwrap credits tax', 'Regulatory Fee', 'Tax On Regulatory Fee',
+        'promotional rebates', 'promotional rebates tax', 'marketplace withheld tax',
+        'selling fees', 'fba fees', 'other transaction fees', 'other'
+    ]
+    liColsToDrop = [
+        'settlement id', 'type', 'order id', 'sku', 'description', 'quantity', 'marketplace',
+        'account type', 'fulfillment', 'order city', 'order state', 'order postal',
+        'tax collection model', 'product sales', 'shipping credits', 'gift wrap credits',
+        'giftwrap credits tax', 'promotional rebates', 'selling fees', 'fba fees', 'total',
+        'state', 'country', 'product sales tax', 'shipping credits tax', 'marketplace withheld tax',
+        'other transaction fees', 'other'
+    ]
+    dictSKUMapping = {
+        'MOSWZ70-RG-AMZUS': 'Moto Watch 70 - Rose Gold (Amazon US)',
+        'MOSWZ40-RG-AMZUS': 'Moto Watch 40 - Rose Gold (Amazon US)',
+        'MOSWZ40-PB-AMZUS': 'Moto Watch 40 - Phantom Black (Amazon US)',
+        'MOSWZ70-PB-AMZUS': 'Moto Watch 70 - Phantom Black (Amazon US)',
+        'MOSWZ70-BG-AMZUS': 'Moto Watch 70 - Bright Gold (Amazon US)',
+        'MOSWZ120-PB-AMZUS': 'Moto Watch 120 - Phantom Black (Amazon US)',
+        'MOSWZ120-RG-AMZUS': 'Moto Watch 120 - Rose Gold (Amazon US)',
+        'MOSWZ120-SL-AMZUS': 'Moto Watch 120 - Silver (Amazon US)',
+    }
+
+    @staticmethod
+    def MGetChunkSize(strDateRangeFilePath, iStreamingThresholdBytes = None, iChunkRows = 50000):
+        """
+        Get the chunk size a report should be streamed with.
+
+        Args:
+            strDateRangeFilePath (str): The file path to the CSV file (Date Range).
+            iStreamingThresholdBytes (int, optional): Reports larger than this are streamed.
+            iChunkRows (int): Number of report rows read at a time when streaming.
+
+        Returns:
+            int: The chunk size, or None to load the report in one go.
+        """
+        if iStreamingThresholdBytes is not None and os.path.getsize(strDateRangeFilePath) > iStreamingThresholdBytes:
+            return iChunkRows
+        return None
+
+    @staticmethod
+    def MProcessReport(strOrg, strDateRangeFilePath, strStartDate, strEndDate, strOutputFolderPath, iChunkSize = None, iPartitionWorkers = None, strPartitionBy = 'settlement id', dictDiagnostics = None, objBudget = None, bLocalDate = False):
+        """
+        Fetch the exchange rates and build the sales order, invoice and credit note CSV files
+        of one marketplace report.
+
+        Args:
+            strOrg (str): The organization, either 'USA', 'Canada' or 'Mexico'.
+            strDateRangeFilePath (str): The file path to the CSV file (Date Range).
+            strStartDate (str): Start date in the format 'dd-mm-yyyy'.
+            strEndDate (str): End date in the format 'dd-mm-yyyy'.
+            strOutputFolderPath (str): The folder the CSV files are written to.
+            iChunkSize (int, optional): If set, stream the report in chunks of this many rows.
+            iPartitionWorkers (int, optional): If set, build the output lines in this many processes (see CAMZB2C).
+            strPartitionBy (str): Split the rows by 'settlement id' or by 'date' for iPartitionWorkers.
+            dictDiagnostics (dict, optional): Receives the reconciliation report of the report when its sums do not match,
+                                              and the order rows left without a country by objBudget under 'degradedRows'.
+                                              The dates left without an exchange rate go under 'exchangeRateGaps', and
+                                              the reason the report failed under 'error'.
+            objBudget (CRequestBudget, optional): Time budget of the request. Once only its reserve is left, the
+                                                  order rows are geocoded offline only and those left unresolved
+                                                  are written to a 'Degraded Rows.csv' file for a manual review.
+            bLocalDate (bool): If True, date the rows in the local time of the marketplace instead of the
+                               wall-clock time printed in the report (see CAmzB2CHelperFunc.MNormalizeTimestamps).
+
+        Returns:
+            list: The paths of the sales order, invoice and credit note files (and of the degraded
+                  rows file, if any), or None if the report could not be processed.
+        """
+        os.makedirs(strOutputFolderPath, exist_ok=True)
+        if dictDiagnostics is None:
+            dictDiagnostics = {}
+
+        # Fetch exchange rates for the given date range
+        dictExchangeRates = CAmzB2CHelperFunc.MGetExchangeRatesFinalDict(
+            strOrg=strOrg, strStartDate=strStartDate, strEndDate=strEndDate, objBudget=objBudget,
+            dictDiagnostics=dictDiagnostics
+        )
+
+        # Parse, reconcile, partition by transaction type, geocode and stamp exchange rates once for all three builders,
+        # which only use the 'Order' rows
+        dictPartitions = CAmzB2CHelperFunc.MPrepareReportPartitions(
+            strDateRangeFilePath=strDateRangeFilePath, strOrg=strOrg, cols_to_sum=CAmzB2CBatch.cols_to_sum,
+            dictExchangeRates=dictExchangeRates, iChunkSize=iChunkSize, tax_columns=CAmzB2CBatch.tax_columns,
+            dictDiagnostics=dictDiagnostics, objBudget=objBudget, liPartitionTypes=['Order'], bLocalDate=bLocalDate
+        )
+        if dictPartitions is None:
+            objLogger.logError(f'Could not process the {strOrg} report: {strDateRangeFilePath}')
+            dictDiagnostics['error'] = 'The sums or the tax columns of the report do not add up'
+            return None
+        dfOrders = dictPartitions['Order']
+
+        strSalesOutputFilePath = CAMZB2C.MProcessSalesOrderCsv(
+            strDateRangeFilePath=strDateRangeFilePath, strOutputFolderPath=strOutputFolderPath,
+            dictExchangeRates=dictExchangeRates, cols_to_sum=CAmzB2CBatch.cols_to_sum, liColsToDrop=CAmzB2CBatch.liColsToDrop,
+            tax_columns=CAmzB2CBatch.tax_columns, dictSKUMapping=CAmzB2CBatch.dictSKUMapping, strOrg=strOrg, dfOrders=dfOrders,
+            iPartitionWorkers=iPartitionWorkers, strPartitionBy=strPartitionBy
+        )[1]
+
+        strInvoiceOutputFilePath = CAMZB2C.MProcessInvoiceCsv(
+            strDateRangeFilePath=strDateRangeFilePath, strOutputFolderPath=strOutputFolderPath,
+            dictExchangeRates=dictExchangeRates, cols_to_sum=CAmzB2CBatch.cols_to_sum, liColsToDrop=CAmzB2CBatch.liColsToDrop,
+            tax_columns=CAmzB2CBatch.tax_columns, dictSKUMapping=CAmzB2CBatch.dictSKUMapping, strOrg=strOrg, dfOrders=dfOrders,
+            iPartitionWorkers=iPartitionWorkers, strPartitionBy=strPartitionBy
+        )[1]
+
+        strCreditNoteOutputFilePath = CAMZB2C.MProcessCreditNoteCsv(
+            strDateRangeFilePath=strDateRangeFilePath, strOutputFolderPath=strOutputFolderPath,
+            dictExchangeRates=dictExchangeRates, cols_to_sum=CAmzB2CBatch.cols_to_sum, liColsToDrop=CAmzB2CBatch.liColsToDrop,
+            tax_columns=CAmzB2CBatch.tax_columns, strOrg=strOrg, dfOrders=dfOrders,
+            iPartitionWorkers=iPartitionWorkers, strPartitionBy=strPartitionBy
+        )[1]
+
+        # Validate processed file paths
+        liOutputFiles = [strSalesOutputFilePath, strInvoiceOutputFilePath, strCreditNoteOutputFilePath]
+        if not all(liOutputFiles) or not all(os.path.exists(f) for f in liOutputFiles):
+            objLogger.logError(f'One or more output files of the {strOrg} report are missing')
+            dictDiagnostics['error'] = 'One or more output files are missing'
+            return None
+
+        # The rows the budget left without a country, for a manual review
+        if dictDiagnostics.get('degradedRows'):
+            strDegradedFilePath = os.path.join(strOutputFolderPath, 'Degraded Rows.csv')
+            pd.DataFrame(dictDiagnostics['degradedRows']).to_csv(strDegradedFilePath, index=False, date_format='%d-%m-%Y')
+            liOutputFiles.append(strDegradedFilePath)
+        return liOutputFiles
+
+    @staticmethod
+    def MProcessReportWithDiagnostics(*tArgs, **dictKwargs):
+        """
+        Run MProcessReport and return its diagnostics along with its output files. A report process
+        cannot fill a dict of the parent process, so this is what MProcessReports runs in its pool.
+
+        Args:
+            *tArgs, **dictKwargs: The arguments of MProcessReport, but dictDiagnostics.
+
+        Returns:
+            tuple: The output file paths (or None, see MProcessReport) and the diagnostics dict of the report.
+        """
+        dictDiagnostics = {}
+        try:
+            liOutputFiles = CAmzB2CBatch.MProcessReport(*tArgs, dictDiagnostics=dictDiagnostics, **dictKwargs)
+        except Exception as e:
+            objLogger.logError(f'An error occurred while processing the {tArgs[0]} report: {e}')
+            dictDiagnostics['error'] = str(e)
+            liOutputFiles = None
+        return liOutputFiles, dictDiagnostics
+
+    @staticmethod
+    def MProcessReports(liReports, strStartDate, strEndDate, strOutputFolderPath, iMaxWorkers = None, iStreamingThresholdBytes = None, iChunkRows = 50000, objBudget = None, bLocalDate = False, dictDiagnostics = None):
+        """
+        Process several marketplace reports at once, one report per process, so the total time
+        is that of the slowest report instead of the sum of all of them. The files of each report
+        are written to a folder named after its marketplace (e.g. 'output/USA').
+
+        Args:
+            liReports (list): (strOrg, strDateRangeFilePath) pairs, one per marketplace.
+            strStartDate (str): Start date in the format 'dd-mm-yyyy'.
+            strEndDate (str): End date in the format 'dd-mm-yyyy'.
+            strOutputFolderPath (str): The folder the per-marketplace folders are created in.
+            iMaxWorkers (int, optional): Number of processes, by default one per report up to the number of cores.
+            iStreamingThresholdBytes (int, optional): Reports larger than this are streamed (see MGetChunkSize).
+            iChunkRows (int): Number of report rows read at a time when streaming.
+            objBudget (CRequestBudget, optional): Time budget of the request, shared by all the reports (see MProcessReport).
+            bLocalDate (bool): See MProcessReport.
+            dictDiagnostics (dict, optional): Receives marketplace folder name -> diagnostics of its report (see
+                                              MProcessReport), with the reason of a failed report under 'error'.
+
+        Returns:
+            dict: Marketplace folder name -> list of output file paths, or None for the reports that failed.
+
+        Raises:
+            ValueError: If a marketplace is unknown or appears more than once.
+        """
+        liJobs = []
+        for strOrg, strDateRangeFilePath in liReports:
+            strMarketplace = CAmzB2CBatch.dictMarketplaces.get(strOrg.lower())
+            if strMarketplace is None:
+                raise ValueError(f"Unknown marketplace '{strOrg}', expected one of {list(CAmzB2CBatch.dictMarketplaces.values())}")
+            if any(strMarketplace == strOther for strOther, _ in liJobs):
+                raise ValueError(f'More than one {strMarketplace} report in the batch')
+            liJobs.append((
+                strMarketplace,
+                (strOrg, strDateRangeFilePath, strStartDate, strEndDate,
+                 os.path.join(strOutputFolderPath, strMarketplace),
+                 CAmzB2CBatch.MGetChunkSize(strDateRangeFilePath, iStreamingThresholdBytes, iChunkRows),
+                 None, 'settlement id')
+            ))
+
+        # Download the exchange rates of all the marketplaces concurrently into the shared rate store,
+        # so each report process then reads them locally
+        liCurrencies = sorted({dictMarketplaceCurrencies[strOrg.lower()] for strOrg, _ in liReports} - {'USD'})
+        if liCurrencies:
+            CFxProvider.MGetDefault().MPrefetch(
+                liCurrencies,
+                CAmzB2CHelperFunc.MGetRateFetchStartDate(strStartDate),
+                datetime.strptime(strEndDate, '%d-%m-%Y').strftime('%Y-%m-%d'),
+                strAlphaVantageApiKey, objBudget
+            )
+
+        if iMaxWorkers is None:
+            iMaxWorkers = min(len(liJobs), os.cpu_count() or 1)
+
+        if dictDiagnostics is None:
+            dictDiagnostics = {}
+        dictKwargs = {'objBudget': objBudget, 'bLocalDate': bLocalDate}
+        dictOutputs = {}
+        try:
+            objExecutor = ProcessPoolExecutor(max_workers=max(iMaxWorkers, 1), mp_context=CAmzB2CHelperFunc.MGetProcessContext())
+        except (OSError, NotImplementedError) as e:
+            # Some serverless runtimes cannot create process pools, fall back to one report at a time
+            objLogger.logError(f'Process pool unavailable ({e}), processing the reports sequentially')
+            objExecutor = None
+
+        if objExecutor is None or len(liJobs) <= 1:
+            if objExecutor is not None:
+                objExecutor.shutdown()
+            for strMarketplace, tArgs in liJobs:
+                dictOutputs[strMarketplace], dictDiagnostics[strMarketplace] = CAmzB2CBatch.MProcessReportWithDiagnostics(*tArgs, **dictKwargs)
+            return dictOutputs
+
+        with objExecutor:
+            dictFutures = {strMarketplace: objExecutor.submit(CAmzB2CBatch.MProcessReportWithDiagnostics, *tArgs, **dictKwargs) for strMarketplace, tArgs in liJobs}
+            for strMarketplace, objFuture in dictFutures.items():
+                try:
+                    dictOutputs[strMarketplace], dictDiagnostics[strMarketplace] = objFuture.result()
+                except Exception as e:
+                    # The report process itself died
+                    objLogger.logError(f'An error occurred while processing the {strMarketplace} report: {e}')
+                    dictOutputs[strMarketplace], dictDiagnostics[strMarketplace] = None, {'error': str(e)}
+        return dictOutputs
+
+    @staticmethod
+    def MZipOutputs(dictOutputs, strZipFilePath, dictDiagnostics = None):
+        """
+        Write the output files of MProcessReports to a single ZIP file, in one folder per marketplace.
+
+        Args:
+            dictOutputs (dict): Marketplace folder name -> list of output file paths.
+            strZipFilePath (str): The path of the ZIP file.
+            dictDiagnostics (dict, optional): Marketplace folder name -> diagnostics of its report, from MProcessReports.
+                                              Those that are not empty are written to a 'diagnostics.json' file.
+
+        Returns:
+            str: The path of the ZIP file.
+        """
+        with zipfile.ZipFile(strZipFilePath, 'w') as zipf:
+            for strMarketplace, liOutputFiles in dictOutputs.items():
+                for strFile in liOutputFiles or []:
+                    zipf.write(strFile, f'{strMarketplace}/{os.path.basename(strFile)}')
+            dictReported = {strMarketplace: dictReport for strMarketplace, dictReport in (dictDiagnostics or {}).items() if dictReport}
+            if dictReported:
+                # The degraded rows hold timestamps, written as text
+                zipf.writestr('diagnostics.json', json.dumps(dictReported, indent=2, default=str))
+        return strZipFilePath
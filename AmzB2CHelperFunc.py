@@ -1,15 +1,81 @@
+import os
+import re
+import multiprocessing
+import numpy as np
 import pandas as pd
-import requests
-import pycountry
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 # from bs4 import BeautifulSoup
 from urllib.parse import quote
 from ensure import ensure_annotations
 from datetime import datetime, timedelta
 from logUtility import CLogUtility
+from fxProvider import CFxProvider
+from fxGapFiller import CFxGapFiller
+from fxRateMemo import CFxRateMemo
+from reportSchema import CReportSchema
+from reportCache import CReportCache
+from geocoderBackends import CGeocoderChain
+from subdivisionIndex import CSubdivisionIndex
+from postalIndex import CPostalIndex
+from locationOverrides import CLocationOverrides
+from reportReconciler import CReportReconciler, CReconciliationReport
 
 objLogger  = CLogUtility()
 
+# Month abbreviations used by the English (US, CA) and Spanish (MX) report formats
+dictMonthNumbers = {
+    'jan': 1, 'ene': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'abr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'ago': 8, 'sep': 9, 'sept': 9, 'set': 9, 'oct': 10, 'nov': 11,
+    'dec': 12, 'dic': 12
+}
+
+# UTC offsets (in hours) of the time zone suffixes found in the reports
+dictTimeZoneOffsets = {
+    'PST': -8, 'PDT': -7, 'MST': -7, 'MDT': -6, 'CST': -6, 'CDT': -5, 'EST': -5, 'EDT': -4,
+    'AST': -4, 'ADT': -3, 'GMT': 0, 'UTC': 0
+}
+
+# Local time zone of each marketplace, used when converting to the marketplace-local date
+dictMarketplaceTimeZones = {
+    'usa': 'America/Los_Angeles',
+    'canada': 'America/Toronto',
+    'mexico': 'America/Mexico_City'
+}
+
+# Currency of each marketplace, by the lower case strOrg
+dictMarketplaceCurrencies = {'usa': 'USD', 'canada': 'CAD', 'mexico': 'MXN'}
+
+# Alpha Vantage API key of the exchange rate downloads
+strAlphaVantageApiKey = 'DXEBI58OSLKIBOQT'
+
+# Columns of the degraded rows returned for a manual review (see MReportDegradedRows)
+liDegradedRowColumns = ['settlement id', 'order id', 'date/time', 'order city', 'order state', 'order postal']
+
+# Columns added to the report rows by CAmzB2CHelperFunc.MGeocodeAndStampPartitions
+liPreparedColumns = ['country', 'state', 'Exchange Rate']
+
+# Canonical (US report) name of the localized transaction types, keyed by the lower case report value
+dictTransactionTypes = {
+    'pedido': 'Order',
+    'reembolso': 'Refund',
+    'trasferir': 'Transfer',
+    'transferir': 'Transfer',
+    'transferencia': 'Transfer',
+    'tarifa de servicio': 'Service Fee',
+    'ajuste': 'Adjustment',
+    'tarifa de inventario de logística de amazon': 'FBA Inventory Fee',
+    'liquidaciones': 'Liquidations',
+    'ajustes de liquidaciones': 'Liquidations Adjustments',
+}
+
+# Matches 'Nov 16, 2024 12:55:04 AM PST', 'Oct 1, 2024 7:21:22 p.m. PDT' and '2 oct 2024 8:32:09 p.m. GMT-7'
+objTimestampPattern = re.compile(
+    r'^\s*(?:(?P<monthA>[^\W\d_]+)\.?\s+(?P<dayA>\d{1,2}),?|(?P<dayB>\d{1,2})\s+(?:de\s+)?(?P<monthB>[^\W\d_]+)\.?(?:\s+de)?)'
+    r'\s+(?P<year>\d{4}),?\s+(?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?'
+    r'\s*(?:(?P<meridiem>[ap])\.?\s?m\.?)?\s*(?P<zone>[a-z]{3,4})?\s*(?P<offset>[+-]\d{1,2}(?::?\d{2})?)?\s*$',
+    re.IGNORECASE
+)
+
 class CAmzB2CHelperFunc:
     """
     The CHelperFunctions class provides various static methods to handle date-related operations,
@@ -23,6 +89,7 @@ class CAmzB2CHelperFunc:
         - MConvertDateKeys
         - MGetPreferredMonthDates
         - MGetLastMonthDates
+        - MGetRateFetchStartDate
         - MGetExchangeRatesLastMonth
         - MGetLastMonthName
         - MGetLastMonthYear
@@ -32,9 +99,25 @@ class CAmzB2CHelperFunc:
         - MGetCountryAndState
         - fetch_and_store
         - MGetAllCountriesAndStates
+        - MReportDegradedRows
         - MGetExchangeRatesFinalDict
+        - MGetRateSeries
+        - MJoinExchangeRates
+        - MCoerceNumericColumns
         - MVerifySums
+        - MNormalizeTimestamps
+        - MNormalizeTransactionTypes
+        - MPartitionReportRows
+        - MProcessCsvTillPartition
         - MProcessCsvTillOrderFilter
+        - MPrepareOrderFrame
+        - MPrepareReportPartitions
+        - MGeocodeAndStampPartitions
+        - MPrepareStreamedPartitions
+        - MProcessCsvTillPartitionStreaming
+        - MSplitInPartitions
+        - MGetProcessContext
+        - MApplyInPartitions
     """
     
     @staticmethod
@@ -86,47 +169,20 @@ class CAmzB2CHelperFunc:
 
     @staticmethod
     @ensure_annotations
-    def MFillMissingDates(liExchangeRates: dict, dates: list):
+    def MFillMissingDates(liExchangeRates: dict, dates: list, dictDiagnostics = None):
         """
-        Purpose: Fill missing exchange rates in the provided dates with the last known or next known exchange rate.
+        Purpose: Fill missing exchange rates in the provided dates with the last known or next known exchange rate,
+                 at most FX_MAX_GAP_DAYS days away (see CFxGapFiller).
 
         Inputs:
-            1) liExchangeRates (list): List of tuples containing dates and their respective exchange rates.
+            1) liExchangeRates (dict): Dictionary with dates ('%d-%m-%Y') as keys and exchange rates as values.
             2) dates (list): List of dates for which exchange rates are required.
+            3) dictDiagnostics (dict, optional): Receives the filled and the still missing dates.
 
         Outputs:
             1) dict: Dictionary with dates as keys and exchange rates as values.
         """
-        # Convert the list of tuples to a dictionary for easy access
-        exchangeRatesDict = dict(liExchangeRates)
-        dictfilledExchangeRates = {}
-        
-        lastKnownRate = None
-        
-        # Pre-compute next available rates
-        nextKnownRates = {}
-        sortedDates = sorted(dates)
-        for i, dateStr in enumerate(sortedDates):
-            if dateStr in exchangeRatesDict:
-                rate = exchangeRatesDict[dateStr]
-                for j in range(i - 1, -1, -1):
-                    if sortedDates[j] not in exchangeRatesDict:
-                        nextKnownRates[sortedDates[j]] = rate
-                    else:
-                        break
-        
-        # Fill missing rates
-        for dateStr in dates:
-            if dateStr in exchangeRatesDict:  # Check if date present in exchangeRatesDict
-                lastKnownRate = exchangeRatesDict[dateStr]
-            elif dateStr in nextKnownRates:
-                lastKnownRate = nextKnownRates[dateStr]
-            if lastKnownRate is not None:
-                dictfilledExchangeRates[dateStr] = lastKnownRate
-            else:
-                print(f"No available exchange rate for {dateStr} and no previous or next data to use.")
-        
-        return dictfilledExchangeRates
+        return CFxGapFiller.MFillMissingDates(liExchangeRates, dates, '%d-%m-%Y', CFxGapFiller.MGetMaxGapDays(), dictDiagnostics)
     
     # @staticmethod
     # @ensure_annotations
@@ -287,27 +343,38 @@ class CAmzB2CHelperFunc:
         return dateList
 
 
+    @staticmethod
+    def MGetRateFetchStartDate(strStartDate):
+        """
+        Get the first date the rates of a range are fetched from: FX_MAX_GAP_DAYS (a week when
+        unlimited) before the range, so a range starting on a weekend or a holiday is filled from
+        the rate of the trading day before it rather than from the one after it.
+
+        Args:
+            strStartDate (str): Start date of the range, 'dd-mm-yyyy'.
+
+        Returns:
+            str: The first date to fetch, 'yyyy-mm-dd'.
+        """
+        iLookbackDays = CFxGapFiller.MGetMaxGapDays() or 7
+        return (datetime.strptime(strStartDate, '%d-%m-%Y') - timedelta(days=iLookbackDays)).strftime('%Y-%m-%d')
+
     @staticmethod
     @ensure_annotations
-    def MGetExchangeRatesLastMonth(apiKey, strOrg, strStartDate, strEndDate):
+    def MGetExchangeRatesLastMonth(apiKey, strOrg, strStartDate, strEndDate, objBudget = None):
         """
-        Purpose: Get the exchange rates for each day of the last month in a single API request.
+        Purpose: Get the exchange rates for each day of the last month from the FX provider (see CFxProvider),
+                 whose local rate store downloads only the dates it does not hold yet.
 
         Inputs:
             1) apiKey (str): Your Alpha Vantage API key.
             2) strOrg (str): The organization, either 'mexico', 'canada', or 'other'.
+            3) objBudget (CRequestBudget, optional): Time budget of the request, caps the read timeout of the API request.
 
         Outputs:
-            1) dict: A dictionary containing dates as keys (in the format '%d-%m-%Y') and exchange rates as values.
+            1) dict: A dictionary containing dates as keys (in the format '%d-%m-%Y') and exchange rates as values,
+                     from FX_MAX_GAP_DAYS before strStartDate to strEndDate.
         """
-        if strOrg.lower() == 'mexico':
-            url = f"https://www.alphavantage.co/query?function=FX_DAILY&from_symbol=MXN&to_symbol=USD&apikey={apiKey}"
-        elif strOrg.lower() == 'usa':
-            # For USD to USD, the exchange rate is always 1.
-            url = None
-        elif strOrg.lower() == 'canada':
-            url = f"https://www.alphavantage.co/query?function=FX_DAILY&from_symbol=CAD&to_symbol=USD&apikey={apiKey}"
-
         dictexchangeRates = {}
         lastMonthDates = CAmzB2CHelperFunc.MGetLastMonthDates(strStartDate, strEndDate)
 
@@ -316,41 +383,37 @@ class CAmzB2CHelperFunc:
             for date in lastMonthDates:
                 dictexchangeRates[date] = 1.0
             return dictexchangeRates
-        else:
-            # If not 'usa', proceed with the API request
-            response = requests.get(url)
-            data = response.json()
-
-            timeSeries = data.get("Time Series FX (Daily)", {})
 
-            for date in lastMonthDates:
-                # Convert date to the required format for the API response
-                dateObj = datetime.strptime(date, '%d-%m-%Y')
-                apiDateFormat = dateObj.strftime('%Y-%m-%d')
-                
-                if apiDateFormat in timeSeries:
-                    exchangeRate = timeSeries[apiDateFormat]['4. close']
-                    dictexchangeRates[date] = float(exchangeRate)
+        # Read the rates through the FX provider and its local store, which only downloads the dates it does not hold yet
+        strCurrency = dictMarketplaceCurrencies.get(strOrg.lower(), 'CAD')
+        dfMatrix = CFxProvider.MGetDefault().MGetMatrix(
+            [strCurrency, 'USD'],
+            CAmzB2CHelperFunc.MGetRateFetchStartDate(strStartDate),
+            datetime.strptime(strEndDate, '%d-%m-%Y').strftime('%Y-%m-%d'),
+            apiKey, objBudget
+        )
+        srRates = CFxProvider.MGetPairRates(dfMatrix, strCurrency, 'USD').dropna()
+        dictexchangeRates = dict(zip(srRates.index.strftime('%d-%m-%Y'), srRates.to_numpy().tolist()))
 
         return dictexchangeRates
 
 
 
     @staticmethod
-    @ensure_annotations
     def MGetLastMonthName(strDate):
         """
-        Get the name of the month and year from a given date in 'dd/mm/yyyy' format.
+        Get the name of the month and year from a given date.
 
         Args:
-            strDate (str): Date in the format 'dd/mm/yyyy'.
+            strDate (datetime or str): The date, a datetime (e.g. a value of the datetime64 'date/time'
+                                       column) or a string in the format 'dd-mm-yyyy'.
 
         Returns:
             tuple: A tuple containing the month (in words) and the year as separate strings.
         """
         try:
             # Convert the string date into a datetime object
-            date_obj = datetime.strptime(strDate, '%d-%m-%Y')
+            date_obj = strDate if isinstance(strDate, datetime) else datetime.strptime(strDate, '%d-%m-%Y')
             
             # Extract the month name and year as separate strings
             month_name = date_obj.strftime('%B')
@@ -376,20 +439,21 @@ class CAmzB2CHelperFunc:
 
     @staticmethod
     @ensure_annotations
-    def MCheckTaxColsAndDropZeroSumCols(df, tax_columns, tolerance):
+    def MCheckTaxColsAndDropZeroSumCols(df, tax_columns, tolerance, liKeepCols = None):
         """
         Processes a DataFrame by dropping numeric columns with a sum of zero and checks the sum of specified tax columns.
 
         Args:
             df (pd.DataFrame): The input DataFrame.
             tax_columns (list): A list of tax column names to check.
-            tolerance (float): The tolerance value for the sum check of tax columns.
+            tolerance (float): Kept for the callers, the tax columns are compared exactly in cents.
+            liKeepCols (list, optional): Numeric columns that are never dropped, even when all zero.
 
         Returns:
             bool: True if the sum of tax columns is within the tolerance, False otherwise.
         """
         # Identify numeric columns
-        numeric_cols = df.select_dtypes(include=['number']).columns
+        numeric_cols = df.select_dtypes(include=['number']).columns.difference(liKeepCols or [], sort=False)
 
         # Identify columns where all values are 0
         cols_to_drop = [col for col in numeric_cols if (df[col] == 0).all()]
@@ -402,8 +466,10 @@ class CAmzB2CHelperFunc:
         missing_columns = [col for col in tax_columns if col not in df.columns]
         if missing_columns:
             print(f"The following columns are missing and will be excluded from the check: {missing_columns}")
-        # Check the tax columns sum if > tolerance then print message and return False
-        if abs(df[tax_columns].sum().sum()) > tolerance:
+        # Check the tax columns sum to zero (in cents) if not then print message, log the offending rows and return False
+        objTaxReport = CReportReconciler.MReconcileTaxColumns(df, tax_columns)
+        if not objTaxReport.bBalanced:
+            objTaxReport.MLog()
             print("Kindly check the sum of 'product sales tax', 'shipping credits tax', 'giftwrap credits tax', 'marketplace withheld tax' columns ")
             return df, False
         print("Done and dusted.......")
@@ -412,139 +478,117 @@ class CAmzB2CHelperFunc:
 
     def MGetCountryAndStateName(state_code):
         """
-        Given a state code (e.g., 'US-CA' for California, USA), return the full country name and state name.
+        Given a state code (e.g., 'CA' for California, USA or 'ON' for Ontario, Canada), return the full country name and state name.
 
         Args:
-            state_code (str): The state code in the format 'country-subdivision' (e.g., 'US-CA').
+            state_code (str): The subdivision code of a US, Canadian or Mexican state, without the country prefix.
 
         Returns:
-            tuple: A tuple containing the country name and full state name.
+            tuple: A tuple containing the country name and full state name, or (None, None) if not found.
         """
-        try:
-            # Ensure state_code is a string
-            if not isinstance(state_code, str):
-                return None, None
-
-            # Lookup the subdivision (state) using the state code
-            subdivision = pycountry.subdivisions.lookup(f'US-{state_code}')
-
-            # Get the country code from the subdivision
-            country_code = subdivision.country_code
-
-            # Get the full country name using the country code
-            country = pycountry.countries.get(alpha_2=country_code)
-            if country is None:
-                return None, None
-            country_name = country.name
-
-            # Get the full state name
-            state_name = subdivision.name
-
-            return country_name, state_name
-
-        except LookupError:
+        # Ensure state_code is a string
+        if not isinstance(state_code, str):
             return None, None
+
+        # Dict lookup in the prebuilt subdivision index of the marketplace countries
+        return CSubdivisionIndex.MGetDefault().MLookup(state_code)
     
     @staticmethod
-    def MGetCountryAndState(city: str, state_code: str) -> tuple[str, str]:
+    def MGetCountryAndState(city: str, state_code: str, objBudget = None) -> tuple[str, str]:
         """
-        This function retrieves country and full state name using Nominatim API.
+        This function retrieves country and full state name, with the offline gazetteer or, as a fallback, the Nominatim API.
 
         Inputs :
             city: The city name (string).
             state_code: The state code (string).
+            objBudget: Time budget of the request (CRequestBudget), once spent only the offline gazetteer is used.
 
         Returns:
             A tuple with country and full state name, or (None, None) if not found.
         """
-        if city == "Ramat Hasharon":
-            return "Israel", "Ramat-Hasharon"
-        if city == "Varna":
-            return "Bulgaria", "Varna"
-        if city == "Suncheon City":
-            return "South Korea", "Jeollanam-do"
-        if city == "Kennedy Town" and state_code == 'HK Island':
-            return "Hong Kong", "Hong Kong Island"
-        if city == "Scarborouugh" and state_code == 'Ontario':
-            return "Canada", "Ontario"
-
-        if len(state_code) == 2:
-            country, state = CAmzB2CHelperFunc.MGetCountryAndStateName(state_code)
-            if country == None and state == None: # if country and state
-                # Combine city and state code for location query
-                location = f"{city}, {state_code}"
-                url = f"https://nominatim.openstreetmap.org/search?q={location}&format=json&limit=1"
-                headers = {
-                    "User-Agent": "YourApplicationName/Version (e.g., MyGeocoder/1.0)"
-                }
-                try:
-                    response = requests.get(url, headers=headers)
-                    data = response.json()
-
-                    if data and len(data) > 0:
-                        # Extract country and state from the address components (if available)
-                        place = data[0]
-                        display_name = place["display_name"]
-                        parts = display_name.split(",")
-
-                        state = parts[1].strip()
-                        country = parts[-1].strip()
-                        return country, state
-                    else:
-                        return None, None
-                except Exception as e:
-                    print(f"Error occurred during geocoding: {e}")
-                    return None, None
-            return country, state
-
-        else:
-            # Combine city and state code for location query
-            location = f"{city}, {state_code}"
-            url = f"https://nominatim.openstreetmap.org/search?q={location}&format=json&limit=1"
-            headers = {
-                "User-Agent": "YourApplicationName/Version (e.g., MyGeocoder/1.0)"
-            }
-            try:
-                response = requests.get(url, headers=headers)
-                data = response.json()
-
-                if data and len(data) > 0:
-                    # Extract country and state from the address components (if available)
-                    place = data[0]
-                    display_name = place["display_name"]
-                    parts = display_name.split(",")
-
-                    # state = parts[2].strip()
-                    country = parts[-1].strip()
-                    return country, state_code
-                else:
-                    return None, None
-            except Exception as e:
-                print(f"Error occurred during geocoding: {e}")
-                return None, None
+        # Known exceptions (data/locationOverrides.csv) before any backend
+        tOverride = CLocationOverrides.MGetDefault().MLookup(city, state_code)
+        if tOverride is not None:
+            return tOverride
+
+        # Offline gazetteer first, Nominatim only as a fallback (see CGeocoderChain.MGetDefault)
+        tResult = CGeocoderChain.MGetDefault().MResolve(city, state_code, objBudget)
+        if tResult is None:
+            return None, None
+        country, state = tResult
+        if len(state_code) != 2:
+            # Keep the state as given in the report
+            state = state_code or state
+        if state is None:
+            return None, None
+        return country, state
 
 
     @staticmethod
-    def fetch_and_store(city: str, state_code: str, results: dict[tuple[str, str], tuple[str, str]]) -> None:
+    def fetch_and_store(city: str, state_code: str, results: dict[tuple[str, str], tuple[str, str]], objBudget = None) -> None:
         """Helper function to fetch and store the country and state for a city and state code."""
-        results[(city, state_code)] = CAmzB2CHelperFunc.MGetCountryAndState(city, state_code)
+        results[(city, state_code)] = CAmzB2CHelperFunc.MGetCountryAndState(city, state_code, objBudget)
     
     @staticmethod
-    def MGetAllCountriesAndStates(df: pd.DataFrame) -> pd.DataFrame:
+    def MGetAllCountriesAndStates(df: pd.DataFrame, results: dict = None, strOrg = None, objBudget = None) -> pd.DataFrame:
         # Ensure all values are strings and handle missing values
         df['order city'] = df['order city'].fillna('').astype(str)
         df['order state'] = df['order state'].fillna('').astype(str)
-        
-        # Create a dictionary to store the results
-        results = {}
-        
-        # Get unique city and state combinations
-        unique_city_state = df[['order city', 'order state']].drop_duplicates().values.tolist()
+
+        # Create a dictionary to store the results, or reuse the one of a previous call
+        if results is None:
+            results = {}
+
+        if df.empty:
+            df['country'] = pd.Series(dtype=object)
+            df['state'] = pd.Series(dtype=object)
+            return df
+
+        # Integer code of the (city, state) pair of each row, everything below works on the unique pairs
+        arrCityCodes, arrCities = pd.factorize(df['order city'])
+        arrStateCodes, arrStateNames = pd.factorize(df['order state'])
+        arrPairCodes, arrPairKeys = pd.factorize(arrCityCodes.astype('int64') * len(arrStateNames) + arrStateCodes)
+        arrPairStateNames = arrStateNames[arrPairKeys % len(arrStateNames)]
+        liPairs = list(zip(arrCities[arrPairKeys // len(arrStateNames)], arrPairStateNames))
+
+        # Known exceptions (e.g. foreign addresses, whose postal codes could pass for US ones) win over the postal codes
+        objOverrides = CLocationOverrides.MGetDefault()
+        arrOverride = np.zeros(len(liPairs), dtype=bool)
+        for i, (city, state_code) in enumerate(liPairs):
+            tOverride = objOverrides.MLookup(city, state_code)
+            if tOverride is not None:
+                results[(city, state_code)] = tOverride
+                arrOverride[i] = True
+
+        # Resolve the whole frame by postal code, only the rows without a matching postal code are geocoded by city
+        if strOrg is not None and 'order postal' in df.columns:
+            srPostalCountry, srPostalState = CPostalIndex.MGetDefault().MLookup(df['order postal'], strOrg)
+            bPostal = srPostalCountry.notna().to_numpy() & ~arrOverride[arrPairCodes]
+
+            # Foreign postal codes can pass for US ones (e.g. Berlin 10115), so only trust a postal code whose row
+            # has no state, or a state of the same country (and, for a state code, the same state)
+            objSubdivisionIndex = CSubdivisionIndex.MGetDefault()
+            liStates = [objSubdivisionIndex.MLookup(state_code) for state_code in arrStateNames]
+            arrStateCountries = np.array([country for country, _ in liStates], dtype=object)
+            arrStateStates = np.array([state for _, state in liStates], dtype=object)
+            arrStateIsCode = np.array([objSubdivisionIndex.MIsCode(state_code) for state_code in arrStateNames], dtype=bool)
+            arrStateEmpty = np.array([state_code.strip() == '' for state_code in arrStateNames], dtype=bool)
+            arrPostalCountries = srPostalCountry.to_numpy(dtype=object)
+            bSameCountry = arrStateCountries[arrStateCodes] == arrPostalCountries
+            bSameState = ~arrStateIsCode[arrStateCodes] | (arrStateStates[arrStateCodes] == srPostalState.to_numpy(dtype=object))
+            bPostal &= arrStateEmpty[arrStateCodes] | (bSameCountry & bSameState)
+        else:
+            srPostalCountry = srPostalState = pd.Series(None, index=df.index, dtype=object)
+            bPostal = np.zeros(len(df), dtype=bool)
+
+        # Get unique city and state combinations that are not resolved yet
+        arrCityPairs = np.unique(arrPairCodes[~bPostal])
+        unique_city_state = [liPairs[i] for i in arrCityPairs if liPairs[i] not in results]
         
         # Use ThreadPoolExecutor to fetch data concurrently
         with ThreadPoolExecutor(max_workers=10) as executor:
             futures = {
-                executor.submit(CAmzB2CHelperFunc.fetch_and_store, city, state_code, results): (city, state_code)
+                executor.submit(CAmzB2CHelperFunc.fetch_and_store, city, state_code, results, objBudget): (city, state_code)
                 for city, state_code in unique_city_state
             }
             
@@ -552,68 +596,321 @@ class CAmzB2CHelperFunc:
             for future in as_completed(futures):
                 future.result()
         
-        # Map the results back to the original DataFrame
-        df['country'] = df.apply(lambda row: results[(row['order city'], row['order state'])][0], axis=1)
-        df['state'] = df.apply(lambda row: results[(row['order city'], row['order state'])][1], axis=1)
+        # Lookup arrays of the pairs geocoded by city, taken back onto the rows by their pair code
+        arrPairCountries = np.full(len(liPairs), None, dtype=object)
+        arrPairStates = np.full(len(liPairs), None, dtype=object)
+        for i in arrCityPairs:
+            arrPairCountries[i], arrPairStates[i] = results[liPairs[i]]
+        arrCountries = np.where(bPostal, srPostalCountry.to_numpy(dtype=object), arrPairCountries[arrPairCodes])
+
+        # Like MGetCountryAndState, keep the state of the postal code rows as given in the report unless it is a code
+        arrKeepState = np.array([state_code != '' and len(state_code) != 2 for state_code in arrPairStateNames], dtype=bool)
+        arrPostalStates = np.where(arrKeepState[arrPairCodes], arrPairStateNames[arrPairCodes], srPostalState.to_numpy(dtype=object))
+        arrStates = np.where(bPostal, arrPostalStates, arrPairStates[arrPairCodes])
+
+        # Country names as the output files spell them, normalized on the unique values only
+        arrCountryCodes, arrUniqueCountries = pd.factorize(arrCountries)
+        arrUniqueCountries = np.append(
+            pd.Series(arrUniqueCountries, dtype=object).str.replace("United States", "U.S.A").to_numpy(dtype=object), None
+        )
+        df['country'] = arrUniqueCountries[arrCountryCodes]
+        df['state'] = arrStates
         
         return df
+
+    @staticmethod
+    def MReportDegradedRows(df, objBudget, dictDiagnostics):
+        """
+        Record the order rows left without a country because the request budget ran out (or
+        the online geocoding failed), so the caller can return them for a manual review.
+
+        Args:
+            df (pd.DataFrame): The geocoded order frame.
+            objBudget (CRequestBudget): Time budget of the request, nothing is recorded without it.
+            dictDiagnostics (dict): Receives the rows under 'degradedRows', as a list of dicts.
+        """
+        if objBudget is None or dictDiagnostics is None or df is None or not objBudget.setDegradedPairs:
+            return
+        bDegraded = df['country'].isna().to_numpy() & np.array(
+            [objBudget.MIsDegraded(city, state_code) for city, state_code in zip(df['order city'], df['order state'])], dtype=bool
+        )
+        if not bDegraded.any():
+            return
+        liColumns = [col for col in liDegradedRowColumns if col in df.columns]
+        liRows = df.loc[bDegraded, liColumns].astype(object).where(df.loc[bDegraded, liColumns].notna(), None).to_dict('records')
+        dictDiagnostics.setdefault('degradedRows', []).extend(liRows)
+        objLogger.logInfo(f'{len(liRows)} order rows could not be geocoded within the request budget')
     
 
     @staticmethod
-    def MGetExchangeRatesFinalDict(strOrg, strStartDate, strEndDate):
+    def MGetExchangeRatesFinalDict(strOrg, strStartDate, strEndDate, objBudget = None, dictDiagnostics = None):
         """
         Get the final dictionary of exchange rates for the previous month, filling in any missing dates.
+        With a request budget (CRequestBudget), the rate request may only use the time it allows.
+        The dicts are kept in the process wide CFxRateMemo, so back to back requests of a month download it once.
+        dictDiagnostics (optional) receives the dates still without a rate under 'exchangeRateGaps'.
 
         Outputs:
             dict: A dictionary with dates as keys and exchange rates as values, including filled missing dates.
         """
         # Get the previous months dates
         liLastMonthDates = CAmzB2CHelperFunc.MGetLastMonthDates(strStartDate, strEndDate)
-        # Get the exchange rates
-        dictExchangeRates = CAmzB2CHelperFunc.MGetExchangeRatesLastMonth('DXEBI58OSLKIBOQT', strOrg, strStartDate, strEndDate)
-        # Fill the missing dates (Saturday-Sunday) in the exchange rate data with the previous friday's ex rate
-        dictExchangeRates = CAmzB2CHelperFunc.MFillMissingDates(dictExchangeRates, liLastMonthDates)
+
+        def fnLoad():
+            # Get the exchange rates
+            dictExchangeRates = CAmzB2CHelperFunc.MGetExchangeRatesLastMonth(strAlphaVantageApiKey, strOrg, strStartDate, strEndDate, objBudget)
+            # Fill the missing dates (Saturday-Sunday) in the exchange rate data with the previous friday's ex rate
+            dictGaps = {}
+            dictExchangeRates = CAmzB2CHelperFunc.MFillMissingDates(dictExchangeRates, liLastMonthDates, dictGaps)
+            # Keep only complete dicts, so the next request retries the dates the rate source did not return
+            return dictExchangeRates, not dictGaps['missingDates']
+
+        # Reuse the rates of the same range (or of a wider one) loaded by an earlier request of this process
+        dictExchangeRates = CFxRateMemo.MGetDefault().MGet(strOrg, strStartDate, strEndDate, fnLoad)
+        liMissingDates = [date for date in liLastMonthDates if date not in dictExchangeRates]
+        if dictDiagnostics is not None and liMissingDates:
+            dictDiagnostics['exchangeRateGaps'] = {'missingDates': liMissingDates}
 
         return dictExchangeRates
 
     @staticmethod
-    @ensure_annotations
-    def MVerifySums(df : pd.DataFrame, cols_to_sum : list, tolerance : float = 1e-10):
+    def MGetRateSeries(dictExchangeRates):
         """
-        Verify if the sum of specified columns matches the sum of the 'total' column within a given tolerance.
+        Turn an exchange rate dict of MGetExchangeRatesFinalDict into a rate series indexed by
+        datetime64 day, so the rates are joined onto the rows by value instead of by text.
 
         Args:
-            df (pd.DataFrame): The DataFrame containing the data.
-            cols_to_sum (list): List of column names to sum.
-            tolerance (float): The tolerance level for comparison. Default is 1e-10.
+            dictExchangeRates (dict): 'dd-mm-yyyy' date -> rate.
 
         Returns:
-            bool: True if the sums match within the given tolerance, False otherwise.
+            pd.Series: The float rates, indexed by the sorted, unique dates.
         """
-        if not df.empty:
-            # Convert specified columns to numeric, coercing errors to NaN
-            df[cols_to_sum] = df[cols_to_sum].apply(pd.to_numeric, errors='coerce')
+        srRates = pd.Series(list(dictExchangeRates.values()), index=pd.to_datetime(list(dictExchangeRates.keys()), format='%d-%m-%Y'), dtype='float64')
+        return srRates[~srRates.index.duplicated()].sort_index()
 
-            # Calculate the sum of all specified columns across all rows
-            total_sum_of_columns = df[cols_to_sum].sum().sum()
+    @staticmethod
+    def MJoinExchangeRates(srDates, srRates):
+        """
+        Look up the rate of each row date in one vectorized pass. The rates of
+        MGetExchangeRatesFinalDict are already filled for every day of the range, so an exact
+        join is enough; dates outside of the range get NaN.
 
-            # Convert 'total' column to numeric, coercing errors to NaN
-            df['total'] = df['total'].apply(pd.to_numeric, errors='coerce')
+        Args:
+            srDates (pd.Series): The datetime64 'date/time' column.
+            srRates (pd.Series): The rates of MGetRateSeries.
 
-            # Calculate the sum of the 'total' column
-            total_sum_of_total_col = df['total'].sum().sum()
+        Returns:
+            np.ndarray: The rate of each row.
+        """
+        arrPositions = srRates.index.get_indexer(srDates)
+        return np.where(arrPositions >= 0, srRates.to_numpy()[arrPositions], np.nan)
 
-            # Verify if the difference between the sums is within the tolerance
-            return abs(total_sum_of_columns - total_sum_of_total_col) < tolerance
+    @staticmethod
+    def MCoerceNumericColumns(df, liColumns):
+        """
+        Convert the given columns to numeric in place, coercing errors to NaN.
+        Columns that already have a numeric dtype are left untouched.
+
+        Args:
+            df (pd.DataFrame): The DataFrame containing the data.
+            liColumns (list): List of column names to convert.
+        """
+        liNonNumeric = [col for col in liColumns if not pd.api.types.is_numeric_dtype(df[col])]
+        if liNonNumeric:
+            df[liNonNumeric] = df[liNonNumeric].apply(pd.to_numeric, errors='coerce')
+
+    @staticmethod
+    @ensure_annotations
+    def MVerifySums(df : pd.DataFrame, cols_to_sum : list, tolerance : float = 1e-10, dictDiagnostics = None):
+        """
+        Verify that on every row the sum of the specified columns matches the 'total' column.
+        The amounts are compared exactly in cents (see CReportReconciler), so the result does not
+        depend on float accumulation error, and the offending rows are logged.
+
+        Args:
+            df (pd.DataFrame): The DataFrame containing the data.
+            cols_to_sum (list): List of column names to sum.
+            tolerance (float): Kept for the callers, the comparison is exact in cents.
+            dictDiagnostics (dict, optional): Receives the reconciliation report under 'reconciliation' when the check fails.
+
+        Returns:
+            bool: True if every row adds up, False otherwise.
+        """
+        if not df.empty:
+            # Money columns are numeric from read time (see CReportSchema); only coerce
+            # the columns of a frame that was read some other way
+            CAmzB2CHelperFunc.MCoerceNumericColumns(df, cols_to_sum + ['total'])
+
+            # Verify sum(cols_to_sum) == total on every row, in int64 cents
+            objReport = CReportReconciler.MReconcileTotals(df, cols_to_sum)
+            if not objReport.bBalanced:
+                objReport.MLog()
+                if dictDiagnostics is not None:
+                    dictDiagnostics['reconciliation'] = objReport.MToDict()
+            return objReport.bBalanced
         else:
             print("No data available.")
             # If the DataFrame is empty, return False
     
     
-    def MProcessCsvTillOrderFilter(strDateRangeFilePath, strDateColName, strSettleIdColName, strOrderIdColName, strOrg, cols_to_sum):
+    @staticmethod
+    def MNormalizeTimestamps(srTimestamps : pd.Series, strOrg : str, bLocalDate : bool = False) -> pd.Series:
         """
-        Process the CSV file by performing various operations like skipping rows, 
-        formatting dates, converting columns to strings, and filtering data.
+        Parse the 'date/time' column of the US, Canada and Mexico report formats in a single vectorized pass.
+        Handles 'AM/PM' and 'a.m./p.m.', English and Spanish month abbreviations and the 'PST/PDT' or
+        'GMT-7' style time zone suffixes.
+
+        Args:
+            srTimestamps (pd.Series): The raw timestamp strings of the report.
+            strOrg (str): The organization, either 'mexico', 'canada' or 'usa'.
+            bLocalDate (bool): If True, convert the timestamps to the local time of the marketplace.
+                               If False (default), keep the wall-clock time printed in the report.
+
+        Returns:
+            pd.Series: A naive datetime64 series, NaT where the value could not be parsed.
+        """
+        # Split every timestamp into its parts with one regex pass
+        dfParts = srTimestamps.astype('string').str.extract(objTimestampPattern)
+
+        # Month and day can appear in either order ('Nov 16, 2024' or '2 oct 2024')
+        srMonth = dfParts['monthA'].fillna(dfParts['monthB']).str.lower().map(dictMonthNumbers)
+        srDay = pd.to_numeric(dfParts['dayA'].fillna(dfParts['dayB']))
+
+        # Convert the 12 hour clock to a 24 hour clock where a meridiem is present
+        srHour = pd.to_numeric(dfParts['hour'])
+        srMeridiem = dfParts['meridiem'].str.lower()
+        srHour = srHour.where(srMeridiem.isna(), srHour % 12 + (srMeridiem == 'p') * 12)
+
+        dfComponents = pd.DataFrame({
+            'year': pd.to_numeric(dfParts['year']),
+            'month': srMonth,
+            'day': srDay,
+            'hour': srHour,
+            'minute': pd.to_numeric(dfParts['minute']),
+            'second': pd.to_numeric(dfParts['second']).fillna(0),
+        }).astype('float64')
+
+        # Assemble the datetimes of the rows that matched, the others stay NaT
+        bMatched = dfComponents.notna().all(axis=1)
+        srParsed = pd.Series(pd.NaT, index=srTimestamps.index, dtype='datetime64[ns]')
+        if bMatched.any():
+            srParsed[bMatched] = pd.to_datetime(dfComponents[bMatched].astype('int64'), errors='coerce')
+
+        iFailed = int((srParsed.isna() & srTimestamps.notna()).sum())
+        if iFailed:
+            objLogger.logError(f'Failed to parse {iFailed} timestamps, e.g. {srTimestamps[srParsed.isna() & srTimestamps.notna()].iloc[0]!r}')
+
+        if bLocalDate:
+            # UTC offset from the zone abbreviation plus an explicit 'GMT-7' style offset
+            srOffset = dfParts['zone'].str.upper().map(dictTimeZoneOffsets).fillna(0)
+            srExtra = dfParts['offset'].str.extract(r'(?P<sign>[+-])(?P<hours>\d{1,2}):?(?P<minutes>\d{2})?')
+            srExtraHours = pd.to_numeric(srExtra['hours']).fillna(0) + pd.to_numeric(srExtra['minutes']).fillna(0) / 60
+            srOffset = srOffset + srExtraHours.where(srExtra['sign'] != '-', -srExtraHours)
+
+            # Shift to UTC, then to the local time of the marketplace
+            srUtc = (srParsed - pd.to_timedelta(srOffset, unit='h')).dt.tz_localize('UTC')
+            strTimeZone = dictMarketplaceTimeZones.get(strOrg.lower(), 'UTC')
+            srParsed = srUtc.dt.tz_convert(strTimeZone).dt.tz_localize(None)
+
+        return srParsed
+
+
+    @staticmethod
+    def MNormalizeTransactionTypes(srType):
+        """
+        Translate the localized transaction types of the 'type' column (e.g. 'Pedido', 'Reembolso',
+        'Trasferir' in the Mexico report) to their canonical names ('Order', 'Refund', 'Transfer').
+        Only the categories are translated, not every row.
+
+        Args:
+            srType (pd.Series): The 'type' column, read as 'category'.
+
+        Returns:
+            pd.Series: The 'type' column with canonical categories.
+        """
+        srType = srType.astype('category')
+        dictRename = {strType: dictTransactionTypes.get(str(strType).strip().lower(), strType) for strType in srType.cat.categories}
+        # Two localized names can map to the same type, so merge the categories instead of renaming them
+        return srType.map(dictRename).astype('category')
+
+
+    @staticmethod
+    def MNormalizeReportFrame(df, strDateColName, strOrg, bLocalDate = False):
+        """
+        Normalize a freshly read report frame (or one chunk of it): rename the localized
+        columns, coerce the numeric columns, parse the timestamps to datetime64 days and
+        translate the transaction types.
+        The dates are only formatted as text when the output files are written.
+
+        Args:
+            df (pd.DataFrame): The raw report rows.
+            strDateColName (str): The name of the date column.
+            strOrg (str): The organization name.
+            bLocalDate (bool): If True, date the rows in the local time of the marketplace (see MNormalizeTimestamps).
+
+        Returns:
+            pd.DataFrame: The normalized DataFrame.
+        """
+        # Rename the localized headers (Mexico, Canada) to the canonical column names
+        df.rename(columns=CReportSchema.MGetRenameMap(strOrg), inplace=True)
+
+        # A numeric column with a malformed cell is read as text, coerce it once (the bad cells become NaN,
+        # and their rows show up in the sum verification instead of failing the read)
+        liNumericColumns = [col for col in CReportSchema.MGetNumericColumns() if col in df.columns]
+        for col in liNumericColumns:
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = df[col].str.replace(',', '', regex=False)
+        CAmzB2CHelperFunc.MCoerceNumericColumns(df, liNumericColumns)
+        if 'quantity' in df.columns:
+            # Whole numbers only, as a nullable integer
+            srQuantity = df['quantity'].astype('float64')
+            df['quantity'] = srQuantity.where(srQuantity % 1 == 0).astype('Int64')
+
+        # Parse the localized timestamps of the date column in one vectorized pass
+        df[strDateColName] = CAmzB2CHelperFunc.MNormalizeTimestamps(df[strDateColName], strOrg, bLocalDate)
+        
+        # Translate the localized transaction types ('Pedido' -> 'Order', ...)
+        df['type'] = CAmzB2CHelperFunc.MNormalizeTransactionTypes(df['type'])
+        
+        # Keep the day of the timestamps, as datetime64 so the dates sort and join by value
+        df[strDateColName] = df[strDateColName].dt.normalize()
+
+        return df
+
+
+    @staticmethod
+    def MPartitionReportRows(df, strSettleIdColName, strOrderIdColName):
+        """
+        Create the 'Invoice Number' column and split the report rows by transaction type in a
+        single pass, using the group indices of the 'type' column rather than one boolean mask
+        per type. The rows keep their report order and index within each partition.
+
+        Args:
+            df (pd.DataFrame): The normalized and verified report rows.
+            strSettleIdColName (str): The name of the settle ID column.
+            strOrderIdColName (str): The name of the order ID column.
+
+        Returns:
+            dict: Transaction type ('Order', 'Refund', 'Transfer', ...) -> DataFrame of its rows.
+                  The 'Order' partition is always present, possibly empty.
+        """
+        # The ID columns are read as strings (see CReportSchema), so no cast is needed here
+        # Create ‘Invoice Number’ (Settlement ID - Order ID)
+        # Combine strSettleIdColName and strOrderIdColName columns with '-' separator and create a new column 'Invoice Number'
+        df['Invoice Number'] = df[strSettleIdColName] + '-' + df[strOrderIdColName]
+
+        # Positions of the rows of every type, computed in one groupby pass
+        dictIndices = df.groupby('type', observed=True, sort=False).indices
+        dictPartitions = {str(strType): df.take(liPositions) for strType, liPositions in dictIndices.items()}
+
+        # The builders expect an order frame even when the report has no 'Order' rows
+        dictPartitions.setdefault('Order', df.iloc[0:0])
+        return dictPartitions
+
+
+    def MProcessCsvTillPartition(strDateRangeFilePath, strDateColName, strSettleIdColName, strOrderIdColName, strOrg, cols_to_sum, dictDiagnostics = None, bLocalDate = False):
+        """
+        Read the CSV file once, normalize and verify it, and split its rows by transaction type.
 
         Args:
             strDateRangeFilePath (str): The file path to the CSV file.
@@ -622,87 +919,456 @@ class CAmzB2CHelperFunc:
             strOrderIdColName (str): The name of the order ID column.
             strOrg (str): The organization name.
             cols_to_sum (list): List of column names to sum.
+            dictDiagnostics (dict, optional): Receives the reconciliation report when the sums do not match.
+            bLocalDate (bool): If True, date the rows in the local time of the marketplace (see MNormalizeTimestamps).
 
         Returns:
-            pd.DataFrame: The processed DataFrame.
+            dict: Transaction type -> DataFrame of its rows (see MPartitionReportRows),
+                  or None if the sums of the report do not match.
         """
-        # Check Organization (Mexico, Canada, USA)
-        if strOrg.lower() == 'mexico':
-            # Custom date parser function
-            # Function to clean and parse dates
-            def custom_date_parser(date_str):
-                try:
-                    # Replace localized Spanish abbreviations (if present)
-                    date_str = date_str.replace("a.m.", "AM").replace("p.m.", "PM")
-                    # Parse the date using a fixed format
-                    return datetime.strptime(date_str, "%d %b %Y %I:%M:%S %p %Z%z")
-                except Exception as e:
-                    print(f"Failed to parse date: {date_str}. Error: {e}")
-                    return pd.NaT
-            df = pd.read_csv(strDateRangeFilePath, skiprows=7, parse_dates=['fecha/hora'], date_parser = custom_date_parser)
-
-            df.rename(columns={'fecha/hora':'date/time', 'Id. de liquidación':'settlement id', 'tipo':'type', 'Id. del pedido':'order id', 'sku':'sku', 'descripción':'description', 'cantidad':'quantity', 'marketplace':'marketplace', 'cumplimiento':'fulfillment', 'ciudad del pedido':'order city', 'estado del pedido':'order state', 'código postal del pedido':'order postal', 'modelo de recaudación de impuestos':'tax collection model', 'ventas de productos':'product sales', 'impuesto de ventas de productos':'product sales tax', 'créditos de envío':'shipping credits', 'impuesto de abono de envío':'shipping credits tax', 'créditos por envoltorio de regalo':'gift wrap credits', 'impuesto de créditos de envoltura':'giftwrap credits tax', 'Tarifa reglamentaria':'Regulatory Fee', 'Impuesto sobre tarifa reglamentaria':'Tax On Regulatory Fee', 'descuentos promocionales':'promotional rebates', 'impuesto de reembolsos promocionales':'promotional rebates tax', 'impuesto de retenciones en la plataforma':'marketplace withheld tax', 'tarifas de venta':'selling fees', 'tarifas fba':'fba fees', 'tarifas de otra transacción':'other transaction fees', 'otro':'other', 'total':'total'}, inplace=True)
-        else:
-            # Read the CSV file, skipping the first 7 rows
-            df = pd.read_csv(strDateRangeFilePath, skiprows=7, parse_dates=[strDateColName])
-        
-        if strOrg.lower() == 'canada':
-            df.rename(columns = {'gift wrap credits tax' : 'giftwrap credits tax', 'Regulatory fee' : 'Regulatory Fee', 'Tax on regulatory fee' : 'Tax On Regulatory Fee'}, inplace = True)
-            # Check if the column is of string type before replacing text
-            if pd.api.types.is_string_dtype(df[strDateColName]):
-                # Preprocess the date column to replace 'a.m.' and 'p.m.' and remove the time zone
-                df[strDateColName] = df[strDateColName].str.replace("a.m.", "AM").str.replace("p.m.", "PM").str.replace(" PDT", "").str.replace(" PST", "").str.strip()
-                try:
-                    # Convert the cleaned column to datetime
-                    df[strDateColName] = pd.to_datetime(df[strDateColName], format="%b %d, %Y %I:%M:%S %p")
-                except:
-                    print("not a %b %d, %Y %I:%M:%S %p format")
-                    pass
-            elif pd.api.types.is_datetime64_any_dtype(df[strDateColName]):
-                pass
-            else:
-                print("Invalid date format in column: ", strDateColName)
-        
-        if strOrg.lower() == 'mexico':
-            df['type'] = df['type'].str.replace('Pedido', 'Order')
-            # Remove commas and convert to float
-            try:
-                df['product sales'] = df['product sales'].str.replace(',', '').astype(float)
-                df['total'] = df['total'].str.replace(',', '').astype(float)
-            except:
-                df['product sales'] = df['product sales'].astype(float)
-                df['total'] = df['total'].str.replace(',', '').astype(float)
-        
-        # Format date column to ‘dd-mm-yyyy’
-        # Format the strDateColName column to dd-mm-yyyy format
-        df[strDateColName] = df[strDateColName].dt.strftime('%d-%m-%Y')
+        # Read the CSV file, skipping the first 7 rows, with the column schema of the marketplace
+        df = pd.read_csv(strDateRangeFilePath, skiprows=7, **CReportSchema.MGetReadOptions(strOrg))
+        df = CAmzB2CHelperFunc.MNormalizeReportFrame(df, strDateColName, strOrg, bLocalDate)
 
         # Verify Sums If Other cols - total col = 0?
         # Calculate the sum of all specified columns(cols_to_sum) - total column
-        isZero = CAmzB2CHelperFunc.MVerifySums(df, cols_to_sum)
+        isZero = CAmzB2CHelperFunc.MVerifySums(df, cols_to_sum, dictDiagnostics = dictDiagnostics)
         objLogger.logInfo('Verifying the sum of all specified columns(cols_to_sum) - total column sum is zero')
-        # Check if tax columns sum is zero
-        tolerance = 1e-10
         if isZero == True:
-            # Convert columns to string
-            # Convert strSettleIdColName and 'order id' columns to strings
-            df[strSettleIdColName] = df[strSettleIdColName].astype(str)
-            df[strOrderIdColName] = df[strOrderIdColName].astype(str)
-            
-            # Create ‘Invoice Number’ (Settlement ID - Order ID)
-            # Combine strSettleIdColName and strOrderIdColName columns with '-' separator and create a new column 'Invoice Number'
-            df['Invoice Number'] = df[strSettleIdColName] + '-' + df[strOrderIdColName]
+            # Return the rows of every transaction type
+            return CAmzB2CHelperFunc.MPartitionReportRows(df, strSettleIdColName, strOrderIdColName)
+        else:
+            objLogger.logInfo("Error: The sum of the specified columns does not match the sum of the 'total' column.")
+            print("Error: The sum of the specified columns does not match the sum of the 'total' column.")
+            return None
 
-            # Filter rows where ‘type’ column value = ‘Order’
-            # Filter the DataFrame by keeping only the rows where the 'type' column has the value 'Order'
-            df = df[df['type'] == 'Order']
 
-            # Return processed dataframe
-            return df
-        else:
+    def MProcessCsvTillOrderFilter(strDateRangeFilePath, strDateColName, strSettleIdColName, strOrderIdColName, strOrg, cols_to_sum):
+        """
+        Process the CSV file by performing various operations like skipping rows,
+        formatting dates, converting columns to strings, and filtering data.
+
+        Args:
+            strDateRangeFilePath (str): The file path to the CSV file.
+            strDateColName (str): The name of the date column.
+            strSettleIdColName (str): The name of the settle ID column.
+            strOrderIdColName (str): The name of the order ID column.
+            strOrg (str): The organization name.
+            cols_to_sum (list): List of column names to sum.
+
+        Returns:
+            pd.DataFrame: The processed DataFrame.
+        """
+        dictPartitions = CAmzB2CHelperFunc.MProcessCsvTillPartition(strDateRangeFilePath, strDateColName, strSettleIdColName, strOrderIdColName, strOrg, cols_to_sum)
+        return dictPartitions['Order'] if dictPartitions is not None else None
+
+
+    @staticmethod
+    def MIterPartitionChunks(strDateRangeFilePath, strDateColName, strSettleIdColName, strOrderIdColName, strOrg, objAccumulator, iChunkSize = 50000, bLocalDate = False):
+        """
+        Streaming counterpart of MProcessCsvTillPartition. Reads the report in chunks of
+        iChunkSize rows and yields the rows of each chunk split by transaction type as soon
+        as it is read, so the CSV parser never holds the whole report at once.
+
+        The sums are not known until the last chunk has been read, so they are collected in
+        objAccumulator and the caller must check objAccumulator.MIsBalanced() once the
+        generator is exhausted before using the yielded rows, or reconcile the report in a
+        first pass (see MProcessCsvTillPartitionStreaming).
+
+        Args:
+            strDateRangeFilePath (str): The file path to the CSV file.
+            strDateColName (str): The name of the date column.
+            strSettleIdColName (str): The name of the settle ID column.
+            strOrderIdColName (str): The name of the order ID column.
+            strOrg (str): The organization name.
+            objAccumulator (CReportAccumulator): Collects the running sums of the report.
+            iChunkSize (int): Number of report rows read at a time.
+            bLocalDate (bool): If True, date the rows in the local time of the marketplace (see MNormalizeTimestamps).
+
+        Yields:
+            dict: Transaction type -> DataFrame of the rows of each chunk.
+        """
+        with pd.read_csv(strDateRangeFilePath, skiprows=7, chunksize=iChunkSize, **CReportSchema.MGetReadOptions(strOrg)) as objReader:
+            for dfChunk in objReader:
+                dfChunk = CAmzB2CHelperFunc.MNormalizeReportFrame(dfChunk, strDateColName, strOrg, bLocalDate)
+                objAccumulator.MUpdate(dfChunk)
+
+                dictPartitions = CAmzB2CHelperFunc.MPartitionReportRows(dfChunk, strSettleIdColName, strOrderIdColName)
+                objAccumulator.MUpdateOrders(dictPartitions['Order'])
+                yield dictPartitions
+
+
+    @staticmethod
+    def MPrepareOrderFrame(strDateRangeFilePath, strOrg, cols_to_sum, dictExchangeRates, iChunkSize = None, tax_columns = None, bUseCache = True, objBudget = None, bLocalDate = False):
+        """
+        Shared preprocessing stage for the sales order, invoice and credit note builders.
+        Reads and reconciles the date range report once, geocodes every order row once
+        and stamps the exchange rate, so the three builders do not repeat that work.
+
+        Args:
+            strDateRangeFilePath (str): The file path to the CSV file (Date Range).
+            strOrg (str): The organization name.
+            cols_to_sum (list): List of column names to sum.
+            dictExchangeRates (dict): A dictionary mapping dates to exchange rates.
+            iChunkSize (int, optional): If set, stream the report in chunks of this many rows
+                                        instead of loading it in one go.
+            tax_columns (list, optional): Tax columns whose sum is tracked while streaming.
+            bUseCache (bool): If True, reuse the parsed report of an earlier upload of the same file
+                              from the local report cache (see CReportCache).
+            objBudget (CRequestBudget, optional): Time budget of the request, once spent the order rows
+                                                  are geocoded offline only.
+            bLocalDate (bool): If True, date the rows in the local time of the marketplace instead of
+                               the wall-clock time printed in the report (see MNormalizeTimestamps).
+
+        Returns:
+            pd.DataFrame: The order frame with 'country', 'state' and 'Exchange Rate' columns,
+                          or None if the sums of the report do not match.
+        """
+        dictPartitions = CAmzB2CHelperFunc.MPrepareReportPartitions(strDateRangeFilePath, strOrg, cols_to_sum, dictExchangeRates, iChunkSize, tax_columns, bUseCache, objBudget = objBudget, liPartitionTypes = ['Order'], bLocalDate = bLocalDate)
+        return dictPartitions['Order'] if dictPartitions is not None else None
+
+
+    @staticmethod
+    def MPrepareReportPartitions(strDateRangeFilePath, strOrg, cols_to_sum, dictExchangeRates, iChunkSize = None, tax_columns = None, bUseCache = True, dictDiagnostics = None, objBudget = None, liPartitionTypes = None, bLocalDate = False):
+        """
+        Same as MPrepareOrderFrame, but returns the rows of every transaction type so the
+        callers can pick the partitions they need ('Order', 'Refund', 'Transfer', ...)
+        without reading the report again. The 'Order' partition is geocoded, and every
+        partition is stamped with the exchange rate.
+
+        Args:
+            See MPrepareOrderFrame.
+            dictDiagnostics (dict, optional): Receives the reconciliation report under 'reconciliation'
+                                              when the sums of the report do not match, and the order rows
+                                              left unresolved by a spent objBudget under 'degradedRows'.
+            objBudget (CRequestBudget, optional): Time budget of the request, limits the online geocoding.
+            liPartitionTypes (list, optional): The transaction types to return, all of them by default. The
+                                               'Order' rows are always returned. A streamed report only keeps
+                                               the prepared rows of these types in memory (see MPrepareStreamedPartitions).
+            bLocalDate (bool): See MPrepareOrderFrame.
+
+        Returns:
+            dict: Transaction type -> DataFrame of its rows, or None if the sums of the report do not match.
+        """
+        if liPartitionTypes is not None:
+            liPartitionTypes = sorted(set(liPartitionTypes) | {'Order'})
+
+        # Start from the cached parsed report when the same file was uploaded before, or from
+        # the cached rows of the requested types when it was streamed for them
+        dictPartitions = None
+        objReportCache = CReportCache.MGetDefault() if bUseCache else None
+        strCacheKey = None
+        if objReportCache is not None:
+            strCacheKey = objReportCache.MGetKey(strDateRangeFilePath, strOrg, cols_to_sum, bLocalDate)
+            dictPartitions = objReportCache.MLoad(strCacheKey)
+            if dictPartitions is None and liPartitionTypes is not None:
+                dictPartitions = objReportCache.MLoad(CReportCache.MGetPartialKey(strCacheKey, liPartitionTypes))
+
+        if dictPartitions is None and iChunkSize:
+            # Read the large reports in chunks, each chunk of the requested rows is geocoded and stamped as it is read
+            dictPartitions = CAmzB2CHelperFunc.MPrepareStreamedPartitions(strDateRangeFilePath, strOrg, cols_to_sum, dictExchangeRates, iChunkSize, tax_columns or [], dictDiagnostics, objBudget, liPartitionTypes, bLocalDate)
+            if dictPartitions is not None and objReportCache is not None:
+                # Only the requested types were kept, so they are not an entry of the whole report
+                if liPartitionTypes is not None:
+                    strCacheKey = CReportCache.MGetPartialKey(strCacheKey, liPartitionTypes)
+                # The entry holds the prepared rows as they are, their prepared columns are dropped on load
+                objReportCache.MStore(strCacheKey, dictPartitions)
+            return dictPartitions
+
+        if dictPartitions is None:
+            # Read the report, verify the sums and split the rows by transaction type
+            dictPartitions = CAmzB2CHelperFunc.MProcessCsvTillPartition(strDateRangeFilePath, 'date/time', 'settlement id', 'order id', strOrg = strOrg, cols_to_sum = cols_to_sum, dictDiagnostics = dictDiagnostics, bLocalDate = bLocalDate)
+            if dictPartitions is None:
+                return None
+            if objReportCache is not None:
+                objReportCache.MStore(strCacheKey, dictPartitions)
+
+        # Work on copies of the requested partitions, so the cached ones stay untouched
+        dictPartitions = {
+            strType: df.drop(columns=liPreparedColumns, errors='ignore') for strType, df in dictPartitions.items()
+            if liPartitionTypes is None or strType in liPartitionTypes
+        }
+        srRates = CAmzB2CHelperFunc.MGetRateSeries(dictExchangeRates) if dictExchangeRates else None
+        return CAmzB2CHelperFunc.MGeocodeAndStampPartitions(dictPartitions, strOrg, srRates, objBudget, dictDiagnostics)
+
+
+    @staticmethod
+    def MGeocodeAndStampPartitions(dictPartitions, strOrg, srRates, objBudget = None, dictDiagnostics = None, dictResults = None):
+        """
+        Geocode the 'Order' rows and stamp the exchange rate of every row, in place.
+
+        Args:
+            dictPartitions (dict): Transaction type -> DataFrame of its rows, of the whole report or of one chunk.
+            strOrg (str): The organization name.
+            srRates (pd.Series): The exchange rates by date (see MGetRateSeries), or None to leave the rows unpriced.
+            objBudget (CRequestBudget, optional): Time budget of the request, limits the online geocoding.
+            dictDiagnostics (dict, optional): Receives the order rows left unresolved by a spent objBudget under 'degradedRows'.
+            dictResults (dict, optional): (city, state code) -> (country, state) of the pairs geocoded so far,
+                                          shared by the chunks of a report so each pair is resolved once.
+
+        Returns:
+            dict: dictPartitions.
+        """
+        # Get states and country once for all the order rows
+        dictPartitions['Order'] = CAmzB2CHelperFunc.MGetAllCountriesAndStates(dictPartitions['Order'], results=dictResults, strOrg=strOrg, objBudget=objBudget)
+        objLogger.logInfo('Added country and state columns to the shared order frame')
+        CAmzB2CHelperFunc.MReportDegradedRows(dictPartitions['Order'], objBudget, dictDiagnostics)
+
+        # Stamp the exchange rate of each row date
+        if srRates is not None:
+            for df in dictPartitions.values():
+                df['Exchange Rate'] = CAmzB2CHelperFunc.MJoinExchangeRates(df['date/time'], srRates)
+            objLogger.logInfo('Mapped the exchange rate data to the report partitions')
+
+        return dictPartitions
+
+
+    @staticmethod
+    def MPrepareStreamedPartitions(strDateRangeFilePath, strOrg, cols_to_sum, dictExchangeRates, iChunkSize, tax_columns, dictDiagnostics = None, objBudget = None, liPartitionTypes = None, bLocalDate = False):
+        """
+        Streaming counterpart of the preparation in MPrepareReportPartitions. The filtered chunks of
+        MProcessCsvTillPartitionStreaming are geocoded and stamped one at a time, and only these prepared
+        rows are kept: the raw chunks and the rows of the other transaction types are released as soon
+        as the next chunk is read. The builders sort the lines and drop the all-zero columns over the
+        whole output, so the prepared rows are concatenated once the last chunk is done.
+
+        Args:
+            See MPrepareReportPartitions.
+
+        Returns:
+            dict: Transaction type -> DataFrame of its prepared rows, or None if the sums of the report do not match.
+        """
+        objChunks = CAmzB2CHelperFunc.MProcessCsvTillPartitionStreaming(strDateRangeFilePath, strOrg, cols_to_sum, iChunkSize, tax_columns, dictDiagnostics, liPartitionTypes, bLocalDate)
+        if objChunks is None:
+            return None
+
+        srRates = CAmzB2CHelperFunc.MGetRateSeries(dictExchangeRates) if dictExchangeRates else None
+        dictResults = {}
+        dictChunks = {}
+        for dictPartitions in objChunks:
+            dictPartitions = CAmzB2CHelperFunc.MGeocodeAndStampPartitions(dictPartitions, strOrg, srRates, objBudget, dictDiagnostics, dictResults)
+            for strType, df in dictPartitions.items():
+                dictChunks.setdefault(strType, []).append(df)
+
+        dictPartitions = {}
+        for strType in list(dictChunks):
+            # Release the chunks of a type as soon as they are concatenated
+            liChunks = dictChunks.pop(strType)
+            # Chunks with different categories are concatenated as object columns, so restore the categories
+            # of the columns the preparation left as categories
+            liCategoryCols = [col for col in liChunks[0].columns if isinstance(liChunks[0][col].dtype, pd.CategoricalDtype)]
+            df = pd.concat(liChunks)
+            del liChunks
+            for col in liCategoryCols:
+                df[col] = df[col].astype('category')
+            dictPartitions[strType] = df
+        return dictPartitions
+
+
+    @staticmethod
+    def MProcessCsvTillPartitionStreaming(strDateRangeFilePath, strOrg, cols_to_sum, iChunkSize, tax_columns, dictDiagnostics = None, liPartitionTypes = None, bLocalDate = False):
+        """
+        Streaming counterpart of MProcessCsvTillPartition for the large reports. The report is read
+        twice in chunks of iChunkSize rows. The first pass only reconciles the chunks in a
+        CReportAccumulator and keeps none of them. When the sums match, the second pass yields the
+        rows of each chunk, split by transaction type and filtered down to liPartitionTypes, for the
+        caller to process before the next chunk is read. Nothing is yielded, so nothing is geocoded
+        or priced, before the sums are checked.
+
+        Like the builders on a report read in one go, a report whose 'Order' rows have tax columns
+        that do not sum to zero is rejected.
+
+        Args:
+            strDateRangeFilePath (str): The file path to the CSV file (Date Range).
+            strOrg (str): The organization name.
+            cols_to_sum (list): List of column names to sum.
+            iChunkSize (int): Number of report rows read at a time.
+            tax_columns (list): Tax columns whose sum over the 'Order' rows must be zero.
+            dictDiagnostics (dict, optional): Receives the reconciliation report when the sums do not match.
+            liPartitionTypes (list, optional): The transaction types whose rows are yielded, all of them by default.
+                                               The 'Order' rows are always yielded.
+            bLocalDate (bool): If True, date the rows in the local time of the marketplace (see MNormalizeTimestamps).
+
+        Returns:
+            generator: Transaction type -> DataFrame of the rows of each chunk (see MPartitionReportRows),
+                       or None if the sums of the report do not match.
+        """
+        objAccumulator = CReportAccumulator(cols_to_sum, tax_columns)
+        for _ in CAmzB2CHelperFunc.MIterPartitionChunks(strDateRangeFilePath, 'date/time', 'settlement id', 'order id', strOrg, objAccumulator, iChunkSize, bLocalDate):
+            pass
+
+        objLogger.logInfo(f'Reconciled {objAccumulator.iRows} report rows in chunks of {iChunkSize}')
+        if not objAccumulator.MIsBalanced():
+            if objAccumulator.iRows:
+                objReport = objAccumulator.MGetReport()
+                objReport.MLog()
+                if dictDiagnostics is not None:
+                    dictDiagnostics['reconciliation'] = objReport.MToDict()
             objLogger.logInfo("Error: The sum of the specified columns does not match the sum of the 'total' column.")
             print("Error: The sum of the specified columns does not match the sum of the 'total' column.")
             return None
+        if not objAccumulator.MIsTaxBalanced():
+            objLogger.logInfo('The sum of columns(product sales tax, shipping credits tax, giftwrap credits tax, marketplace withheld tax) is not zero')
+            print("Kindly check the sum of 'product sales tax', 'shipping credits tax', 'giftwrap credits tax', 'marketplace withheld tax' columns")
+            return None
 
-        
-    
+        # The sums are checked, read the report again and pass its chunks on one at a time
+        return (
+            {strType: df for strType, df in dictPartitions.items() if liPartitionTypes is None or strType in liPartitionTypes or strType == 'Order'}
+            for dictPartitions in CAmzB2CHelperFunc.MIterPartitionChunks(strDateRangeFilePath, 'date/time', 'settlement id', 'order id', strOrg, CReportAccumulator(cols_to_sum), iChunkSize, bLocalDate)
+        )
+
+
+    @staticmethod
+    def MSplitInPartitions(df, strPartitionColName, iPartitions):
+        """
+        Split a frame into at most iPartitions parts without ever splitting a value of the
+        partition column, so every order (settlement id) or every day (date) is in one part.
+        The values are spread over the parts by size, and each part keeps the row order of df.
+
+        Args:
+            df (pd.DataFrame): The rows to split.
+            strPartitionColName (str): The column the rows are grouped by, e.g. 'settlement id' or 'date/time'.
+            iPartitions (int): The maximum number of parts.
+
+        Returns:
+            list: The non empty parts.
+        """
+        dictIndices = df.groupby(strPartitionColName, observed=True, sort=False, dropna=False).indices
+        liBuckets = [[] for _ in range(max(iPartitions, 1))]
+        liSizes = [0] * len(liBuckets)
+        # Largest groups first, each one into the smallest part so far
+        for arrPositions in sorted(dictIndices.values(), key=len, reverse=True):
+            iBucket = liSizes.index(min(liSizes))
+            liBuckets[iBucket].append(arrPositions)
+            liSizes[iBucket] += len(arrPositions)
+        return [df.take(np.sort(np.concatenate(liBucket))) for liBucket in liBuckets if liBucket]
+
+    @staticmethod
+    def MGetProcessContext():
+        """
+        Get the start method of the process pools, from the PROCESS_START_METHOD environment variable,
+        'forkserver' by default where available, else 'spawn'. The pools are created from request
+        threads, next to the background threads of the app and open sqlite connections, which a
+        plain fork would copy in whatever state they are in.
+
+        Returns:
+            multiprocessing.context.BaseContext: The context to create the pools with.
+        """
+        strStartMethod = os.environ.get('PROCESS_START_METHOD', '').strip().lower()
+        if not strStartMethod:
+            strStartMethod = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        return multiprocessing.get_context(strStartMethod)
+
+    @staticmethod
+    def MApplyInPartitions(df, fnShape, strPartitionColName, iWorkers, *args):
+        """
+        Run fnShape(part, *args) on the parts of df (see MSplitInPartitions) in a pool of iWorkers
+        processes and concatenate the results in part order.
+
+        fnShape must only combine rows that share a value of the partition column, then sorting the
+        result by a key that includes that column (e.g. 'Date', 'Sales Order Number') gives the same
+        rows in the same order as fnShape(df, *args), because the sort is stable.
+
+        Args:
+            df (pd.DataFrame): The rows to process.
+            fnShape (callable): A module level function or static method, so it can be sent to the workers.
+            strPartitionColName (str): The column the rows are grouped by, e.g. 'settlement id' or 'date/time'.
+            iWorkers (int): Number of processes.
+            *args: Further arguments of fnShape.
+
+        Returns:
+            pd.DataFrame: The concatenated results of fnShape.
+        """
+        liParts = CAmzB2CHelperFunc.MSplitInPartitions(df, strPartitionColName, iWorkers) if iWorkers and iWorkers > 1 else []
+        if len(liParts) <= 1:
+            return fnShape(df, *args)
+
+        try:
+            objExecutor = ProcessPoolExecutor(max_workers=len(liParts), mp_context=CAmzB2CHelperFunc.MGetProcessContext())
+        except (OSError, NotImplementedError) as e:
+            # Some serverless runtimes cannot create process pools, fall back to a single process
+            objLogger.logError(f'Process pool unavailable ({e}), processing the partitions sequentially')
+            return fnShape(df, *args)
+
+        objLogger.logInfo(f'Processing {len(df)} rows in {len(liParts)} partitions by {strPartitionColName}')
+        with objExecutor:
+            liResults = list(objExecutor.map(fnShape, liParts, *[[arg] * len(liParts) for arg in args]))
+        return pd.concat(liResults, ignore_index=True)
+
+
+class CReportAccumulator:
+    """
+    Running reconciliation of a report read in chunks. Gives the same answer as
+    CAmzB2CHelperFunc.MVerifySums on the whole report, and tracks the sum of the
+    tax columns over the 'Order' rows, without keeping the chunks in memory.
+    Amounts are accumulated in int64 cents (see CReportReconciler).
+
+    Methods:
+        - MUpdate
+        - MUpdateOrders
+        - MIsBalanced
+        - MIsTaxBalanced
+        - MGetReport
+    """
+
+    def __init__(self, cols_to_sum, tax_columns = None):
+        self.cols_to_sum = list(cols_to_sum)
+        self.tax_columns = list(tax_columns or [])
+        self.iDeltaCents = 0
+        self.iOffenders = 0
+        self.liOffenders = []
+        self.iTaxCents = 0
+        self.iRows = 0
+
+    def MUpdate(self, dfChunk):
+        """
+        Reconcile the rows of one normalized report chunk. Like MVerifySums, any summed column
+        of the chunk that is not numeric yet is converted in place.
+        """
+        if dfChunk.empty:
+            return
+        CAmzB2CHelperFunc.MCoerceNumericColumns(dfChunk, self.cols_to_sum + ['total'])
+
+        objReport = CReportReconciler.MReconcileTotals(dfChunk, self.cols_to_sum)
+        self.iDeltaCents += objReport.iDeltaCents
+        # Keep the first offending rows of the report only
+        if objReport.iOffenders and self.iOffenders < CReportReconciler.iMaxOffenders:
+            self.liOffenders.append(objReport.dfOffenders)
+        self.iOffenders += objReport.iOffenders
+        self.iRows += len(dfChunk)
+
+    def MUpdateOrders(self, dfOrders):
+        """
+        Add the tax column sums of the 'Order' rows of one chunk, in cents.
+        """
+        self.iTaxCents += int(CReportReconciler.MToCents(dfOrders, self.tax_columns).sum())
+
+    def MIsBalanced(self, tolerance = 1e-10):
+        """
+        Args:
+            tolerance (float): Kept for the callers, the rows are compared exactly in cents.
+
+        Returns:
+            bool: True if every row satisfies sum(cols_to_sum) == total.
+        """
+        if self.iRows == 0:
+            print("No data available.")
+            return False
+        return self.iOffenders == 0
+
+    def MIsTaxBalanced(self, tolerance = 1e-10):
+        """
+        Returns:
+            bool: True if the tax columns of the 'Order' rows sum to zero, in cents.
+        """
+        return self.iTaxCents == 0
+
+    def MGetReport(self):
+        """
+        Returns:
+            CReconciliationReport: The reconciliation report of all the chunks read so far.
+        """
+        dfOffenders = pd.concat(self.liOffenders, ignore_index=True).head(CReportReconciler.iMaxOffenders) if self.liOffenders else \
+            pd.DataFrame(columns=['row', 'settlement id', 'delta'])
+        return CReconciliationReport('sum(cols_to_sum) == total', self.iRows > 0 and self.iOffenders == 0, self.iRows, self.iDeltaCents, self.iOffenders, dfOffenders)
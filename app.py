@@ -2,15 +2,41 @@ from flask import Flask, request, jsonify, send_file, render_template
 import os
 import zipfile
 from werkzeug.utils import secure_filename
-from AmzB2CHelperFunc import CAmzB2CHelperFunc
-from AmzB2CProcess import CAMZB2C
+import shutil
+from AmzB2CBatch import CAmzB2CBatch
+from subdivisionIndex import CSubdivisionIndex
+from httpClient import CHttpClient
+from requestBudget import CRequestBudget
+from fxCacheWarmer import CFxCacheWarmer
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = '/tmp/uploads'
 app.config['OUTPUT_FOLDER'] = '/tmp/output'
+# Reports larger than this are read in chunks instead of in one go: they are reconciled chunk by chunk, then each
+# chunk of 'Order' rows is geocoded and priced as it is read, and only these prepared rows are held until the
+# output files are written
+app.config['STREAMING_THRESHOLD_BYTES'] = int(os.environ.get('STREAMING_THRESHOLD_BYTES', 20 * 1024 * 1024))
+app.config['STREAMING_CHUNK_ROWS'] = int(os.environ.get('STREAMING_CHUNK_ROWS', 50000))
+# Number of processes the output lines of one report are built in, and how its rows are split (settlement id or date)
+app.config['PARTITION_WORKERS'] = int(os.environ['PARTITION_WORKERS']) if os.environ.get('PARTITION_WORKERS') else None
+app.config['PARTITION_BY'] = os.environ.get('PARTITION_BY', 'settlement id')
+# Date the report rows in the local time of the marketplace instead of the wall-clock time printed in the report
+app.config['LOCAL_DATES'] = os.environ.get('LOCAL_DATES', '0') == '1'
+# Number of processes of the batch endpoint, by default one per report up to the number of cores
+app.config['BATCH_MAX_WORKERS'] = int(os.environ['BATCH_MAX_WORKERS']) if os.environ.get('BATCH_MAX_WORKERS') else None
+# Time a request may take (below the function timeout of the host), and the part of it kept for building the files
+# once the upstream calls (exchange rates, online geocoding) must stop
+app.config['REQUEST_BUDGET_SECONDS'] = float(os.environ.get('REQUEST_BUDGET_SECONDS', 55))
+app.config['REQUEST_BUDGET_RESERVE_SECONDS'] = float(os.environ.get('REQUEST_BUDGET_RESERVE_SECONDS', 15))
+# Keep the exchange rates of the previous month and of the month to date loaded in a background thread.
+# Off by default on Vercel, whose functions are frozen between requests, and where FX_WARMER_ENABLED is '0'
+app.config['FX_WARMER_ENABLED'] = os.environ.get('FX_WARMER_ENABLED', '0' if os.environ.get('VERCEL') else '1') != '0'
 app.secret_key = 'your_secret_key'
 
+# Build (or load the snapshot of) the subdivision index once at startup, not on the first request
+CSubdivisionIndex.MGetDefault()
+
 
 def create_folders():
     """
@@ -31,11 +57,32 @@ def clear_output_folder() -> None:
             if os.path.isfile(file_path):
                 os.remove(file_path)
             elif os.path.isdir(file_path):
-                os.rmdir(file_path)
+                # Per-marketplace folders of the batch endpoint
+                shutil.rmtree(file_path)
         except Exception as e:
             print(f"Error occurred while clearing output folder: {e}")
 
 
+def get_chunk_size(file_path: str):
+    """
+    Parse very large reports in chunks of STREAMING_CHUNK_ROWS rows, so the CSV parser never
+    holds the whole file at once.
+    """
+    return CAmzB2CBatch.MGetChunkSize(
+        file_path, app.config['STREAMING_THRESHOLD_BYTES'], app.config['STREAMING_CHUNK_ROWS']
+    )
+
+
+@app.before_request
+def start_fx_warmer():
+    """
+    Start the exchange rate warmer with the first request the process serves (not on import,
+    so importing the app, e.g. in the report worker processes, starts no thread).
+    """
+    if app.config['FX_WARMER_ENABLED']:
+        CFxCacheWarmer.MGetDefault().MStart()
+
+
 @app.route('/')
 def index():
     """
@@ -44,6 +91,21 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/httpStats')
+def http_stats():
+    """
+    Return the request, error and retry counts and the latency of each upstream host, for this worker process.
+    """
+    return jsonify(CHttpClient.MGetDefault().MGetStats())
+
+
+def get_request_budget():
+    """
+    Start the time budget of a request.
+    """
+    return CRequestBudget(app.config['REQUEST_BUDGET_SECONDS'], app.config['REQUEST_BUDGET_RESERVE_SECONDS'])
+
+
 @app.route('/processAmzDateRangeCsv', methods=['POST'])
 def process_amz_date_range_csv():
     """
@@ -56,8 +118,10 @@ def process_amz_date_range_csv():
     - enddate: End date (dd-mm-yyyy)
 
     Outputs:
-    - ZIP file containing processed sales, invoice, and credit note CSV files.
+    - ZIP file containing processed sales, invoice, and credit note CSV files, and a 'Degraded Rows.csv'
+      file with the order rows that could not be geocoded within the request budget, if any.
     """
+    objBudget = get_request_budget()
     try:
         create_folders()  # Ensure folders exist
         clear_output_folder()  # Clear old outputs
@@ -84,63 +148,17 @@ def process_amz_date_range_csv():
         strStartDate = '-'.join(reversed(strStartDate.split('-')))
         strEndDate = '-'.join(reversed(strEndDate.split('-')))
 
-        # Fetch exchange rates for the given date range
-        dictExchangeRates = CAmzB2CHelperFunc.MGetExchangeRatesFinalDict(
-            strOrg=strOrg, strStartDate=strStartDate, strEndDate=strEndDate
+        # Fetch exchange rates, then build the sales order, invoice and credit note files
+        dictDiagnostics = {}
+        output_files = CAmzB2CBatch.MProcessReport(
+            strOrg=strOrg, strDateRangeFilePath=file_path, strStartDate=strStartDate, strEndDate=strEndDate,
+            strOutputFolderPath=app.config['OUTPUT_FOLDER'], iChunkSize=get_chunk_size(file_path),
+            iPartitionWorkers=app.config['PARTITION_WORKERS'], strPartitionBy=app.config['PARTITION_BY'],
+            dictDiagnostics=dictDiagnostics, objBudget=objBudget, bLocalDate=app.config['LOCAL_DATES']
         )
-
-        # Columns to sum, drop, and other settings
-        tax_columns = [
-            'product sales tax', 'shipping credits tax', 'giftwrap credits tax', 'marketplace withheld tax'
-        ]
-        cols_to_sum = [
-            'product sales', 'product sales tax', 'shipping credits', 'shipping credits tax', 
-            'gift wrap credits', 'giftwrap credits tax', 'Regulatory Fee', 'Tax On Regulatory Fee',
-            'promotional rebates', 'promotional rebates tax', 'marketplace withheld tax', 
-            'selling fees', 'fba fees', 'other transaction fees', 'other'
-        ]
-        liColsToDrop = [
-            'settlement id', 'type', 'order id', 'sku', 'description', 'quantity', 'marketplace', 
-            'account type', 'fulfillment', 'order city', 'order state', 'order postal', 
-            'tax collection model', 'product sales', 'shipping credits', 'gift wrap credits', 
-            'giftwrap credits tax', 'promotional rebates', 'selling fees', 'fba fees', 'total', 
-            'state', 'country', 'product sales tax', 'shipping credits tax', 'marketplace withheld tax', 
-            'other transaction fees', 'other'
-        ]
-        dictSKUMapping = {
-            'MOSWZ70-RG-AMZUS': 'Moto Watch 70 - Rose Gold (Amazon US)',
-            'MOSWZ40-RG-AMZUS': 'Moto Watch 40 - Rose Gold (Amazon US)',
-            'MOSWZ40-PB-AMZUS': 'Moto Watch 40 - Phantom Black (Amazon US)',
-            'MOSWZ70-PB-AMZUS': 'Moto Watch 70 - Phantom Black (Amazon US)',
-            'MOSWZ70-BG-AMZUS': 'Moto Watch 70 - Bright Gold (Amazon US)',
-            'MOSWZ120-PB-AMZUS': 'Moto Watch 120 - Phantom Black (Amazon US)',
-            'MOSWZ120-RG-AMZUS': 'Moto Watch 120 - Rose Gold (Amazon US)',
-            'MOSWZ120-SL-AMZUS': 'Moto Watch 120 - Silver (Amazon US)',
-        }
-
-        # Process files using your custom class methods
-        strSalesOutputFilePath = CAMZB2C.MProcessSalesOrderCsv(
-            strDateRangeFilePath=file_path, strOutputFolderPath=app.config['OUTPUT_FOLDER'],
-            dictExchangeRates=dictExchangeRates, cols_to_sum=cols_to_sum, liColsToDrop=liColsToDrop,
-            tax_columns=tax_columns, dictSKUMapping=dictSKUMapping, strOrg=strOrg
-        )[1]
-
-        strInvoiceOutputFilePath = CAMZB2C.MProcessInvoiceCsv(
-            strDateRangeFilePath=file_path, strOutputFolderPath=app.config['OUTPUT_FOLDER'],
-            dictExchangeRates=dictExchangeRates, cols_to_sum=cols_to_sum, liColsToDrop=liColsToDrop,
-            tax_columns=tax_columns, dictSKUMapping=dictSKUMapping, strOrg=strOrg
-        )[1]
-
-        strCreditNoteOutputFilePath = CAMZB2C.MProcessCreditNoteCsv(
-            strDateRangeFilePath=file_path, strOutputFolderPath=app.config['OUTPUT_FOLDER'],
-            dictExchangeRates=dictExchangeRates, cols_to_sum=cols_to_sum, liColsToDrop=liColsToDrop,
-            tax_columns=tax_columns, strOrg=strOrg
-        )[1]
-
-        # Validate processed file paths
-        output_files = [strSalesOutputFilePath, strInvoiceOutputFilePath, strCreditNoteOutputFilePath]
-        if not all(output_files) or not all(os.path.exists(f) for f in output_files):
-            return jsonify({'error': 'One or more output files are missing'}), 404
+        if output_files is None:
+            # Include the rows that do not add up, if that is why the report failed
+            return jsonify({'error': 'One or more output files are missing', **dictDiagnostics}), 404
 
         # Create a ZIP file containing the output files
         zip_file_path = os.path.join(app.config['OUTPUT_FOLDER'], 'AMZB2COutput.zip')
@@ -148,7 +166,86 @@ def process_amz_date_range_csv():
             for file in output_files:
                 zipf.write(file, os.path.basename(file))
 
-        return send_file(zip_file_path, as_attachment=True)
+        response = send_file(zip_file_path, as_attachment=True)
+        response.headers['X-Degraded-Rows'] = str(len(dictDiagnostics.get('degradedRows', [])))
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/processAmzBatchCsv', methods=['POST'])
+def process_amz_batch_csv():
+    """
+    Process several Amazon date range CSV files (e.g. USA, Canada and Mexico) in one request,
+    one report per process, and return a single ZIP file with one folder per marketplace.
+
+    Inputs:
+    - file: CSV files, repeated once per report
+    - strOrg: Organization of each file (USA, Canada or Mexico), repeated in the same order
+    - startdate: Start date (yyyy-mm-dd)
+    - enddate: End date (yyyy-mm-dd)
+
+    Outputs:
+    - ZIP file containing a folder per marketplace with its sales, invoice, and credit note CSV files
+      (and degraded rows file, see process_amz_date_range_csv), and a 'diagnostics.json' file with the
+      diagnostics of each report (degraded rows, exchange rate gaps), if any.
+    - When a report fails, the reason and diagnostics of every failed marketplace.
+    """
+    objBudget = get_request_budget()
+    try:
+        create_folders()  # Ensure folders exist
+        clear_output_folder()  # Clear old outputs
+
+        uploaded_files = request.files.getlist('file')
+        liOrgs = request.form.getlist('strOrg')
+        strStartDate = request.form.get('startdate')
+        strEndDate = request.form.get('enddate')
+
+        if not uploaded_files:
+            return jsonify({'error': 'No file uploaded'}), 400
+        if len(liOrgs) != len(uploaded_files) or not all(liOrgs) or not all([strStartDate, strEndDate]):
+            return jsonify({'error': 'Missing required form fields'}), 400
+
+        # Format dates (ensure consistent 'dd-mm-yyyy' format)
+        strStartDate = '-'.join(reversed(strStartDate.split('-')))
+        strEndDate = '-'.join(reversed(strEndDate.split('-')))
+
+        # Save every report in its own folder, so two reports with the same file name do not collide
+        liReports = []
+        for strOrg, uploaded_file in zip(liOrgs, uploaded_files):
+            upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(strOrg))
+            os.makedirs(upload_folder, exist_ok=True)
+            file_path = os.path.join(upload_folder, secure_filename(uploaded_file.filename))
+            uploaded_file.save(file_path)
+            liReports.append((strOrg, file_path))
+
+        dictDiagnostics = {}
+        try:
+            dictOutputs = CAmzB2CBatch.MProcessReports(
+                liReports, strStartDate, strEndDate, app.config['OUTPUT_FOLDER'],
+                iMaxWorkers=app.config['BATCH_MAX_WORKERS'],
+                iStreamingThresholdBytes=app.config['STREAMING_THRESHOLD_BYTES'],
+                iChunkRows=app.config['STREAMING_CHUNK_ROWS'], objBudget=objBudget,
+                bLocalDate=app.config['LOCAL_DATES'], dictDiagnostics=dictDiagnostics
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        liFailed = [strMarketplace for strMarketplace, liOutputFiles in dictOutputs.items() if liOutputFiles is None]
+        if liFailed:
+            # Include why each report failed, e.g. the rows that do not add up
+            return jsonify({
+                'error': 'One or more output files are missing', 'marketplaces': liFailed,
+                'diagnostics': {strMarketplace: dictDiagnostics.get(strMarketplace, {}) for strMarketplace in liFailed}
+            }), 404
+
+        # Create a ZIP file with one folder per marketplace
+        zip_file_path = CAmzB2CBatch.MZipOutputs(dictOutputs, os.path.join(app.config['OUTPUT_FOLDER'], 'AMZB2CBatchOutput.zip'), dictDiagnostics)
+
+        response = send_file(zip_file_path, as_attachment=True)
+        response.headers['X-Degraded-Rows'] = str(sum(len(dictReport.get('degradedRows', [])) for dictReport in dictDiagnostics.values()))
+        return response
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,250 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import requests
+from logUtility import CLogUtility
+from httpClient import CHttpClient
+
+objLogger = CLogUtility()
+
+class CGeocodingError(Exception):
+    """
+    Raised when a geocoding request fails for good: non retryable status, retries exhausted or deadline passed.
+    """
+
+
+class CTokenBucket:
+    """
+    Token bucket rate limiter for the coroutines of one event loop. Waiters are served in
+    arrival order.
+
+    Methods:
+        - MAcquire
+    """
+
+    def __init__(self, fRatePerSecond, iBurst = 1):
+        self.fRatePerSecond = float(fRatePerSecond)
+        self.fCapacity = float(max(iBurst, 1))
+        self.fTokens = self.fCapacity
+        self.fUpdated = time.monotonic()
+        self.objLock = asyncio.Lock()
+
+    async def MAcquire(self):
+        """
+        Wait until a token is available and take it.
+        """
+        async with self.objLock:
+            while True:
+                fNow = time.monotonic()
+                self.fTokens = min(self.fCapacity, self.fTokens + (fNow - self.fUpdated) * self.fRatePerSecond)
+                self.fUpdated = fNow
+                if self.fTokens >= 1:
+                    self.fTokens -= 1
+                    return
+                await asyncio.sleep((1 - self.fTokens) / self.fRatePerSecond)
+
+
+class CAsyncGeocoder:
+    """
+    Asyncio geocoding engine for the Nominatim search API. Requests are paced by a token
+    bucket (the public Nominatim policy is 1 request/s), at most iMaxConcurrency are in flight,
+    failed ones (timeouts, 429, 5xx) are retried with exponential backoff and jitter within a
+    per-call deadline, and concurrent calls for the same query share one request.
+
+    The engine runs its own event loop in a background thread, so the synchronous code
+    (e.g. the geocoding thread pool of CAmzB2CHelperFunc.MGetAllCountriesAndStates) can call
+    MSearch from any thread and still share the rate limit.
+
+    Methods:
+        - MGetDefault
+        - MStartLoop
+        - MSearch
+        - MSearchMany
+        - MSearchAsync
+        - MFetch
+        - MGetStats
+    """
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    # Statuses worth retrying, anything else but 200 fails at once
+    setRetryStatuses = {429, 500, 502, 503, 504}
+
+    def __init__(self, strBaseUrl = 'https://nominatim.openstreetmap.org', fRatePerSecond = 1.0, iBurst = 1, iMaxConcurrency = 2,
+                 fDeadlineSeconds = 30.0, fRequestTimeout = 10.0, iMaxRetries = 3, fBackoffSeconds = 1.0,
+                 strUserAgent = 'YourApplicationName/Version (e.g., MyGeocoder/1.0)'):
+        self.strBaseUrl = strBaseUrl.rstrip('/')
+        self.fRatePerSecond = fRatePerSecond
+        self.iBurst = iBurst
+        self.iMaxConcurrency = iMaxConcurrency
+        self.fDeadlineSeconds = fDeadlineSeconds
+        self.fRequestTimeout = fRequestTimeout
+        self.iMaxRetries = iMaxRetries
+        self.fBackoffSeconds = fBackoffSeconds
+        self.strUserAgent = strUserAgent
+        self.dictStats = {'calls': 0, 'requests': 0, 'coalesced': 0, 'retries': 0, 'failures': 0}
+        # The loop, its thread and the loop bound state are created on first use, and again in a forked process
+        self.objStartLock = threading.Lock()
+        self.iPid = None
+        self.objLoop = None
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide geocoder, configured by the NOMINATIM_URL, NOMINATIM_RATE,
+        NOMINATIM_MAX_CONCURRENCY, NOMINATIM_DEADLINE_SECONDS and NOMINATIM_MAX_RETRIES
+        environment variables.
+
+        Returns:
+            CAsyncGeocoder: The shared geocoder.
+        """
+        with CAsyncGeocoder.objDefaultLock:
+            if CAsyncGeocoder.objDefault is None:
+                CAsyncGeocoder.objDefault = CAsyncGeocoder(
+                    strBaseUrl = os.environ.get('NOMINATIM_URL', 'https://nominatim.openstreetmap.org'),
+                    fRatePerSecond = float(os.environ.get('NOMINATIM_RATE', 1.0)),
+                    iMaxConcurrency = int(os.environ.get('NOMINATIM_MAX_CONCURRENCY', 2)),
+                    fDeadlineSeconds = float(os.environ.get('NOMINATIM_DEADLINE_SECONDS', 30.0)),
+                    iMaxRetries = int(os.environ.get('NOMINATIM_MAX_RETRIES', 3))
+                )
+            return CAsyncGeocoder.objDefault
+
+    def MStartLoop(self):
+        """
+        Start the event loop thread of this process if it is not running yet.
+
+        Returns:
+            asyncio.AbstractEventLoop: The loop.
+        """
+        with self.objStartLock:
+            if self.objLoop is None or self.iPid != os.getpid():
+                objLoop = asyncio.new_event_loop()
+                threading.Thread(target=objLoop.run_forever, name='CAsyncGeocoder', daemon=True).start()
+                self.objBucket = CTokenBucket(self.fRatePerSecond, self.iBurst)
+                self.objSemaphore = asyncio.Semaphore(self.iMaxConcurrency)
+                # Query -> (task of the request in flight, [its deadline]), only touched from the loop thread
+                self.dictInFlight = {}
+                self.iPid = os.getpid()
+                self.objLoop = objLoop
+            return self.objLoop
+
+    def MSearch(self, strQuery, fDeadlineSeconds = None):
+        """
+        Search a place, blocking the calling thread.
+
+        Args:
+            strQuery (str): The free form query, e.g. 'Toronto, ON'.
+            fDeadlineSeconds (float, optional): Time limit of the call, by default fDeadlineSeconds.
+
+        Returns:
+            list: The decoded JSON response, [] if nothing was found.
+
+        Raises:
+            CGeocodingError: If the request failed or the deadline passed.
+        """
+        objLoop = self.MStartLoop()
+        return asyncio.run_coroutine_threadsafe(self.MSearchAsync(strQuery, fDeadlineSeconds), objLoop).result()
+
+    def MSearchMany(self, liQueries, fDeadlineSeconds = None):
+        """
+        Search several places concurrently, within the rate and concurrency limits.
+
+        Args:
+            liQueries (list): The free form queries.
+            fDeadlineSeconds (float, optional): Time limit of each call, by default fDeadlineSeconds.
+
+        Returns:
+            dict: Query -> decoded JSON response, or the CGeocodingError of the failed queries.
+        """
+        objLoop = self.MStartLoop()
+
+        async def MGather():
+            liResults = await asyncio.gather(*(self.MSearchAsync(q, fDeadlineSeconds) for q in liQueries), return_exceptions=True)
+            return dict(zip(liQueries, liResults))
+
+        return asyncio.run_coroutine_threadsafe(MGather(), objLoop).result()
+
+    async def MSearchAsync(self, strQuery, fDeadlineSeconds = None):
+        """
+        Search a place from the loop of the geocoder. A call for a query already in flight waits
+        for that request instead of sending a new one, and extends its deadline to its own, so
+        the request keeps retrying as long as one of its callers still waits.
+        """
+        fDeadlineSeconds = self.fDeadlineSeconds if fDeadlineSeconds is None else fDeadlineSeconds
+        fDeadline = time.monotonic() + fDeadlineSeconds
+        self.dictStats['calls'] += 1
+        objTask, liDeadline = self.dictInFlight.get(strQuery, (None, None))
+        if objTask is None or objTask.done():
+            liDeadline = [fDeadline]
+            objTask = asyncio.ensure_future(self.MFetch(strQuery, liDeadline))
+            self.dictInFlight[strQuery] = (objTask, liDeadline)
+
+            def MForget(objDone):
+                # A later call may have started a new request for the query once this one was done
+                if self.dictInFlight.get(strQuery, (None, None))[0] is objDone:
+                    del self.dictInFlight[strQuery]
+            objTask.add_done_callback(MForget)
+        else:
+            self.dictStats['coalesced'] += 1
+            liDeadline[0] = max(liDeadline[0], fDeadline)
+        try:
+            # shield: the deadline of one caller must not cancel the request the others wait for
+            return await asyncio.wait_for(asyncio.shield(objTask), timeout=fDeadlineSeconds)
+        except asyncio.TimeoutError:
+            raise CGeocodingError(f"Deadline of {fDeadlineSeconds}s passed for '{strQuery}'") from None
+
+    async def MFetch(self, strQuery, liDeadline):
+        """
+        Send the request of a query, retrying the transient failures until liDeadline[0] (time.monotonic()).
+        The deadline is read again before every attempt, the coalesced callers may extend it.
+        """
+        strUrl = f'{self.strBaseUrl}/search'
+        dictParams = {'q': strQuery, 'format': 'json', 'limit': 1}
+        dictHeaders = {'User-Agent': self.strUserAgent}
+        strError = None
+        for iAttempt in range(self.iMaxRetries + 1):
+            fRetryAfter = None
+            await self.objBucket.MAcquire()
+            fRemaining = liDeadline[0] - time.monotonic()
+            if fRemaining <= 0:
+                break
+            async with self.objSemaphore:
+                self.dictStats['requests'] += 1
+                try:
+                    # Pooled session of the shared client, the retries are done here, within the deadline
+                    response = await asyncio.to_thread(
+                        CHttpClient.MGetDefault().MGet, strUrl, params=dictParams, headers=dictHeaders,
+                        timeout=min(self.fRequestTimeout, fRemaining), iMaxRetries=0
+                    )
+                except requests.RequestException as e:
+                    strError = f'{type(e).__name__}: {e}'
+                else:
+                    if response.status_code == 200:
+                        return response.json()
+                    strError = f'HTTP {response.status_code}'
+                    if response.status_code not in self.setRetryStatuses:
+                        break
+                    try:
+                        fRetryAfter = float(response.headers.get('Retry-After'))
+                    except (TypeError, ValueError):
+                        fRetryAfter = None
+            if iAttempt == self.iMaxRetries:
+                break
+            # Exponential backoff with full jitter, at least what the server asked for
+            fDelay = max(random.uniform(0, self.fBackoffSeconds * 2 ** iAttempt), fRetryAfter or 0)
+            if time.monotonic() + fDelay >= liDeadline[0]:
+                break
+            self.dictStats['retries'] += 1
+            await asyncio.sleep(fDelay)
+        self.dictStats['failures'] += 1
+        raise CGeocodingError(f"Geocoding '{strQuery}' failed: {strError or 'deadline passed'}")
+
+    def MGetStats(self):
+        """
+        Returns:
+            dict: Counters of calls, requests sent, coalesced calls, retries and failures.
+        """
+        return dict(self.dictStats)
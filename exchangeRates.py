@@ -1,4 +1,5 @@
-import requests
+from fxProvider import CFxProvider
+from fxGapFiller import CFxGapFiller
 from datetime import datetime, timedelta
 
 class CExchangeRatesHelper:
@@ -26,7 +27,7 @@ class CExchangeRatesHelper:
     @staticmethod
     def MGetExchangeRatesLastMonth(apiKey):
         """
-        Purpose: Get the exchange rates for each day of the last month in a single API request.
+        Purpose: Get the exchange rates for each day of the last month from the FX provider (see CFxProvider).
 
         Inputs:
             1) apiKey (str): Your Alpha Vantage API key.
@@ -35,70 +36,35 @@ class CExchangeRatesHelper:
         Outputs:
             1) dict: A dictionary containing dates as keys (in the format '%d-%m-%Y') and exchange rates as values.
         """
-        url = f"https://www.alphavantage.co/query?function=FX_DAILY&from_symbol=USD&to_symbol=CAD&apikey={apiKey}"
-
-        dictexchangeRates = {}
         lastMonthDates = CExchangeRatesHelper.MGetLastMonthDates()
-        
-        # If not 'usa', proceed with the API request
-        response = requests.get(url)
-        data = response.json()
-
-        timeSeries = data.get("Time Series FX (Daily)", {})
 
-        for date in lastMonthDates:
-            # Convert date to the required format for the API response
-            dateObj = datetime.strptime(date, '%m-%d-%Y')
-            apiDateFormat = dateObj.strftime('%Y-%m-%d')
-            
-            if apiDateFormat in timeSeries:
-                exchangeRate = timeSeries[apiDateFormat]['4. close']
-                dictexchangeRates[date] = float(exchangeRate)
+        # USD to CAD is the inverse of the CAD base series of the FX provider
+        dfMatrix = CFxProvider.MGetDefault().MGetMatrix(
+            ['CAD', 'USD'],
+            datetime.strptime(lastMonthDates[0], '%m-%d-%Y').strftime('%Y-%m-%d'),
+            datetime.strptime(lastMonthDates[-1], '%m-%d-%Y').strftime('%Y-%m-%d'),
+            apiKey
+        )
+        srRates = CFxProvider.MGetPairRates(dfMatrix, 'USD', 'CAD').dropna()
+        dictexchangeRates = dict(zip(srRates.index.strftime('%m-%d-%Y'), srRates.to_numpy().tolist()))
 
         return dictexchangeRates
     
     @staticmethod
-    def MFillMissingDates(liExchangeRates: dict, dates: list):
+    def MFillMissingDates(liExchangeRates: dict, dates: list, dictDiagnostics = None):
         """
-        Purpose: Fill missing exchange rates in the provided dates with the last known or next known exchange rate.
+        Purpose: Fill missing exchange rates in the provided dates with the last known or next known exchange rate,
+                 at most FX_MAX_GAP_DAYS days away (see CFxGapFiller).
 
         Inputs:
-            1) liExchangeRates (list): List of tuples containing dates and their respective exchange rates.
+            1) liExchangeRates (dict): Dictionary with dates ('%m-%d-%Y') as keys and exchange rates as values.
             2) dates (list): List of dates for which exchange rates are required.
+            3) dictDiagnostics (dict, optional): Receives the filled and the still missing dates.
 
         Outputs:
             1) dict: Dictionary with dates as keys and exchange rates as values.
         """
-        # Convert the list of tuples to a dictionary for easy access
-        exchangeRatesDict = dict(liExchangeRates)
-        dictfilledExchangeRates = {}
-        
-        lastKnownRate = None
-        
-        # Pre-compute next available rates
-        nextKnownRates = {}
-        sortedDates = sorted(dates)
-        for i, dateStr in enumerate(sortedDates):
-            if dateStr in exchangeRatesDict:
-                rate = exchangeRatesDict[dateStr]
-                for j in range(i - 1, -1, -1):
-                    if sortedDates[j] not in exchangeRatesDict:
-                        nextKnownRates[sortedDates[j]] = rate
-                    else:
-                        break
-        
-        # Fill missing rates
-        for dateStr in dates:
-            if dateStr in exchangeRatesDict:  # Check if date present in exchangeRatesDict
-                lastKnownRate = exchangeRatesDict[dateStr]
-            elif dateStr in nextKnownRates:
-                lastKnownRate = nextKnownRates[dateStr]
-            if lastKnownRate is not None:
-                dictfilledExchangeRates[dateStr] = lastKnownRate
-            else:
-                print(f"No available exchange rate for {dateStr} and no previous or next data to use.")
-        
-        return dictfilledExchangeRates
+        return CFxGapFiller.MFillMissingDates(liExchangeRates, dates, '%m-%d-%Y', CFxGapFiller.MGetMaxGapDays(), dictDiagnostics)
     
     @staticmethod
     def MGetExchangeRatesFinalDict():
@@ -0,0 +1,129 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from logUtility import CLogUtility
+from AmzB2CHelperFunc import CAmzB2CHelperFunc, dictMarketplaceCurrencies, strAlphaVantageApiKey
+from fxProvider import CFxProvider
+
+objLogger = CLogUtility()
+
+class CFxCacheWarmer:
+    """
+    Background thread that keeps the exchange rates of the previous month and of the month to
+    date of every marketplace in the CFxRateMemo, so the requests find them there instead of
+    waiting for the download. It runs once at startup, then every fIntervalSeconds (keep it
+    below FX_MEMO_TTL_SECONDS so the entries never expire in between).
+
+    Methods:
+        - MGetDefault
+        - MGetRanges
+        - MWarm
+        - MStart
+        - MRun
+        - MStop
+    """
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    def __init__(self, liOrgs = None, fIntervalSeconds = 300.0):
+        self.liOrgs = liOrgs or list(dictMarketplaceCurrencies)
+        self.fIntervalSeconds = fIntervalSeconds
+        self.objStopEvent = threading.Event()
+        self.objThread = None
+        self.objLock = threading.Lock()
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide warmer, configured by the FX_WARMER_MARKETPLACES (comma separated,
+        all the marketplaces by default) and FX_WARMER_INTERVAL_MINUTES environment variables.
+
+        Returns:
+            CFxCacheWarmer: The shared warmer.
+        """
+        with CFxCacheWarmer.objDefaultLock:
+            if CFxCacheWarmer.objDefault is None:
+                strOrgs = os.environ.get('FX_WARMER_MARKETPLACES', '')
+                CFxCacheWarmer.objDefault = CFxCacheWarmer(
+                    liOrgs = [s.strip().lower() for s in strOrgs.split(',') if s.strip()] or None,
+                    fIntervalSeconds = float(os.environ.get('FX_WARMER_INTERVAL_MINUTES', 5)) * 60
+                )
+            return CFxCacheWarmer.objDefault
+
+    @staticmethod
+    def MGetRanges(objToday = None):
+        """
+        Returns:
+            list: The (start, end) 'dd-mm-yyyy' ranges of the previous month and of the month to date.
+        """
+        objToday = objToday or datetime.today()
+        objFirstDayThisMonth = objToday.replace(day=1)
+        objLastDayLastMonth = objFirstDayThisMonth - timedelta(days=1)
+        return [
+            (objLastDayLastMonth.replace(day=1).strftime('%d-%m-%Y'), objLastDayLastMonth.strftime('%d-%m-%Y')),
+            (objFirstDayThisMonth.strftime('%d-%m-%Y'), objToday.strftime('%d-%m-%Y')),
+        ]
+
+    def MWarm(self):
+        """
+        Load the rates of the previous month and of the month to date of every marketplace: the
+        base series are downloaded concurrently first, then the filled dicts are built from the
+        local store into the memo. Failures are logged, the next run tries again.
+
+        Returns:
+            int: Number of (marketplace, range) dicts loaded.
+        """
+        liRanges = CFxCacheWarmer.MGetRanges()
+        liCurrencies = sorted({dictMarketplaceCurrencies.get(strOrg, 'USD') for strOrg in self.liOrgs} - {'USD'})
+        if liCurrencies:
+            CFxProvider.MGetDefault().MPrefetch(
+                liCurrencies,
+                CAmzB2CHelperFunc.MGetRateFetchStartDate(liRanges[0][0]),
+                datetime.strptime(liRanges[-1][1], '%d-%m-%Y').strftime('%Y-%m-%d'),
+                strAlphaVantageApiKey
+            )
+
+        iLoaded = 0
+        for strOrg in self.liOrgs:
+            for strStartDate, strEndDate in liRanges:
+                try:
+                    CAmzB2CHelperFunc.MGetExchangeRatesFinalDict(strOrg, strStartDate, strEndDate)
+                    iLoaded += 1
+                except Exception as e:
+                    objLogger.logError(f'Could not warm the {strOrg} exchange rates of {strStartDate} to {strEndDate}: {e}')
+        objLogger.logInfo(f'Warmed {iLoaded} exchange rate ranges')
+        return iLoaded
+
+    def MStart(self):
+        """
+        Start the background thread, if it is not running yet.
+        """
+        with self.objLock:
+            if self.objThread is not None and self.objThread.is_alive():
+                return
+            self.objStopEvent.clear()
+            self.objThread = threading.Thread(target=self.MRun, name='fx-cache-warmer', daemon=True)
+            self.objThread.start()
+
+    def MRun(self):
+        """
+        Body of the background thread: warm now, then every fIntervalSeconds until MStop.
+        """
+        while True:
+            try:
+                self.MWarm()
+            except Exception as e:
+                objLogger.logError(f'Exchange rate warmer failed: {e}')
+            if self.objStopEvent.wait(self.fIntervalSeconds):
+                return
+
+    def MStop(self):
+        """
+        Stop the background thread after its current run.
+        """
+        self.objStopEvent.set()
+        with self.objLock:
+            objThread = self.objThread
+        if objThread is not None:
+            objThread.join()
@@ -0,0 +1,70 @@
+import os
+import pandas as pd
+from logUtility import CLogUtility
+
+objLogger = CLogUtility()
+
+class CFxGapFiller:
+    """
+    Fills the days without an exchange rate (weekends, holidays) of a date calendar. The rates
+    are put on a daily, datetime indexed series, so the fill runs in chronological order
+    whatever the date format, then each missing day takes the last known rate before it, or
+    failing that (days before the first rate) the next known rate after it.
+
+    Methods:
+        - MGetMaxGapDays
+        - MFillMissingDates
+    """
+
+    @staticmethod
+    def MGetMaxGapDays():
+        """
+        Returns:
+            int: The fill limit of the FX_MAX_GAP_DAYS environment variable, 7 days by default
+                 (long weekends and the year end holidays), None if set to 'none'.
+        """
+        strMaxGapDays = os.environ.get('FX_MAX_GAP_DAYS', '7').strip().lower()
+        return None if strMaxGapDays in ('', 'none') else int(strMaxGapDays)
+
+    @staticmethod
+    def MFillMissingDates(dictRates, liDates, strDateFormat = '%d-%m-%Y', iMaxGapDays = None, dictDiagnostics = None):
+        """
+        Fill the missing exchange rates of a date calendar.
+
+        Args:
+            dictRates (dict): Date string -> rate, may hold dates outside liDates (they are used for the fill).
+            liDates (list): The date strings rates are required for.
+            strDateFormat (str): The format of the date strings of dictRates and liDates.
+            iMaxGapDays (int, optional): A day takes a rate at most this many days away from it, so a long
+                                         outage of the rate source is not hidden by a stale rate. None for no limit.
+            dictDiagnostics (dict, optional): Receives the 'filledDates' (filled from a nearby rate) and the
+                                              'missingDates' (still without a rate) of liDates.
+
+        Returns:
+            dict: Date string -> rate for the dates of liDates that have one, in the order of liDates.
+        """
+        if not liDates:
+            return {}
+        srRates = pd.Series(dictRates, dtype='float64')
+        srRates.index = pd.to_datetime(srRates.index, format=strDateFormat)
+        srRates = srRates[~srRates.index.duplicated()].dropna()
+        idxCalendar = pd.DatetimeIndex(pd.to_datetime(liDates, format=strDateFormat))
+
+        # Daily series over the calendar and the known rates, so the fill limit counts calendar days
+        idxKnown = srRates.index.union(idxCalendar)
+        idxDays = pd.date_range(idxKnown.min(), idxKnown.max(), freq='D')
+        srDaily = srRates.reindex(idxDays)
+        srDaily = srDaily.ffill(limit=iMaxGapDays).bfill(limit=iMaxGapDays)
+
+        arrFilled = srDaily.reindex(idxCalendar).to_numpy()
+        arrKnown = idxCalendar.isin(srRates.index)
+        dictFilledRates = {strDate: float(fRate) for strDate, fRate in zip(liDates, arrFilled) if fRate == fRate}
+
+        liFilledDates = [strDate for strDate, bKnown, fRate in zip(liDates, arrKnown, arrFilled) if not bKnown and fRate == fRate]
+        liMissingDates = [strDate for strDate, fRate in zip(liDates, arrFilled) if fRate != fRate]
+        if liMissingDates:
+            objLogger.logError(f'No exchange rate to fill {len(liMissingDates)} dates with (max gap {iMaxGapDays} days), first {liMissingDates[0]}, last {liMissingDates[-1]}')
+        if dictDiagnostics is not None:
+            dictDiagnostics['filledDates'] = liFilledDates
+            dictDiagnostics['missingDates'] = liMissingDates
+        return dictFilledRates
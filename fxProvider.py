@@ -0,0 +1,119 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from logUtility import CLogUtility
+from fxRateStore import CFxRateStore
+
+objLogger = CLogUtility()
+
+class CFxProvider:
+    """
+    Exchange rates of several currencies at once. Only one base series per currency is
+    downloaded (the currency to strBaseCurrency, through the CFxRateStore), all of them
+    concurrently, and any other pair is derived locally: the inverse of a base series, or the
+    cross rate of two of them. So a new marketplace currency adds one concurrent download
+    instead of a serial round trip per pair.
+
+    Methods:
+        - MGetDefault
+        - MGetMatrix
+        - MGetPairRates
+        - MPrefetch
+    """
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    def __init__(self, strBaseCurrency = 'USD', iMaxWorkers = 4, objStore = None):
+        self.strBaseCurrency = strBaseCurrency.upper()
+        self.iMaxWorkers = iMaxWorkers
+        self.objStore = objStore
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide provider, configured by the FX_PROVIDER_MAX_WORKERS environment variable.
+
+        Returns:
+            CFxProvider: The shared provider.
+        """
+        with CFxProvider.objDefaultLock:
+            if CFxProvider.objDefault is None:
+                CFxProvider.objDefault = CFxProvider(iMaxWorkers = int(os.environ.get('FX_PROVIDER_MAX_WORKERS', 4)))
+            return CFxProvider.objDefault
+
+    def MGetMatrix(self, liCurrencies, strStartDate, strEndDate, strApiKey, objBudget = None):
+        """
+        Get the rates of several currencies over a date range.
+
+        Args:
+            liCurrencies (list): The currency codes, e.g. ['CAD', 'MXN'].
+            strStartDate (str): First date, 'yyyy-mm-dd'.
+            strEndDate (str): Last date, 'yyyy-mm-dd'.
+            strApiKey (str): The Alpha Vantage API key.
+            objBudget (CRequestBudget, optional): Time budget of the request.
+
+        Returns:
+            pd.DataFrame: Date (datetime64 index, the trading days of the range) x currency matrix of the
+                          value of one unit of the currency in strBaseCurrency (1.0 for strBaseCurrency itself),
+                          NaN where a series has no rate.
+
+        Raises:
+            CFxRateError, requests.RequestException: If a base series could not be downloaded and is not stored.
+        """
+        objStore = self.objStore or CFxRateStore.MGetDefault()
+        liCurrencies = list(dict.fromkeys(strCurrency.upper() for strCurrency in liCurrencies))
+        liFetched = [strCurrency for strCurrency in liCurrencies if strCurrency != self.strBaseCurrency]
+
+        # One base series per currency, downloaded concurrently (the store serializes its writes)
+        dictSeries = {}
+        if liFetched:
+            with ThreadPoolExecutor(max_workers=max(min(self.iMaxWorkers, len(liFetched)), 1)) as executor:
+                dictFutures = {
+                    strCurrency: executor.submit(objStore.MGetRates, strCurrency, self.strBaseCurrency, strStartDate, strEndDate, strApiKey, objBudget)
+                    for strCurrency in liFetched
+                }
+                for strCurrency, objFuture in dictFutures.items():
+                    dictRates = objFuture.result()
+                    dictSeries[strCurrency] = pd.Series(
+                        list(dictRates.values()), index=pd.to_datetime(list(dictRates.keys()), format='%Y-%m-%d'), dtype='float64'
+                    )
+
+        dfMatrix = pd.DataFrame(dictSeries, dtype='float64').sort_index()
+        if self.strBaseCurrency in liCurrencies:
+            dfMatrix[self.strBaseCurrency] = 1.0
+        return dfMatrix[liCurrencies]
+
+    @staticmethod
+    def MGetPairRates(dfMatrix, strFromCurrency, strToCurrency):
+        """
+        Derive the rate of a currency pair from a matrix of MGetMatrix: the base series itself,
+        its inverse, or the cross rate of two base series.
+
+        Args:
+            dfMatrix (pd.DataFrame): The matrix, holding both currencies.
+            strFromCurrency (str): The currency converted from.
+            strToCurrency (str): The currency converted to.
+
+        Returns:
+            pd.Series: The value of one unit of strFromCurrency in strToCurrency, by date.
+        """
+        arrRates = dfMatrix[strFromCurrency.upper()].to_numpy() / dfMatrix[strToCurrency.upper()].to_numpy()
+        return pd.Series(np.where(np.isfinite(arrRates), arrRates, np.nan), index=dfMatrix.index, dtype='float64')
+
+    def MPrefetch(self, liCurrencies, strStartDate, strEndDate, strApiKey, objBudget = None):
+        """
+        Download the base series of several currencies into the store ahead of their use (e.g.
+        before the reports of a batch are processed), logging failures instead of raising them.
+
+        Returns:
+            bool: True if all the series are available.
+        """
+        try:
+            self.MGetMatrix(liCurrencies, strStartDate, strEndDate, strApiKey, objBudget)
+            return True
+        except Exception as e:
+            objLogger.logError(f'Could not prefetch the {liCurrencies} exchange rates: {e}')
+            return False
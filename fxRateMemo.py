@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+class CFxRateMemo:
+    """
+    Process local memo of the filled exchange rate dicts of MGetExchangeRatesFinalDict, keyed
+    by (org, start date, end date). Entries expire after iTtlSeconds and the least recently used
+    ones are dropped beyond iMaxEntries. A range inside a cached wider range of the same org is
+    served by slicing it, and concurrent misses of the same key wait for one load instead of
+    each calling the rate source.
+
+    Methods:
+        - MGetDefault
+        - MGetDates
+        - MLookup
+        - MGet
+        - MClear
+    """
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    def __init__(self, iMaxEntries = 32, iTtlSeconds = 600):
+        self.iMaxEntries = iMaxEntries
+        self.iTtlSeconds = iTtlSeconds
+        self.objLock = threading.Lock()
+        # (org, start datetime, end datetime) -> (expires, dict of the rates), least recently used first
+        self.dictEntries = OrderedDict()
+        # (org, start, end) -> [threading.Event, dict of the rates, exception] of the load in progress
+        self.dictInFlight = {}
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide memo, configured by the FX_MEMO_MAX_ENTRIES and FX_MEMO_TTL_SECONDS
+        environment variables.
+
+        Returns:
+            CFxRateMemo: The shared memo.
+        """
+        with CFxRateMemo.objDefaultLock:
+            if CFxRateMemo.objDefault is None:
+                CFxRateMemo.objDefault = CFxRateMemo(
+                    iMaxEntries = int(os.environ.get('FX_MEMO_MAX_ENTRIES', 32)),
+                    iTtlSeconds = int(os.environ.get('FX_MEMO_TTL_SECONDS', 600))
+                )
+            return CFxRateMemo.objDefault
+
+    @staticmethod
+    def MGetDates(strStartDate, strEndDate):
+        """
+        Returns:
+            tuple: The start and end datetimes of a 'dd-mm-yyyy' range.
+        """
+        return datetime.strptime(strStartDate, '%d-%m-%Y'), datetime.strptime(strEndDate, '%d-%m-%Y')
+
+    def MLookup(self, strOrg, strStartDate, strEndDate):
+        """
+        Look up a range, exactly or inside a cached wider range of the same org.
+
+        Returns:
+            dict: 'dd-mm-yyyy' date -> rate, or None if no live entry holds the range.
+        """
+        objStart, objEnd = CFxRateMemo.MGetDates(strStartDate, strEndDate)
+        fNow = time.monotonic()
+        with self.objLock:
+            for tKey in list(self.dictEntries):
+                fExpires, dictRates = self.dictEntries[tKey]
+                if fExpires <= fNow:
+                    del self.dictEntries[tKey]
+                    continue
+                strKeyOrg, objKeyStart, objKeyEnd = tKey
+                if strKeyOrg == strOrg and objKeyStart <= objStart and objEnd <= objKeyEnd:
+                    self.dictEntries.move_to_end(tKey)
+                    break
+            else:
+                return None
+        if (objKeyStart, objKeyEnd) == (objStart, objEnd):
+            return dict(dictRates)
+        dictSlice = {}
+        objDate = objStart
+        while objDate <= objEnd:
+            strDate = objDate.strftime('%d-%m-%Y')
+            if strDate in dictRates:
+                dictSlice[strDate] = dictRates[strDate]
+            objDate += timedelta(days=1)
+        return dictSlice
+
+    def MGet(self, strOrg, strStartDate, strEndDate, fnLoad):
+        """
+        Get the rates of a range from the memo, or load them once for all the concurrent callers.
+
+        Args:
+            strOrg (str): The organization.
+            strStartDate (str): Start date in the format 'dd-mm-yyyy'.
+            strEndDate (str): End date in the format 'dd-mm-yyyy'.
+            fnLoad (callable): Loads the rates on a miss, returns the rates dict and whether it may be kept
+                               (a dict with missing dates is not, so the next request tries again).
+
+        Returns:
+            dict: 'dd-mm-yyyy' date -> rate, a copy the caller may change.
+        """
+        strOrg = strOrg.lower()
+        dictRates = self.MLookup(strOrg, strStartDate, strEndDate)
+        if dictRates is not None:
+            return dictRates
+
+        tKey = (strOrg, *CFxRateMemo.MGetDates(strStartDate, strEndDate))
+        with self.objLock:
+            liFlight = self.dictInFlight.get(tKey)
+            bLeader = liFlight is None
+            if bLeader:
+                liFlight = [threading.Event(), None, None]
+                self.dictInFlight[tKey] = liFlight
+
+        if not bLeader:
+            liFlight[0].wait()
+            if liFlight[2] is not None:
+                raise liFlight[2]
+            return dict(liFlight[1])
+
+        try:
+            # Another caller may have stored the range between the lookup and the registration of the flight
+            dictRates = self.MLookup(strOrg, strStartDate, strEndDate)
+            if dictRates is not None:
+                liFlight[1] = dictRates
+                return dict(dictRates)
+            dictRates, bKeep = fnLoad()
+            liFlight[1] = dictRates
+            if bKeep:
+                with self.objLock:
+                    self.dictEntries[tKey] = (time.monotonic() + self.iTtlSeconds, dict(dictRates))
+                    self.dictEntries.move_to_end(tKey)
+                    while len(self.dictEntries) > self.iMaxEntries:
+                        self.dictEntries.popitem(last=False)
+            return dict(dictRates)
+        except Exception as e:
+            liFlight[2] = e
+            raise
+        finally:
+            with self.objLock:
+                del self.dictInFlight[tKey]
+            liFlight[0].set()
+
+    def MClear(self):
+        """
+        Drop all the entries.
+        """
+        with self.objLock:
+            self.dictEntries.clear()
@@ -0,0 +1,303 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from logUtility import CLogUtility
+from httpClient import CHttpClient
+
+objLogger = CLogUtility()
+
+class CFxRateError(Exception):
+    """
+    Raised when Alpha Vantage does not return a rate series (network failure, rate limit, bad key).
+    """
+
+
+class CFxRateStore:
+    """
+    Persistent SQLite store of the daily Alpha Vantage FX_DAILY close rates, keyed by
+    (currency pair, date). The date ranges each download covered are kept as well, so the
+    days without a rate (weekends, holidays) are known and not downloaded again. A request
+    only downloads the dates missing from the store: with the compact output (about the last
+    100 trading days) for recent gaps, with the full history for older ones. Dates after the
+    latest stored rate are downloaded again at most every iRefreshSeconds.
+
+    Methods:
+        - MGetDefault
+        - MGetConnection
+        - MGetPair
+        - MLookup
+        - MGetCoverage
+        - MGetMissingDates
+        - MStore
+        - MGetCoveredEnd
+        - MFetch
+        - MGetRates
+    """
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    strApiUrl = 'https://www.alphavantage.co/query'
+    # Calendar days of the compact output, older gaps need the full history
+    iCompactDays = 130
+
+    def __init__(self, strDbPath = '/tmp/fx_rates.sqlite3', iRefreshSeconds = 3600):
+        self.strDbPath = strDbPath
+        self.iRefreshSeconds = iRefreshSeconds
+        strFolder = os.path.dirname(strDbPath)
+        if strFolder:
+            os.makedirs(strFolder, exist_ok=True)
+        # (pid, lock, connection): one connection shared by the request threads of a process, serialized by the lock
+        self.tConnection = (None, None, None)
+        objLock, objConnection = self.MGetConnection()
+        with objLock, objConnection:
+            # WAL lets the batch worker processes read while one of them writes
+            objConnection.execute('PRAGMA journal_mode=WAL')
+            objConnection.execute(
+                'CREATE TABLE IF NOT EXISTS fx_rate ('
+                'pair TEXT NOT NULL, date TEXT NOT NULL, rate REAL NOT NULL, PRIMARY KEY (pair, date))'
+            )
+            # Date ranges (ISO dates, inclusive) returned by the downloads, and when the pair was last downloaded
+            objConnection.execute(
+                'CREATE TABLE IF NOT EXISTS fx_coverage ('
+                'pair TEXT NOT NULL, start TEXT NOT NULL, end TEXT NOT NULL, PRIMARY KEY (pair, start))'
+            )
+            objConnection.execute(
+                'CREATE TABLE IF NOT EXISTS fx_pair (pair TEXT PRIMARY KEY, fetched REAL NOT NULL)'
+            )
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide store, configured by the FX_RATE_STORE_PATH and
+        FX_RATE_REFRESH_MINUTES environment variables.
+
+        Returns:
+            CFxRateStore: The shared store.
+        """
+        with CFxRateStore.objDefaultLock:
+            if CFxRateStore.objDefault is None:
+                CFxRateStore.objDefault = CFxRateStore(
+                    strDbPath = os.environ.get('FX_RATE_STORE_PATH', '/tmp/fx_rates.sqlite3'),
+                    iRefreshSeconds = int(float(os.environ.get('FX_RATE_REFRESH_MINUTES', 60)) * 60)
+                )
+            return CFxRateStore.objDefault
+
+    def MGetConnection(self):
+        """
+        Get the connection of this process and its lock. A process forked from the one that opened
+        them (e.g. a batch worker) opens its own, as neither may be used across a fork.
+
+        Returns:
+            tuple: The lock and the sqlite3 connection.
+        """
+        iPid, objLock, objConnection = self.tConnection
+        if iPid != os.getpid():
+            objLock = threading.Lock()
+            objConnection = sqlite3.connect(self.strDbPath, timeout=30, check_same_thread=False)
+            self.tConnection = (os.getpid(), objLock, objConnection)
+        return objLock, objConnection
+
+    @staticmethod
+    def MGetPair(strFromSymbol, strToSymbol):
+        """
+        Returns:
+            str: The key of a currency pair, e.g. 'CADUSD'.
+        """
+        return f'{strFromSymbol.upper()}{strToSymbol.upper()}'
+
+    def MLookup(self, strPair, strStartDate, strEndDate):
+        """
+        Read the stored rates of a date range.
+
+        Args:
+            strPair (str): The currency pair (see MGetPair).
+            strStartDate (str): First date, 'yyyy-mm-dd'.
+            strEndDate (str): Last date, 'yyyy-mm-dd'.
+
+        Returns:
+            dict: 'yyyy-mm-dd' date -> rate, for the dates that have one.
+        """
+        objLock, objConnection = self.MGetConnection()
+        with objLock:
+            liRows = objConnection.execute(
+                'SELECT date, rate FROM fx_rate WHERE pair = ? AND date BETWEEN ? AND ?',
+                (strPair, strStartDate, strEndDate)
+            ).fetchall()
+        return dict(liRows)
+
+    def MGetCoverage(self, strPair):
+        """
+        Returns:
+            tuple: The sorted (start, end) date ranges the downloads of the pair covered, and
+                   the time of its last download (0 if never).
+        """
+        objLock, objConnection = self.MGetConnection()
+        with objLock:
+            liRanges = objConnection.execute(
+                'SELECT start, end FROM fx_coverage WHERE pair = ? ORDER BY start', (strPair,)
+            ).fetchall()
+            objRow = objConnection.execute('SELECT fetched FROM fx_pair WHERE pair = ?', (strPair,)).fetchone()
+        return liRanges, (objRow[0] if objRow else 0.0)
+
+    def MGetMissingDates(self, strPair, strStartDate, strEndDate):
+        """
+        Find the dates of a range no download covered yet. Future dates are never missing, and
+        the dates after the last covered one only once the pair was last downloaded more than
+        iRefreshSeconds ago, and only on weekdays (there is no weekend rate to download).
+
+        Returns:
+            list: The missing 'yyyy-mm-dd' dates, sorted.
+        """
+        liRanges, fFetched = self.MGetCoverage(strPair)
+        strToday = datetime.utcnow().strftime('%Y-%m-%d')
+        strCoveredEnd = liRanges[-1][1] if liRanges else None
+        bRefresh = time.time() - fFetched >= self.iRefreshSeconds
+
+        liMissing = []
+        objDate = datetime.strptime(strStartDate, '%Y-%m-%d')
+        objEndDate = datetime.strptime(min(strEndDate, strToday), '%Y-%m-%d')
+        while objDate <= objEndDate:
+            strDate = objDate.strftime('%Y-%m-%d')
+            if not any(strStart <= strDate <= strEnd for strStart, strEnd in liRanges):
+                if strCoveredEnd is None or strDate < strCoveredEnd or (bRefresh and objDate.weekday() < 5):
+                    liMissing.append(strDate)
+            objDate += timedelta(days=1)
+        return liMissing
+
+    def MStore(self, strPair, dictRates, strCoveredEnd = None):
+        """
+        Store the rates of a download and the date range it covered, merged with the ranges
+        covered before.
+
+        Args:
+            strPair (str): The currency pair.
+            dictRates (dict): 'yyyy-mm-dd' date -> rate, as returned by MFetch.
+            strCoveredEnd (str, optional): The last date the download is known to cover, when later than
+                                           its last rate (e.g. the weekend after the last trading day).
+        """
+        if not dictRates:
+            return
+        objLock, objConnection = self.MGetConnection()
+        with objLock, objConnection:
+            objConnection.executemany(
+                'INSERT OR REPLACE INTO fx_rate (pair, date, rate) VALUES (?, ?, ?)',
+                [(strPair, strDate, fRate) for strDate, fRate in dictRates.items()]
+            )
+            liRanges = objConnection.execute(
+                'SELECT start, end FROM fx_coverage WHERE pair = ?', (strPair,)
+            ).fetchall()
+            liRanges.append((min(dictRates), max(max(dictRates), strCoveredEnd or '')))
+
+            # Merge the overlapping and adjacent ranges
+            liMerged = []
+            for strStart, strEnd in sorted(liRanges):
+                if liMerged:
+                    strNext = (datetime.strptime(liMerged[-1][1], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+                    if strStart <= strNext:
+                        liMerged[-1] = (liMerged[-1][0], max(liMerged[-1][1], strEnd))
+                        continue
+                liMerged.append((strStart, strEnd))
+
+            objConnection.execute('DELETE FROM fx_coverage WHERE pair = ?', (strPair,))
+            objConnection.executemany(
+                'INSERT INTO fx_coverage (pair, start, end) VALUES (?, ?, ?)',
+                [(strPair, strStart, strEnd) for strStart, strEnd in liMerged]
+            )
+            objConnection.execute(
+                'INSERT OR REPLACE INTO fx_pair (pair, fetched) VALUES (?, ?)', (strPair, time.time())
+            )
+
+    @staticmethod
+    def MGetCoveredEnd(dictRates, strEndDate):
+        """
+        Get the last date of a requested range a download covers. A download whose last rate is
+        on or after the last weekday of the range (up to today) covers the whole range, so the
+        weekend or holiday dates at its end are not downloaded again at every refresh.
+
+        Args:
+            dictRates (dict): 'yyyy-mm-dd' date -> rate, as returned by MFetch.
+            strEndDate (str): Last date of the requested range, 'yyyy-mm-dd'.
+
+        Returns:
+            str: The covered end date, or None if the download stops before the last weekday.
+        """
+        objEndDate = datetime.strptime(min(strEndDate, datetime.utcnow().strftime('%Y-%m-%d')), '%Y-%m-%d')
+        objLastWeekday = objEndDate
+        while objLastWeekday.weekday() >= 5:
+            objLastWeekday -= timedelta(days=1)
+        if dictRates and max(dictRates) >= objLastWeekday.strftime('%Y-%m-%d'):
+            return objEndDate.strftime('%Y-%m-%d')
+        return None
+
+    def MFetch(self, strFromSymbol, strToSymbol, strApiKey, bFull = False, objBudget = None):
+        """
+        Download the daily close rates of a currency pair.
+
+        Args:
+            strFromSymbol (str): The currency converted from, e.g. 'CAD'.
+            strToSymbol (str): The currency converted to, e.g. 'USD'.
+            strApiKey (str): The Alpha Vantage API key.
+            bFull (bool): If True, download the full history instead of the last 100 trading days.
+            objBudget (CRequestBudget, optional): Time budget of the request, caps the read timeout.
+
+        Returns:
+            dict: 'yyyy-mm-dd' date -> rate.
+
+        Raises:
+            CFxRateError: If the response holds no rate series.
+        """
+        dictParams = {
+            'function': 'FX_DAILY', 'from_symbol': strFromSymbol, 'to_symbol': strToSymbol,
+            'outputsize': 'full' if bFull else 'compact', 'apikey': strApiKey
+        }
+        objHttpClient = CHttpClient.MGetDefault()
+        if objBudget is not None:
+            response = objHttpClient.MGet(CFxRateStore.strApiUrl, params=dictParams, timeout=(objHttpClient.fConnectTimeout, objBudget.MCapTimeout(objHttpClient.fReadTimeout)))
+        else:
+            response = objHttpClient.MGet(CFxRateStore.strApiUrl, params=dictParams)
+        data = response.json()
+
+        timeSeries = data.get("Time Series FX (Daily)")
+        if not timeSeries:
+            # Rate limits and bad keys come back as 200 with a 'Note', 'Information' or 'Error Message'
+            strMessage = data.get('Note') or data.get('Information') or data.get('Error Message') or f'HTTP {response.status_code}'
+            raise CFxRateError(f'No {strFromSymbol}/{strToSymbol} rates returned: {strMessage}')
+        return {strDate: float(dictValues['4. close']) for strDate, dictValues in timeSeries.items()}
+
+    def MGetRates(self, strFromSymbol, strToSymbol, strStartDate, strEndDate, strApiKey, objBudget = None):
+        """
+        Get the rates of a date range, downloading only the dates missing from the store. If
+        the download fails, the stored rates are returned as long as the store has some.
+
+        Args:
+            strFromSymbol (str): The currency converted from, e.g. 'CAD'.
+            strToSymbol (str): The currency converted to, e.g. 'USD'.
+            strStartDate (str): First date, 'yyyy-mm-dd'.
+            strEndDate (str): Last date, 'yyyy-mm-dd'.
+            strApiKey (str): The Alpha Vantage API key.
+            objBudget (CRequestBudget, optional): Time budget of the request.
+
+        Returns:
+            dict: 'yyyy-mm-dd' date -> rate, for the trading days of the range.
+
+        Raises:
+            CFxRateError, requests.RequestException: If the download failed and the store has no rate of the range.
+        """
+        strPair = CFxRateStore.MGetPair(strFromSymbol, strToSymbol)
+        liMissing = self.MGetMissingDates(strPair, strStartDate, strEndDate)
+        if liMissing:
+            bFull = liMissing[0] < (datetime.utcnow() - timedelta(days=CFxRateStore.iCompactDays)).strftime('%Y-%m-%d')
+            try:
+                dictFetched = self.MFetch(strFromSymbol, strToSymbol, strApiKey, bFull, objBudget)
+                self.MStore(strPair, dictFetched, CFxRateStore.MGetCoveredEnd(dictFetched, strEndDate))
+                objLogger.logInfo(f'Downloaded the {strPair} rates ({"full" if bFull else "compact"}) for {len(liMissing)} missing dates')
+            except Exception as e:
+                dictRates = self.MLookup(strPair, strStartDate, strEndDate)
+                if not dictRates:
+                    raise
+                objLogger.logError(f'Could not download the {strPair} rates, using the stored ones: {e}')
+                return dictRates
+        return self.MLookup(strPair, strStartDate, strEndDate)
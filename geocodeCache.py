@@ -0,0 +1,145 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from logUtility import CLogUtility
+
+objLogger = CLogUtility()
+
+class CGeocodeCache:
+    """
+    Persistent SQLite cache of the Nominatim lookups, keyed by the normalized (city, state code).
+    Resolved places are kept for iTtlSeconds, places Nominatim did not find for the shorter
+    iNegativeTtlSeconds. Errors (timeouts, HTTP failures) are never cached.
+
+    Methods:
+        - MGetDefault
+        - MGetConnection
+        - MNormalizeKey
+        - MGet
+        - MPut
+        - MPurgeExpired
+    """
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    def __init__(self, strDbPath = '/tmp/geocode_cache.sqlite3', iTtlSeconds = 90 * 24 * 3600, iNegativeTtlSeconds = 24 * 3600):
+        self.strDbPath = strDbPath
+        self.iTtlSeconds = iTtlSeconds
+        self.iNegativeTtlSeconds = iNegativeTtlSeconds
+        strFolder = os.path.dirname(strDbPath)
+        if strFolder:
+            os.makedirs(strFolder, exist_ok=True)
+        # (pid, lock, connection): one connection shared by the geocoding threads of a process, serialized by the lock
+        self.tConnection = (None, None, None)
+        objLock, objConnection = self.MGetConnection()
+        with objLock, objConnection:
+            # WAL lets the batch worker processes read while one of them writes
+            objConnection.execute('PRAGMA journal_mode=WAL')
+            objConnection.execute(
+                'CREATE TABLE IF NOT EXISTS geocode ('
+                'city TEXT NOT NULL, state_code TEXT NOT NULL, country TEXT, state TEXT, '
+                'found INTEGER NOT NULL, expires REAL NOT NULL, PRIMARY KEY (city, state_code))'
+            )
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide cache, configured by the GEOCODE_CACHE_PATH, GEOCODE_CACHE_TTL_DAYS
+        and GEOCODE_CACHE_NEGATIVE_TTL_HOURS environment variables.
+
+        Returns:
+            CGeocodeCache: The shared cache instance.
+        """
+        with CGeocodeCache.objDefaultLock:
+            if CGeocodeCache.objDefault is None:
+                CGeocodeCache.objDefault = CGeocodeCache(
+                    strDbPath = os.environ.get('GEOCODE_CACHE_PATH', '/tmp/geocode_cache.sqlite3'),
+                    iTtlSeconds = int(float(os.environ.get('GEOCODE_CACHE_TTL_DAYS', 90)) * 24 * 3600),
+                    iNegativeTtlSeconds = int(float(os.environ.get('GEOCODE_CACHE_NEGATIVE_TTL_HOURS', 24)) * 3600)
+                )
+            return CGeocodeCache.objDefault
+
+    def MGetConnection(self):
+        """
+        Get the connection of this process and its lock. A process forked from the one that opened
+        them (e.g. a batch worker) opens its own, as neither may be used across a fork.
+
+        Returns:
+            tuple: The lock and the sqlite3 connection.
+        """
+        iPid, objLock, objConnection = self.tConnection
+        if iPid != os.getpid():
+            objLock = threading.Lock()
+            objConnection = sqlite3.connect(self.strDbPath, timeout=30, check_same_thread=False)
+            self.tConnection = (os.getpid(), objLock, objConnection)
+        return objLock, objConnection
+
+    @staticmethod
+    def MNormalizeKey(city, state_code):
+        """
+        Normalize a (city, state code) pair, so 'new york ', 'NY' and 'New  York', 'ny' share an entry.
+
+        Returns:
+            tuple: The normalized (city, state code).
+        """
+        city = re.sub(r'\s+', ' ', str(city or '')).strip().casefold()
+        state_code = re.sub(r'\s+', ' ', str(state_code or '')).strip().upper()
+        return city, state_code
+
+    def MGet(self, city, state_code):
+        """
+        Look up a (city, state code) pair.
+
+        Returns:
+            tuple: (bHit, tResult). tResult is the cached (country, state), or None for a cached
+                   'not found'. bHit is False when the pair is not cached or has expired.
+        """
+        try:
+            objLock, objConnection = self.MGetConnection()
+            with objLock:
+                objRow = objConnection.execute(
+                    'SELECT country, state, found FROM geocode WHERE city = ? AND state_code = ? AND expires > ?',
+                    (*CGeocodeCache.MNormalizeKey(city, state_code), time.time())
+                ).fetchone()
+        except sqlite3.Error as e:
+            objLogger.logError(f'Geocode cache read failed: {e}')
+            return False, None
+        if objRow is None:
+            return False, None
+        return True, ((objRow[0], objRow[1]) if objRow[2] else None)
+
+    def MPut(self, city, state_code, tResult):
+        """
+        Store the result of a lookup.
+
+        Args:
+            city (str): The city name.
+            state_code (str): The state code.
+            tResult (tuple): The resolved (country, state), or None if the place was not found.
+        """
+        bFound = tResult is not None
+        fExpires = time.time() + (self.iTtlSeconds if bFound else self.iNegativeTtlSeconds)
+        country, state = tResult if bFound else (None, None)
+        try:
+            objLock, objConnection = self.MGetConnection()
+            with objLock, objConnection:
+                objConnection.execute(
+                    'INSERT OR REPLACE INTO geocode (city, state_code, country, state, found, expires) VALUES (?, ?, ?, ?, ?, ?)',
+                    (*CGeocodeCache.MNormalizeKey(city, state_code), country, state, int(bFound), fExpires)
+                )
+        except sqlite3.Error as e:
+            objLogger.logError(f'Geocode cache write failed: {e}')
+
+    def MPurgeExpired(self):
+        """
+        Delete the expired entries.
+
+        Returns:
+            int: Number of deleted entries.
+        """
+        objLock, objConnection = self.MGetConnection()
+        with objLock, objConnection:
+            return objConnection.execute('DELETE FROM geocode WHERE expires <= ?', (time.time(),)).rowcount
@@ -0,0 +1,198 @@
+import os
+import re
+import abc
+import csv
+import threading
+import unicodedata
+import pycountry
+from logUtility import CLogUtility
+from geocodeCache import CGeocodeCache
+from asyncGeocoder import CAsyncGeocoder, CGeocodingError
+from subdivisionIndex import CSubdivisionIndex
+
+objLogger = CLogUtility()
+
+class CGeocoderBackend(abc.ABC):
+    """
+    Interface of the geocoding backends used by CAmzB2CHelperFunc.MGetCountryAndState.
+    The backends must implement MResolve.
+
+    Methods:
+        - MNormalizeName
+        - MResolve
+    """
+
+    strName = 'base'
+
+    @staticmethod
+    def MNormalizeName(strValue):
+        """
+        Normalize a place name for matching: accents stripped, case folded, punctuation and
+        repeated whitespace collapsed, so 'SAINT-BRUNO', 'Saint Bruno' and 'saint  bruno' match.
+
+        Returns:
+            str: The normalized name, '' for missing values.
+        """
+        if not isinstance(strValue, str):
+            return ''
+        strValue = unicodedata.normalize('NFKD', strValue)
+        strValue = ''.join(ch for ch in strValue if not unicodedata.combining(ch)).casefold()
+        strValue = re.sub(r"[.,'’`\-_/()]+", ' ', strValue)
+        return re.sub(r'\s+', ' ', strValue).strip()
+
+    @abc.abstractmethod
+    def MResolve(self, city, state_code, objBudget = None):
+        """
+        Resolve a city and state code of a report.
+
+        Args:
+            city (str): The city name.
+            state_code (str): The state code or name, may be empty.
+            objBudget (CRequestBudget, optional): Time budget of the request, limits the online backends.
+
+        Returns:
+            tuple: The country and the state name, or None if the backend does not know the place.
+
+        Raises:
+            CGeocodingError: If the backend could not answer (e.g. network failure), so the answer must not be cached.
+        """
+
+
+class CGazetteerBackend(CGeocoderBackend):
+    """
+    Offline backend. States resolve with the subdivision index of the marketplace countries,
+    then by normalized name among the subdivisions of all the countries (names found in several
+    countries are left out), and cities without a usable state with the bundled city list
+    data/gazetteerCities.csv ('city,subdivision' rows, e.g. 'Toronto,CA-ON'; cities listed
+    more than once are left out).
+
+    Methods:
+        - MResolve
+    """
+
+    strName = 'gazetteer'
+
+    def __init__(self, strCitiesPath = None):
+        self.strCitiesPath = strCitiesPath or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteerCities.csv')
+
+        # Normalized subdivision name -> (country name, state name), None for names found in several countries
+        self.dictStates = {}
+        for subdivision in pycountry.subdivisions:
+            strKey = CGeocoderBackend.MNormalizeName(subdivision.name)
+            tNames = (pycountry.countries.get(alpha_2=subdivision.country_code).name, subdivision.name)
+            self.dictStates[strKey] = tNames if self.dictStates.get(strKey, tNames) == tNames else None
+
+        # Normalized city -> (country name, state name), None for cities listed more than once
+        self.dictCities = {}
+        with open(self.strCitiesPath, newline='', encoding='utf-8') as f:
+            for dictRow in csv.DictReader(f):
+                subdivision = pycountry.subdivisions.get(code=dictRow['subdivision'])
+                tNames = (pycountry.countries.get(alpha_2=subdivision.country_code).name, subdivision.name)
+                strCity = CGeocoderBackend.MNormalizeName(dictRow['city'])
+                self.dictCities[strCity] = tNames if strCity not in self.dictCities else None
+
+    def MResolve(self, city, state_code, objBudget = None):
+        # Subdivision codes and exact names of the US, CA and MX states
+        country, state = CSubdivisionIndex.MGetDefault().MLookup(state_code)
+        if country is not None:
+            return country, state
+
+        # Accent, case and punctuation insensitive names, e.g. 'Quebec' for 'Québec'
+        strState = CGeocoderBackend.MNormalizeName(state_code)
+        if strState:
+            tNames = self.dictStates.get(strState)
+            if tNames is not None:
+                return tNames
+
+        # The state is missing or unknown, fall back to the city alone
+        return self.dictCities.get(CGeocoderBackend.MNormalizeName(city))
+
+
+class CNominatimBackend(CGeocoderBackend):
+    """
+    Online backend, the Nominatim search API through the rate limited CAsyncGeocoder, with
+    the answers (including 'not found') kept in the persistent CGeocodeCache.
+
+    Methods:
+        - MResolve
+    """
+
+    strName = 'nominatim'
+
+    def MResolve(self, city, state_code, objBudget = None):
+        objGeocodeCache = CGeocodeCache.MGetDefault()
+        bHit, tResult = objGeocodeCache.MGet(city, state_code)
+        if bHit:
+            return tResult
+
+        # Failures raise CGeocodingError (or the error of the request) and are not cached
+        fDeadlineSeconds = None
+        if objBudget is not None:
+            fDeadlineSeconds = min(objBudget.MGetNetworkSeconds(), CAsyncGeocoder.MGetDefault().fDeadlineSeconds)
+            if fDeadlineSeconds <= 0:
+                # Only the reserve of the request is left, resolve offline only
+                objBudget.MFlagDegraded(city, state_code)
+                raise CGeocodingError('Request budget spent, skipped the online lookup')
+        try:
+            data = CAsyncGeocoder.MGetDefault().MSearch(f"{city}, {state_code}", fDeadlineSeconds)
+        except Exception:
+            if objBudget is not None:
+                objBudget.MFlagDegraded(city, state_code)
+            raise
+
+        tResult = None
+        if data and len(data) > 0:
+            # Extract country and state from the display name, e.g. 'Toronto, Ontario, Canada'
+            parts = [part.strip() for part in data[0]["display_name"].split(",")]
+            tResult = (parts[-1], parts[1] if len(parts) > 1 else None)
+        objGeocodeCache.MPut(city, state_code, tResult)
+        return tResult
+
+
+class CGeocoderChain(CGeocoderBackend):
+    """
+    Backends tried in order until one knows the place. A backend that fails is logged and
+    skipped.
+
+    Methods:
+        - MGetDefault
+        - MResolve
+    """
+
+    strName = 'chain'
+
+    # Backend name -> class, for the GEOCODER_BACKENDS environment variable
+    dictBackends = {'gazetteer': CGazetteerBackend, 'nominatim': CNominatimBackend}
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    def __init__(self, liBackends):
+        self.liBackends = liBackends
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide chain, configured by the GEOCODER_BACKENDS environment variable:
+        comma separated backend names, 'gazetteer,nominatim' by default. Set it to 'gazetteer'
+        to process the reports without any network call.
+
+        Returns:
+            CGeocoderChain: The shared chain.
+        """
+        with CGeocoderChain.objDefaultLock:
+            if CGeocoderChain.objDefault is None:
+                liNames = [s.strip().lower() for s in os.environ.get('GEOCODER_BACKENDS', 'gazetteer,nominatim').split(',') if s.strip()]
+                CGeocoderChain.objDefault = CGeocoderChain([CGeocoderChain.dictBackends[strName]() for strName in liNames])
+            return CGeocoderChain.objDefault
+
+    def MResolve(self, city, state_code, objBudget = None):
+        for objBackend in self.liBackends:
+            try:
+                tResult = objBackend.MResolve(city, state_code, objBudget)
+            except Exception as e:
+                print(f"Error occurred during geocoding ({objBackend.strName}): {e}")
+                continue
+            if tResult is not None:
+                return tResult
+        return None
@@ -0,0 +1,196 @@
+import os
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from logUtility import CLogUtility
+
+objLogger = CLogUtility()
+
+class CHttpClient:
+    """
+    Shared HTTP client for all the outbound calls (Alpha Vantage, Nominatim). It keeps one
+    pooled keep-alive session per host, applies default connect and read timeouts, retries
+    the idempotent requests on connection errors, timeouts, 429 and 5xx with jittered
+    exponential backoff, and counts the requests and latency of each host. No retry waits
+    longer than fMaxBackoffSeconds: when a server asks for more with Retry-After, its
+    response is returned as it is.
+
+    Methods:
+        - MGetDefault
+        - MGetSession
+        - MRequest
+        - MGetBackoff
+        - MGet
+        - MRecord
+        - MGetStats
+    """
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    # Methods that can be sent again without side effects
+    setIdempotentMethods = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+    # Statuses worth retrying
+    setRetryStatuses = {429, 500, 502, 503, 504}
+
+    def __init__(self, fConnectTimeout = 5.0, fReadTimeout = 30.0, iMaxRetries = 2, fBackoffSeconds = 0.5, iPoolSize = 10, fMaxBackoffSeconds = 10.0):
+        self.fConnectTimeout = fConnectTimeout
+        self.fReadTimeout = fReadTimeout
+        self.iMaxRetries = iMaxRetries
+        self.fBackoffSeconds = fBackoffSeconds
+        self.fMaxBackoffSeconds = fMaxBackoffSeconds
+        self.iPoolSize = iPoolSize
+        self.objLock = threading.Lock()
+        # 'scheme://host' -> session, rebuilt in a forked process (sockets must not be shared)
+        self.dictSessions = {}
+        self.iPid = os.getpid()
+        # 'host' -> counters
+        self.dictStats = {}
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide client, configured by the HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT,
+        HTTP_MAX_RETRIES and HTTP_MAX_BACKOFF_SECONDS environment variables.
+
+        Returns:
+            CHttpClient: The shared client.
+        """
+        with CHttpClient.objDefaultLock:
+            if CHttpClient.objDefault is None:
+                CHttpClient.objDefault = CHttpClient(
+                    fConnectTimeout = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5.0)),
+                    fReadTimeout = float(os.environ.get('HTTP_READ_TIMEOUT', 30.0)),
+                    iMaxRetries = int(os.environ.get('HTTP_MAX_RETRIES', 2)),
+                    fMaxBackoffSeconds = float(os.environ.get('HTTP_MAX_BACKOFF_SECONDS', 10.0))
+                )
+            return CHttpClient.objDefault
+
+    def MGetSession(self, strUrl):
+        """
+        Get the pooled session of the host of a URL.
+
+        Returns:
+            requests.Session: The session.
+        """
+        objUrl = urlsplit(strUrl)
+        strOrigin = f'{objUrl.scheme}://{objUrl.netloc}'
+        with self.objLock:
+            if self.iPid != os.getpid():
+                self.dictSessions = {}
+                self.iPid = os.getpid()
+            objSession = self.dictSessions.get(strOrigin)
+            if objSession is None:
+                objSession = requests.Session()
+                # Retries are done by MRequest, with backoff and counters
+                objAdapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.iPoolSize, max_retries=0)
+                objSession.mount(f'{objUrl.scheme}://', objAdapter)
+                self.dictSessions[strOrigin] = objSession
+            return objSession
+
+    def MRequest(self, strMethod, strUrl, iMaxRetries = None, **kwargs):
+        """
+        Send a request through the session of its host.
+
+        Args:
+            strMethod (str): The HTTP method.
+            strUrl (str): The URL.
+            iMaxRetries (int, optional): Retries of an idempotent request, by default iMaxRetries. Non idempotent requests are never retried.
+            **kwargs: Passed to requests, 'timeout' defaults to (fConnectTimeout, fReadTimeout).
+
+        Returns:
+            requests.Response: The response, also for error statuses once the retries are spent or
+                               when the Retry-After of the server is longer than fMaxBackoffSeconds.
+
+        Raises:
+            requests.RequestException: If the last attempt failed to connect or timed out.
+        """
+        strMethod = strMethod.upper()
+        kwargs.setdefault('timeout', (self.fConnectTimeout, self.fReadTimeout))
+        if strMethod not in CHttpClient.setIdempotentMethods:
+            iMaxRetries = 0
+        elif iMaxRetries is None:
+            iMaxRetries = self.iMaxRetries
+        strHost = urlsplit(strUrl).netloc
+        objSession = self.MGetSession(strUrl)
+
+        for iAttempt in range(iMaxRetries + 1):
+            fStart = time.perf_counter()
+            try:
+                response = objSession.request(strMethod, strUrl, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.MRecord(strHost, time.perf_counter() - fStart, bError=True, bRetry=iAttempt < iMaxRetries)
+                if iAttempt == iMaxRetries:
+                    raise
+                objLogger.logError(f'{strMethod} {strHost} failed ({type(e).__name__}), retrying')
+                fWait = self.MGetBackoff(iAttempt)
+            else:
+                fWait = None
+                if response.status_code in CHttpClient.setRetryStatuses and iAttempt < iMaxRetries:
+                    fWait = self.MGetBackoff(iAttempt, response.headers.get('Retry-After'))
+                    if fWait is None:
+                        objLogger.logError(f'{strMethod} {strHost} asked to retry after {response.headers.get("Retry-After")}s, over the {self.fMaxBackoffSeconds}s limit')
+                self.MRecord(strHost, time.perf_counter() - fStart, bError=response.status_code >= 400, bRetry=fWait is not None)
+                if fWait is None:
+                    return response
+                response.close()
+            time.sleep(fWait)
+
+    def MGetBackoff(self, iAttempt, strRetryAfter = None):
+        """
+        Get the wait before the next attempt: exponential backoff with full jitter, at least what
+        the server asked for in its Retry-After header, and at most fMaxBackoffSeconds.
+
+        Args:
+            iAttempt (int): The attempt that failed, from 0.
+            strRetryAfter (str, optional): The Retry-After header of the response, in seconds.
+
+        Returns:
+            float: The seconds to wait, or None if the server asked for more than fMaxBackoffSeconds.
+        """
+        try:
+            fRetryAfter = float(strRetryAfter)
+        except (TypeError, ValueError):
+            fRetryAfter = 0.0
+        if fRetryAfter > self.fMaxBackoffSeconds:
+            return None
+        fJitter = random.uniform(0, min(self.fBackoffSeconds * 2 ** iAttempt, self.fMaxBackoffSeconds))
+        return max(fJitter, fRetryAfter)
+
+    def MGet(self, strUrl, **kwargs):
+        """
+        Send a GET request, see MRequest.
+        """
+        return self.MRequest('GET', strUrl, **kwargs)
+
+    def MRecord(self, strHost, fSeconds, bError = False, bRetry = False):
+        """
+        Add one attempt to the counters of a host.
+        """
+        with self.objLock:
+            dictHost = self.dictStats.setdefault(strHost, {'requests': 0, 'errors': 0, 'retries': 0, 'totalSeconds': 0.0, 'maxSeconds': 0.0})
+            dictHost['requests'] += 1
+            dictHost['errors'] += int(bError)
+            dictHost['retries'] += int(bRetry)
+            dictHost['totalSeconds'] += fSeconds
+            dictHost['maxSeconds'] = max(dictHost['maxSeconds'], fSeconds)
+
+    def MGetStats(self):
+        """
+        Returns:
+            dict: Host -> requests, errors, retries, mean and max latency in milliseconds.
+        """
+        with self.objLock:
+            return {
+                strHost: {
+                    'requests': dictHost['requests'],
+                    'errors': dictHost['errors'],
+                    'retries': dictHost['retries'],
+                    'meanMs': round(1000 * dictHost['totalSeconds'] / dictHost['requests'], 1),
+                    'maxMs': round(1000 * dictHost['maxSeconds'], 1),
+                }
+                for strHost, dictHost in self.dictStats.items()
+            }
@@ -0,0 +1,127 @@
+import os
+import csv
+import time
+import difflib
+import threading
+from logUtility import CLogUtility
+from geocoderBackends import CGeocoderBackend
+
+objLogger = CLogUtility()
+
+class CLocationOverrides:
+    """
+    Table of the report locations that no backend resolves right (foreign addresses, typos),
+    loaded from data/locationOverrides.csv ('city,state,country,state_name' rows, an empty
+    state matches any state). Entries are keyed by the normalized city and state (see
+    CGeocoderBackend.MNormalizeName). The file is reloaded when it changes, so a new
+    exception needs no redeploy.
+
+    Methods:
+        - MGetDefault
+        - MLoad
+        - MReloadIfChanged
+        - MLookup
+    """
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    def __init__(self, strPath = None, fFuzzyCutoff = None, fReloadSeconds = 5.0):
+        self.strPath = strPath or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'locationOverrides.csv')
+        # Similarity (0 to 1, see difflib) above which a city with a typo matches an entry, None to match exactly only
+        self.fFuzzyCutoff = fFuzzyCutoff
+        # The file modification time is checked at most this often
+        self.fReloadSeconds = fReloadSeconds
+        self.objLock = threading.Lock()
+        self.fMtime = None
+        self.fChecked = 0.0
+        # (normalized city, normalized state or '') -> (country, state name)
+        self.dictEntries = {}
+        # normalized state or '' -> normalized cities, for the fuzzy matching
+        self.dictCitiesByState = {}
+        self.MLoad()
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide table, configured by the LOCATION_OVERRIDES_PATH and
+        LOCATION_OVERRIDES_FUZZY_CUTOFF (e.g. 0.9, unset for exact matching) environment variables.
+
+        Returns:
+            CLocationOverrides: The shared table.
+        """
+        with CLocationOverrides.objDefaultLock:
+            if CLocationOverrides.objDefault is None:
+                strCutoff = os.environ.get('LOCATION_OVERRIDES_FUZZY_CUTOFF')
+                CLocationOverrides.objDefault = CLocationOverrides(
+                    strPath = os.environ.get('LOCATION_OVERRIDES_PATH'),
+                    fFuzzyCutoff = float(strCutoff) if strCutoff else None
+                )
+            return CLocationOverrides.objDefault
+
+    def MLoad(self):
+        """
+        (Re)load the table. If the file cannot be read, the previous entries are kept.
+        """
+        try:
+            fMtime = os.path.getmtime(self.strPath)
+            dictEntries = {}
+            dictCitiesByState = {}
+            with open(self.strPath, newline='', encoding='utf-8') as f:
+                for dictRow in csv.DictReader(f):
+                    strCity = CGeocoderBackend.MNormalizeName(dictRow['city'])
+                    strState = CGeocoderBackend.MNormalizeName(dictRow.get('state'))
+                    dictEntries[(strCity, strState)] = (dictRow['country'].strip(), dictRow['state_name'].strip())
+                    dictCitiesByState.setdefault(strState, []).append(strCity)
+        except (OSError, KeyError, csv.Error) as e:
+            objLogger.logError(f'Could not load the location overrides {self.strPath}: {e}')
+            return
+        with self.objLock:
+            self.dictEntries = dictEntries
+            self.dictCitiesByState = dictCitiesByState
+            self.fMtime = fMtime
+        objLogger.logInfo(f'Loaded {len(dictEntries)} location overrides from {self.strPath}')
+
+    def MReloadIfChanged(self):
+        """
+        Reload the table if the file changed since it was loaded, checking at most every fReloadSeconds.
+        """
+        fNow = time.monotonic()
+        if fNow - self.fChecked < self.fReloadSeconds:
+            return
+        self.fChecked = fNow
+        try:
+            bChanged = os.path.getmtime(self.strPath) != self.fMtime
+        except OSError:
+            return
+        if bChanged:
+            self.MLoad()
+
+    def MLookup(self, city, state_code):
+        """
+        Look up a city and state code of a report: the entry of the state first, then the
+        entry valid for any state, then (if enabled) the closest city of those entries.
+
+        Args:
+            city (str): The city name.
+            state_code (str): The state code or name.
+
+        Returns:
+            tuple: The country and state name, or None if the location has no override.
+        """
+        self.MReloadIfChanged()
+        strCity = CGeocoderBackend.MNormalizeName(city)
+        strState = CGeocoderBackend.MNormalizeName(state_code)
+        with self.objLock:
+            dictEntries = self.dictEntries
+            dictCitiesByState = self.dictCitiesByState
+        for strKeyState in (strState, ''):
+            tResult = dictEntries.get((strCity, strKeyState))
+            if tResult is not None:
+                return tResult
+        if self.fFuzzyCutoff is not None and strCity:
+            for strKeyState in (strState, ''):
+                liMatches = difflib.get_close_matches(strCity, dictCitiesByState.get(strKeyState, []), n=1, cutoff=self.fFuzzyCutoff)
+                if liMatches:
+                    return dictEntries[(liMatches[0], strKeyState)]
+        return None
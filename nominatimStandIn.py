@@ -0,0 +1,133 @@
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from subdivisionIndex import CSubdivisionIndex
+
+class CNominatimStandIn:
+    """
+    Local stand-in for the Nominatim search API, to test and benchmark the geocoding engine
+    without hitting the public server. '/search?q=<city>, <state>&format=json' answers like
+    Nominatim with a 'display_name' of '<city>, <state name>, <country>' when the state resolves
+    with the subdivision index (or is in dictPlaces), and [] otherwise. It can add latency and
+    enforce a rate limit with 429 responses, like the public server.
+
+    Start it with 'python nominatimStandIn.py --port 8088' and set NOMINATIM_URL=http://127.0.0.1:8088.
+
+    Methods:
+        - MStart
+        - MStop
+        - MSearch
+        - MGetStats
+    """
+
+    def __init__(self, iPort = 0, fLatencySeconds = 0.0, fRatePerSecond = None, dictPlaces = None):
+        self.iPort = iPort
+        self.fLatencySeconds = fLatencySeconds
+        # Requests above this rate are answered with 429, None for no limit
+        self.fRatePerSecond = fRatePerSecond
+        # Extra places, lower case query -> display name
+        self.dictPlaces = {k.lower(): v for k, v in (dictPlaces or {}).items()}
+        self.objLock = threading.Lock()
+        self.fNextAllowed = 0.0
+        self.dictStats = {'requests': 0, 'throttled': 0, 'inFlight': 0, 'maxInFlight': 0}
+        self.objServer = None
+
+    def MStart(self):
+        """
+        Start serving in a background thread.
+
+        Returns:
+            str: The base URL of the server.
+        """
+        objStandIn = self
+
+        class CHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                objUrl = urlparse(self.path)
+                if objUrl.path != '/search':
+                    self.send_error(404)
+                    return
+                strQuery = parse_qs(objUrl.query).get('q', [''])[0]
+                iStatus, liPlaces = objStandIn.MSearch(strQuery)
+                bBody = json.dumps(liPlaces if iStatus == 200 else {'error': 'Too many requests'}).encode('utf-8')
+                self.send_response(iStatus)
+                self.send_header('Content-Type', 'application/json')
+                if iStatus == 429:
+                    self.send_header('Retry-After', '1')
+                self.send_header('Content-Length', str(len(bBody)))
+                self.end_headers()
+                self.wfile.write(bBody)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.objServer = ThreadingHTTPServer(('127.0.0.1', self.iPort), CHandler)
+        self.objServer.daemon_threads = True
+        threading.Thread(target=self.objServer.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self.objServer.server_address[1]}'
+
+    def MStop(self):
+        """
+        Stop the server.
+        """
+        if self.objServer is not None:
+            self.objServer.shutdown()
+            self.objServer.server_close()
+            self.objServer = None
+
+    def MSearch(self, strQuery):
+        """
+        Answer a search query.
+
+        Returns:
+            tuple: The HTTP status and the list of places.
+        """
+        with self.objLock:
+            self.dictStats['requests'] += 1
+            fNow = time.monotonic()
+            if self.fRatePerSecond:
+                if fNow < self.fNextAllowed:
+                    self.dictStats['throttled'] += 1
+                    return 429, []
+                self.fNextAllowed = fNow + 1 / self.fRatePerSecond
+            self.dictStats['inFlight'] += 1
+            self.dictStats['maxInFlight'] = max(self.dictStats['maxInFlight'], self.dictStats['inFlight'])
+        try:
+            if self.fLatencySeconds:
+                time.sleep(self.fLatencySeconds)
+            strDisplayName = self.dictPlaces.get(strQuery.strip().lower())
+            if strDisplayName is None:
+                city, _, state_code = strQuery.rpartition(',')
+                country, state = CSubdivisionIndex.MGetDefault().MLookup(state_code)
+                if city.strip() and country is not None:
+                    strDisplayName = f'{city.strip()}, {state}, {country}'
+            return 200, ([{'display_name': strDisplayName}] if strDisplayName else [])
+        finally:
+            with self.objLock:
+                self.dictStats['inFlight'] -= 1
+
+    def MGetStats(self):
+        """
+        Returns:
+            dict: Counters of requests, throttled requests and the peak number of requests in flight.
+        """
+        with self.objLock:
+            return dict(self.dictStats)
+
+
+if __name__ == '__main__':
+    objParser = argparse.ArgumentParser(description='Local stand-in for the Nominatim search API')
+    objParser.add_argument('--port', type=int, default=8088)
+    objParser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    objParser.add_argument('--rate', type=float, default=None, help='Requests per second above which 429 is returned')
+    args = objParser.parse_args()
+
+    objStandIn = CNominatimStandIn(iPort=args.port, fLatencySeconds=args.latency, fRatePerSecond=args.rate)
+    print(f'Serving the Nominatim stand-in on {objStandIn.MStart()}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        objStandIn.MStop()
@@ -0,0 +1,172 @@
+import threading
+import numpy as np
+import pandas as pd
+import pycountry
+
+# US ZIP3 ranges (first 3 digits of the ZIP code, inclusive) -> state. The military (AA, AE, AP)
+# and Pacific island prefixes are left out, those rows fall back to the city based geocoding.
+liUsZip3Ranges = [
+    (5, 5, 'NY'), (6, 7, 'PR'), (8, 8, 'VI'), (9, 9, 'PR'), (10, 27, 'MA'), (28, 29, 'RI'),
+    (30, 38, 'NH'), (39, 49, 'ME'), (50, 54, 'VT'), (55, 55, 'MA'), (56, 59, 'VT'), (60, 69, 'CT'),
+    (70, 89, 'NJ'), (100, 149, 'NY'), (150, 196, 'PA'), (197, 199, 'DE'), (200, 200, 'DC'),
+    (201, 201, 'VA'), (202, 205, 'DC'), (206, 219, 'MD'), (220, 246, 'VA'), (247, 268, 'WV'),
+    (270, 289, 'NC'), (290, 299, 'SC'), (300, 319, 'GA'), (320, 339, 'FL'), (341, 349, 'FL'),
+    (350, 369, 'AL'), (370, 385, 'TN'), (386, 397, 'MS'), (398, 399, 'GA'), (400, 427, 'KY'),
+    (430, 459, 'OH'), (460, 479, 'IN'), (480, 499, 'MI'), (500, 528, 'IA'), (530, 549, 'WI'),
+    (550, 567, 'MN'), (569, 569, 'DC'), (570, 577, 'SD'), (580, 588, 'ND'), (590, 599, 'MT'),
+    (600, 629, 'IL'), (630, 658, 'MO'), (660, 679, 'KS'), (680, 693, 'NE'), (700, 714, 'LA'),
+    (716, 729, 'AR'), (730, 732, 'OK'), (733, 733, 'TX'), (734, 749, 'OK'), (750, 799, 'TX'),
+    (800, 816, 'CO'), (820, 831, 'WY'), (832, 838, 'ID'), (840, 847, 'UT'), (850, 865, 'AZ'),
+    (870, 884, 'NM'), (885, 885, 'TX'), (889, 898, 'NV'), (900, 961, 'CA'), (967, 968, 'HI'),
+    (970, 979, 'OR'), (980, 994, 'WA'), (995, 999, 'AK'),
+]
+
+# Mexican código postal ranges (first 2 digits, inclusive) -> state
+liMxCpRanges = [
+    (1, 16, 'CMX'), (20, 20, 'AGU'), (21, 22, 'BCN'), (23, 23, 'BCS'), (24, 24, 'CAM'), (25, 27, 'COA'),
+    (28, 28, 'COL'), (29, 30, 'CHP'), (31, 33, 'CHH'), (34, 35, 'DUR'), (36, 38, 'GUA'), (39, 41, 'GRO'),
+    (42, 43, 'HID'), (44, 49, 'JAL'), (50, 57, 'MEX'), (58, 61, 'MIC'), (62, 62, 'MOR'), (63, 63, 'NAY'),
+    (64, 67, 'NLE'), (68, 71, 'OAX'), (72, 75, 'PUE'), (76, 76, 'QUE'), (77, 77, 'ROO'), (78, 79, 'SLP'),
+    (80, 82, 'SIN'), (83, 85, 'SON'), (86, 86, 'TAB'), (87, 89, 'TAM'), (90, 90, 'TLA'), (91, 96, 'VER'),
+    (97, 97, 'YUC'), (98, 99, 'ZAC'),
+]
+
+# Canadian FSA (first 3 characters of the postal code) first letter -> province, and the FSAs
+# of the letters shared by several territories
+dictCaFsaLetters = {
+    'A': 'NL', 'B': 'NS', 'C': 'PE', 'E': 'NB', 'G': 'QC', 'H': 'QC', 'J': 'QC', 'K': 'ON', 'L': 'ON',
+    'M': 'ON', 'N': 'ON', 'P': 'ON', 'R': 'MB', 'S': 'SK', 'T': 'AB', 'V': 'BC', 'Y': 'YT',
+}
+dictCaFsas = {'X0A': 'NU', 'X0B': 'NU', 'X0C': 'NU', 'X0E': 'NT', 'X0G': 'NT', 'X1A': 'NT'}
+
+# Country of the numeric (5 digit) postal codes of a marketplace report, by the lower case strOrg.
+# Canadian postal codes are alphanumeric, so 5 digits in a Canadian report are a US ZIP code.
+dictNumericPostalCountries = {'usa': 'US', 'canada': 'US', 'mexico': 'MX'}
+
+class CPostalIndex:
+    """
+    Offline postal code index: US ZIP3, Canadian FSA and Mexican CP prefixes to the state or
+    province. The numeric prefixes are kept as sorted range arrays searched with
+    np.searchsorted, the FSAs as dicts, and a frame is resolved in one vectorized pass over
+    its unique postal codes.
+
+    Methods:
+        - MGetDefault
+        - MBuildRanges
+        - MLookupRanges
+        - MLookupCodes
+        - MLookup
+    """
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    def __init__(self):
+        self.tUsRanges = CPostalIndex.MBuildRanges(liUsZip3Ranges, 'US')
+        self.tMxRanges = CPostalIndex.MBuildRanges(liMxCpRanges, 'MX')
+        self.dictCaFsaLetters = {k: f'CA-{v}' for k, v in dictCaFsaLetters.items()}
+        self.dictCaFsas = {k: f'CA-{v}' for k, v in dictCaFsas.items()}
+
+        # Subdivision code -> country name and state name
+        liCodes = set(self.tUsRanges[2]) | set(self.tMxRanges[2]) | set(self.dictCaFsaLetters.values()) | set(self.dictCaFsas.values())
+        self.dictCountries = {}
+        self.dictStates = {}
+        for strCode in liCodes:
+            subdivision = pycountry.subdivisions.get(code=strCode)
+            self.dictCountries[strCode] = pycountry.countries.get(alpha_2=subdivision.country_code).name
+            self.dictStates[strCode] = subdivision.name
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Returns:
+            CPostalIndex: The process wide index.
+        """
+        with CPostalIndex.objDefaultLock:
+            if CPostalIndex.objDefault is None:
+                CPostalIndex.objDefault = CPostalIndex()
+            return CPostalIndex.objDefault
+
+    @staticmethod
+    def MBuildRanges(liRanges, strCountryCode):
+        """
+        Build the sorted range arrays of a (start, end, state) list.
+
+        Returns:
+            tuple: The int array of the range starts, the int array of the range ends and the
+                   object array of the subdivision codes (e.g. 'US-NY').
+        """
+        liRanges = sorted(liRanges)
+        return (
+            np.array([r[0] for r in liRanges], dtype='int64'),
+            np.array([r[1] for r in liRanges], dtype='int64'),
+            np.array([f'{strCountryCode}-{r[2]}' for r in liRanges], dtype=object),
+        )
+
+    @staticmethod
+    def MLookupRanges(arrPrefixes, tRanges):
+        """
+        Find the range of each prefix.
+
+        Args:
+            arrPrefixes (np.ndarray): The int prefixes.
+            tRanges (tuple): The range arrays of MBuildRanges.
+
+        Returns:
+            np.ndarray: The subdivision code of each prefix, None where no range holds it.
+        """
+        arrStarts, arrEnds, arrCodes = tRanges
+        arrPositions = np.searchsorted(arrStarts, arrPrefixes, side='right') - 1
+        bMatched = (arrPositions >= 0) & (arrPrefixes <= arrEnds[arrPositions.clip(0)])
+        return np.where(bMatched, arrCodes[arrPositions.clip(0)], None)
+
+    def MLookupCodes(self, srPostal, strOrg):
+        """
+        Resolve postal codes to subdivision codes.
+
+        Args:
+            srPostal (pd.Series): The 'order postal' column.
+            strOrg (str): The marketplace of the report, decides whether 5 digit codes are US or Mexican.
+
+        Returns:
+            pd.Series: The subdivision code of each row (e.g. 'US-NY', 'CA-ON', 'MX-JAL'), None where the postal
+                       code is missing or not matched.
+        """
+        # Work on the unique postal codes only
+        arrPositions, arrUniques = pd.factorize(srPostal)
+        srUniques = pd.Series(arrUniques, dtype=object).astype(str).str.strip().str.upper()
+        arrCodes = np.full(len(srUniques), None, dtype=object)
+
+        # Canadian 'A1A 1A1' codes, by FSA then by its first letter
+        bCa = srUniques.str.match(r'^[A-Z]\d[A-Z]').to_numpy()
+        if bCa.any():
+            srFsa = srUniques[bCa].str[:3]
+            arrCodes[bCa] = srFsa.map(self.dictCaFsas).fillna(srFsa.str[0].map(self.dictCaFsaLetters)).to_numpy()
+
+        # Numeric codes, including ZIP+4 and ZIP codes that lost their leading zeros
+        srDigits = srUniques.str.extract(r'^(\d{3,5})(?:-\d{4})?$')[0]
+        bNumeric = srDigits.notna().to_numpy()
+        if bNumeric.any():
+            srDigits = srDigits[bNumeric].str.zfill(5)
+            if dictNumericPostalCountries.get(str(strOrg).lower(), 'US') == 'MX':
+                arrCodes[bNumeric] = CPostalIndex.MLookupRanges(srDigits.str[:2].astype('int64').to_numpy(), self.tMxRanges)
+            else:
+                arrCodes[bNumeric] = CPostalIndex.MLookupRanges(srDigits.str[:3].astype('int64').to_numpy(), self.tUsRanges)
+
+        # Back to one code per row, missing postal codes (position -1) take the appended None
+        arrRowCodes = np.append(arrCodes, None)[arrPositions]
+        return pd.Series(arrRowCodes, index=srPostal.index, dtype=object)
+
+    def MLookup(self, srPostal, strOrg):
+        """
+        Resolve postal codes to the country and state names.
+
+        Args:
+            srPostal (pd.Series): The 'order postal' column.
+            strOrg (str): The marketplace of the report.
+
+        Returns:
+            tuple: The country and state name Series, None where the postal code is missing or not matched.
+        """
+        srCodes = self.MLookupCodes(srPostal, strOrg)
+        return srCodes.map(self.dictCountries), srCodes.map(self.dictStates)
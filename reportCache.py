@@ -0,0 +1,186 @@
+import os
+import hashlib
+import threading
+import pandas as pd
+from logUtility import CLogUtility
+
+objLogger = CLogUtility()
+
+class CReportCache:
+    """
+    Local disk cache of parsed date range reports. Entries are keyed by the SHA-256 of the
+    uploaded file plus the marketplace, and hold the normalized report rows split by
+    transaction type, as produced by CAmzB2CHelperFunc.MProcessCsvTillPartition, as a pickle. The folder is kept under a
+    size limit by evicting the least recently used entries.
+
+    Methods:
+        - MGetDefault
+        - MGetFileHash
+        - MGetKey
+        - MGetPartialKey
+        - MGetEntryPath
+        - MLoad
+        - MStore
+        - MEvict
+        - MRemove
+    """
+
+    # Bump when the normalized frame changes shape, so stale entries are never loaded
+    iFormatVersion = 4
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    def __init__(self, strCacheFolder = '/tmp/report_cache', iMaxBytes = 256 * 1024 * 1024):
+        self.strCacheFolder = strCacheFolder
+        self.iMaxBytes = iMaxBytes
+        self.objLock = threading.Lock()
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide cache, configured by the REPORT_CACHE_DIR and REPORT_CACHE_MAX_MB
+        environment variables.
+
+        Returns:
+            CReportCache: The shared cache instance.
+        """
+        with CReportCache.objDefaultLock:
+            if CReportCache.objDefault is None:
+                CReportCache.objDefault = CReportCache(
+                    strCacheFolder = os.environ.get('REPORT_CACHE_DIR', '/tmp/report_cache'),
+                    iMaxBytes = int(os.environ.get('REPORT_CACHE_MAX_MB', 256)) * 1024 * 1024
+                )
+            return CReportCache.objDefault
+
+    @staticmethod
+    def MGetFileHash(strFilePath, iBlockSize = 1024 * 1024):
+        """
+        Compute the SHA-256 of a file without loading it in memory.
+
+        Args:
+            strFilePath (str): The file path.
+            iBlockSize (int): Number of bytes read at a time.
+
+        Returns:
+            str: The hex digest.
+        """
+        objHash = hashlib.sha256()
+        with open(strFilePath, 'rb') as objFile:
+            for bBlock in iter(lambda: objFile.read(iBlockSize), b''):
+                objHash.update(bBlock)
+        return objHash.hexdigest()
+
+    def MGetKey(self, strFilePath, strOrg, cols_to_sum, bLocalDate = False):
+        """
+        Build the cache key of a report. The summed columns are part of the key because the
+        sum verification, and so the cached result, depends on them.
+
+        Args:
+            strFilePath (str): The file path to the CSV file.
+            strOrg (str): The organization name.
+            cols_to_sum (list): List of column names to sum.
+            bLocalDate (bool): Whether the rows are dated in the local time of the marketplace.
+
+        Returns:
+            str: The cache key, usable as a file name.
+        """
+        strColsHash = hashlib.sha256('|'.join(cols_to_sum).encode('utf-8')).hexdigest()[:12]
+        strKey = f'{CReportCache.MGetFileHash(strFilePath)}-{strOrg.lower()}-{strColsHash}-v{CReportCache.iFormatVersion}'
+        return f'{strKey}-local' if bLocalDate else strKey
+
+    @staticmethod
+    def MGetPartialKey(strKey, liPartitionTypes):
+        """
+        Build the key of an entry that holds only some transaction types of a report, e.g. the
+        'Order' rows of a report that was streamed for the order builders.
+
+        Args:
+            strKey (str): The cache key of the whole report, from MGetKey.
+            liPartitionTypes (list): The transaction types the entry holds.
+
+        Returns:
+            str: The cache key, usable as a file name.
+        """
+        strTypesHash = hashlib.sha256('|'.join(sorted(liPartitionTypes)).encode('utf-8')).hexdigest()[:12]
+        return f'{strKey}-{strTypesHash}'
+
+    def MGetEntryPath(self, strKey):
+        """Path of the pickle file of a cache entry."""
+        return os.path.join(self.strCacheFolder, f'{strKey}.pkl')
+
+    def MLoad(self, strKey):
+        """
+        Load a cached entry and mark it as recently used.
+
+        Args:
+            strKey (str): The cache key from MGetKey.
+
+        Returns:
+            dict: The cached report partitions, or None on a miss.
+        """
+        strEntryPath = self.MGetEntryPath(strKey)
+        try:
+            objEntry = pd.read_pickle(strEntryPath)
+            # The modification time is the LRU clock
+            os.utime(strEntryPath)
+            objLogger.logInfo(f'Report cache hit: {strKey}')
+            return objEntry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            objLogger.logError(f'Discarding unreadable report cache entry {strKey}: {e}')
+            self.MRemove(strEntryPath)
+            return None
+
+    def MStore(self, strKey, objEntry):
+        """
+        Store an entry in the cache, then evict the least recently used entries if the
+        cache is over its size limit.
+
+        Args:
+            strKey (str): The cache key from MGetKey.
+            objEntry (dict): The report partitions to cache.
+        """
+        strEntryPath = self.MGetEntryPath(strKey)
+        strTempPath = f'{strEntryPath}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(self.strCacheFolder, exist_ok=True)
+            pd.to_pickle(objEntry, strTempPath)
+            # Atomic rename, so a concurrent reader never sees a partial file
+            os.replace(strTempPath, strEntryPath)
+        except Exception as e:
+            objLogger.logError(f'Could not store report cache entry {strKey}: {e}')
+            self.MRemove(strTempPath)
+            return
+        self.MEvict()
+
+    def MEvict(self):
+        """
+        Remove the least recently used entries until the cache fits in iMaxBytes.
+        """
+        with self.objLock:
+            try:
+                liEntries = []
+                for strName in os.listdir(self.strCacheFolder):
+                    if strName.endswith('.pkl'):
+                        objStat = os.stat(os.path.join(self.strCacheFolder, strName))
+                        liEntries.append((objStat.st_mtime, objStat.st_size, strName))
+            except FileNotFoundError:
+                return
+
+            iTotalBytes = sum(iSize for _, iSize, _ in liEntries)
+            for _, iSize, strName in sorted(liEntries):
+                if iTotalBytes <= self.iMaxBytes:
+                    break
+                self.MRemove(os.path.join(self.strCacheFolder, strName))
+                iTotalBytes -= iSize
+                objLogger.logInfo(f'Evicted report cache entry {strName}')
+
+    @staticmethod
+    def MRemove(strPath):
+        """Remove a file, ignoring the error if it is already gone."""
+        try:
+            os.remove(strPath)
+        except OSError:
+            pass
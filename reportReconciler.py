@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+from logUtility import CLogUtility
+
+objLogger = CLogUtility()
+
+class CReconciliationReport:
+    """
+    Result of one reconciliation rule over a set of report rows: whether it holds, and the
+    rows that break it with their delta, so they can be fixed in the report directly.
+
+    Methods:
+        - MToDict
+        - MLog
+    """
+
+    def __init__(self, strRule, bBalanced, iRows, iDeltaCents, iOffenders, dfOffenders):
+        # Name of the checked rule, e.g. 'sum(cols_to_sum) == total'
+        self.strRule = strRule
+        self.bBalanced = bBalanced
+        self.iRows = iRows
+        # Sum of the deltas of all the rows, in cents
+        self.iDeltaCents = iDeltaCents
+        # Number of offending rows, dfOffenders only lists the first CReportReconciler.iMaxOffenders of them
+        self.iOffenders = iOffenders
+        # Columns: 'row' (index of the data row in the report), 'settlement id', 'delta' (in currency units)
+        self.dfOffenders = dfOffenders
+
+    def MToDict(self):
+        """
+        Returns:
+            dict: The report in a JSON serializable form.
+        """
+        return {
+            'rule': self.strRule,
+            'balanced': self.bBalanced,
+            'rows': self.iRows,
+            'delta': self.iDeltaCents / 100,
+            'offenders': self.iOffenders,
+            'offendingRows': self.dfOffenders.to_dict(orient='records'),
+        }
+
+    def MLog(self):
+        """
+        Log the report, with one line per listed offending row.
+        """
+        if self.bBalanced:
+            objLogger.logInfo(f'Reconciliation passed: {self.strRule} ({self.iRows} rows)')
+            return
+        objLogger.logError(f'Reconciliation failed: {self.strRule}, {self.iOffenders} of {self.iRows} rows off, total delta {self.iDeltaCents / 100:.2f}')
+        for dictRow in self.dfOffenders.to_dict(orient='records'):
+            objLogger.logError(f"    row {dictRow['row']}, settlement id {dictRow['settlement id']}, delta {dictRow['delta']:.2f}")
+
+
+class CReportReconciler:
+    """
+    Exact reconciliation of the report money columns. The amounts are converted to int64
+    cents in one vectorized pass, so the checks do not depend on float accumulation error
+    and can be done per row instead of on the sums of the whole report.
+
+    Methods:
+        - MToCents
+        - MBuildReport
+        - MReconcileTotals
+        - MReconcileTaxColumns
+    """
+
+    # Number of offending rows listed in a report
+    iMaxOffenders = 50
+
+    @staticmethod
+    def MToCents(df, liColumns):
+        """
+        Convert money columns to int64 cents. Missing columns and values count as 0.
+
+        Args:
+            df (pd.DataFrame): The report rows.
+            liColumns (list): The money column names.
+
+        Returns:
+            np.ndarray: An int64 array of shape (rows, columns).
+        """
+        dfMoney = df.reindex(columns=liColumns)
+        liNonNumeric = [col for col in liColumns if not pd.api.types.is_numeric_dtype(dfMoney[col])]
+        if liNonNumeric:
+            dfMoney[liNonNumeric] = dfMoney[liNonNumeric].apply(pd.to_numeric, errors='coerce')
+        arrAmounts = dfMoney.to_numpy(dtype='float64', na_value=0.0)
+        # The reports carry at most 2 decimals, rounding removes the binary representation error
+        return np.rint(arrAmounts * 100).astype('int64')
+
+    @staticmethod
+    def MBuildReport(df, strRule, arrDeltaCents, bBalanced, strSettleIdColName):
+        """
+        Build the report of a rule from the per-row deltas in cents.
+        """
+        bOffending = arrDeltaCents != 0
+        arrPositions = np.flatnonzero(bOffending)[:CReportReconciler.iMaxOffenders]
+        dfOffenders = pd.DataFrame({
+            'row': df.index.to_numpy()[arrPositions],
+            'settlement id': df[strSettleIdColName].to_numpy()[arrPositions] if strSettleIdColName in df.columns else None,
+            'delta': arrDeltaCents[arrPositions] / 100,
+        })
+        return CReconciliationReport(strRule, bBalanced, len(df), int(arrDeltaCents.sum()), int(bOffending.sum()), dfOffenders)
+
+    @staticmethod
+    def MReconcileTotals(df, cols_to_sum, strSettleIdColName = 'settlement id'):
+        """
+        Check that every row satisfies sum(cols_to_sum) == total, to the cent.
+
+        Args:
+            df (pd.DataFrame): The report rows.
+            cols_to_sum (list): List of column names to sum.
+            strSettleIdColName (str): The name of the settle ID column.
+
+        Returns:
+            CReconciliationReport: The rows where the columns do not add up to 'total',
+                                   with delta = sum(cols_to_sum) - total.
+        """
+        arrCents = CReportReconciler.MToCents(df, list(cols_to_sum) + ['total'])
+        arrDeltaCents = arrCents[:, :-1].sum(axis=1) - arrCents[:, -1]
+        bBalanced = len(df) > 0 and not arrDeltaCents.any()
+        return CReportReconciler.MBuildReport(df, 'sum(cols_to_sum) == total', arrDeltaCents, bBalanced, strSettleIdColName)
+
+    @staticmethod
+    def MReconcileTaxColumns(df, tax_columns, strSettleIdColName = 'settlement id'):
+        """
+        Check that the tax columns add up to zero over the rows (the marketplace withheld tax
+        cancels the collected taxes), to the cent.
+
+        Args:
+            df (pd.DataFrame): The order rows.
+            tax_columns (list): The tax column names.
+            strSettleIdColName (str): The name of the settle ID column.
+
+        Returns:
+            CReconciliationReport: Balanced if the tax columns sum to zero. The offending rows are
+                                   the rows whose tax columns do not cancel, with their net tax as delta.
+        """
+        arrDeltaCents = CReportReconciler.MToCents(df, tax_columns).sum(axis=1)
+        bBalanced = int(arrDeltaCents.sum()) == 0
+        return CReportReconciler.MBuildReport(df, 'sum(tax_columns) == 0', arrDeltaCents, bBalanced, strSettleIdColName)
@@ -0,0 +1,145 @@
+class CReportSchema:
+    """
+    Column schema of the Amazon date range report for each marketplace (USA, Canada, Mexico).
+    Used at read time to load only the columns the builders need, with explicit dtypes,
+    and to rename the localized headers to the canonical (US) column names.
+
+    Methods:
+        - MGetColumnNames
+        - MGetNumericColumns
+        - MGetReadOptions
+        - MGetRenameMap
+    """
+
+    # Canonical column names in report order, with their dtype. The text and category dtypes are applied
+    # at read time, the numeric ones after it (see MGetNumericColumns)
+    dictColumnTypes = {
+        'date/time': 'str',
+        'settlement id': 'str',
+        'type': 'category',
+        'order id': 'str',
+        'sku': 'str',
+        'description': 'str',
+        'quantity': 'Int64',
+        'marketplace': 'category',
+        'fulfillment': 'category',
+        'order city': 'str',
+        'order state': 'str',
+        'order postal': 'str',
+        'tax collection model': 'category',
+        'product sales': 'float64',
+        'product sales tax': 'float64',
+        'shipping credits': 'float64',
+        'shipping credits tax': 'float64',
+        'gift wrap credits': 'float64',
+        'giftwrap credits tax': 'float64',
+        'Regulatory Fee': 'float64',
+        'Tax On Regulatory Fee': 'float64',
+        'promotional rebates': 'float64',
+        'promotional rebates tax': 'float64',
+        'marketplace withheld tax': 'float64',
+        'selling fees': 'float64',
+        'fba fees': 'float64',
+        'other transaction fees': 'float64',
+        'other': 'float64',
+        'total': 'float64',
+    }
+
+    # Header of each canonical column in the marketplace reports, where it differs from the canonical name
+    dictSourceColumns = {
+        'usa': {},
+        'canada': {
+            'giftwrap credits tax': 'gift wrap credits tax',
+            'Regulatory Fee': 'Regulatory fee',
+            'Tax On Regulatory Fee': 'Tax on regulatory fee',
+        },
+        'mexico': {
+            'date/time': 'fecha/hora',
+            'settlement id': 'Id. de liquidación',
+            'type': 'tipo',
+            'order id': 'Id. del pedido',
+            'description': 'descripción',
+            'quantity': 'cantidad',
+            'fulfillment': 'cumplimiento',
+            'order city': 'ciudad del pedido',
+            'order state': 'estado del pedido',
+            'order postal': 'código postal del pedido',
+            'tax collection model': 'modelo de recaudación de impuestos',
+            'product sales': 'ventas de productos',
+            'product sales tax': 'impuesto de ventas de productos',
+            'shipping credits': 'créditos de envío',
+            'shipping credits tax': 'impuesto de abono de envío',
+            'gift wrap credits': 'créditos por envoltorio de regalo',
+            'giftwrap credits tax': 'impuesto de créditos de envoltura',
+            'Regulatory Fee': 'Tarifa reglamentaria',
+            'Tax On Regulatory Fee': 'Impuesto sobre tarifa reglamentaria',
+            'promotional rebates': 'descuentos promocionales',
+            'promotional rebates tax': 'impuesto de reembolsos promocionales',
+            'marketplace withheld tax': 'impuesto de retenciones en la plataforma',
+            'selling fees': 'tarifas de venta',
+            'fba fees': 'tarifas fba',
+            'other transaction fees': 'tarifas de otra transacción',
+            'other': 'otro',
+        },
+    }
+
+    @staticmethod
+    def MGetColumnNames(strOrg):
+        """
+        Get the header of every canonical column in the report of the given marketplace.
+
+        Args:
+            strOrg (str): The organization, either 'mexico', 'canada' or 'usa'.
+
+        Returns:
+            dict: Canonical column name -> column header in the report.
+        """
+        dictSource = CReportSchema.dictSourceColumns.get(strOrg.lower(), {})
+        return {col: dictSource.get(col, col) for col in CReportSchema.dictColumnTypes}
+
+    @staticmethod
+    def MGetNumericColumns():
+        """
+        Returns:
+            list: The canonical names of the money columns and of 'quantity'. They are read without
+                  a forced dtype, so a malformed cell does not fail the read, and coerced after it.
+        """
+        return [col for col, strColType in CReportSchema.dictColumnTypes.items() if strColType in ('float64', 'Int64')]
+
+    @staticmethod
+    def MGetReadOptions(strOrg):
+        """
+        Get the pd.read_csv keyword arguments that project the report to the schema columns
+        and read them with explicit dtypes: IDs as strings and repeated text as 'category'.
+        The numeric columns are parsed with ',' as the thousands separator but without a
+        forced dtype (see MGetNumericColumns).
+
+        Args:
+            strOrg (str): The organization, either 'mexico', 'canada' or 'usa'.
+
+        Returns:
+            dict: Keyword arguments for pd.read_csv.
+        """
+        dictColumnNames = CReportSchema.MGetColumnNames(strOrg)
+        setSourceColumns = set(dictColumnNames.values())
+        return {
+            'usecols': lambda col: col in setSourceColumns,
+            'dtype': {
+                strSource: CReportSchema.dictColumnTypes[col] for col, strSource in dictColumnNames.items()
+                if CReportSchema.dictColumnTypes[col] in ('str', 'category')
+            },
+            'thousands': ',',
+        }
+
+    @staticmethod
+    def MGetRenameMap(strOrg):
+        """
+        Get the mapping from the localized headers of the report to the canonical column names.
+
+        Args:
+            strOrg (str): The organization, either 'mexico', 'canada' or 'usa'.
+
+        Returns:
+            dict: Column header in the report -> canonical column name.
+        """
+        return {strSource: col for col, strSource in CReportSchema.MGetColumnNames(strOrg).items() if strSource != col}
@@ -0,0 +1,72 @@
+import time
+
+class CRequestBudget:
+    """
+    Time budget of one request, handed down to the stages that call upstream services (FX
+    fetch, geocoding). Those stages may only use the time left before the reserve, which is
+    kept for shaping and writing the output files. Once it is spent, geocoding resolves
+    offline only and the rows it leaves unresolved are recorded as degraded.
+
+    time.monotonic is system wide, so a budget can be handed to the batch worker processes.
+
+    Methods:
+        - MGetRemaining
+        - MGetNetworkSeconds
+        - MIsNearlySpent
+        - MCapTimeout
+        - MFlagDegraded
+        - MIsDegraded
+    """
+
+    def __init__(self, fSeconds, fReserveSeconds = 0.0):
+        self.fSeconds = fSeconds
+        self.fReserveSeconds = fReserveSeconds
+        self.fDeadline = time.monotonic() + fSeconds
+        # (city, state code) pairs whose online lookup was skipped or failed
+        self.setDegradedPairs = set()
+
+    def MGetRemaining(self):
+        """
+        Returns:
+            float: Seconds left until the deadline, 0 once it passed.
+        """
+        return max(self.fDeadline - time.monotonic(), 0.0)
+
+    def MGetNetworkSeconds(self):
+        """
+        Returns:
+            float: Seconds the upstream calls may still use, <= 0 once only the reserve is left.
+        """
+        return self.MGetRemaining() - self.fReserveSeconds
+
+    def MIsNearlySpent(self):
+        """
+        Returns:
+            bool: True once only the reserve is left.
+        """
+        return self.MGetNetworkSeconds() <= 0
+
+    def MCapTimeout(self, fTimeout):
+        """
+        Cap the timeout of an upstream call to the time the budget still allows it.
+
+        Args:
+            fTimeout (float): The timeout the call would use without a budget.
+
+        Returns:
+            float: The capped timeout, at least 0.1 s so the call fails fast instead of not being sent.
+        """
+        return max(min(fTimeout, self.MGetNetworkSeconds()), 0.1)
+
+    def MFlagDegraded(self, city, state_code):
+        """
+        Record a (city, state code) pair the online geocoding could not resolve.
+        """
+        self.setDegradedPairs.add((city, state_code))
+
+    def MIsDegraded(self, city, state_code):
+        """
+        Returns:
+            bool: True if the online lookup of the pair was skipped or failed.
+        """
+        return (city, state_code) in self.setDegradedPairs
@@ -0,0 +1,163 @@
+import os
+import pickle
+import threading
+import pycountry
+from logUtility import CLogUtility
+
+objLogger = CLogUtility()
+
+class CSubdivisionIndex:
+    """
+    In-memory index of the subdivisions (states, provinces) of the marketplace countries, so
+    the state codes and names of the reports resolve with a dict lookup instead of a
+    pycountry search per call. The index is built from pycountry once per process, or loaded
+    from a pickled snapshot of a previous build.
+
+    Methods:
+        - MGetDefault
+        - MBuild
+        - MLoad
+        - MSave
+        - MLookup
+        - MIsCode
+    """
+
+    # Bump when the snapshot layout changes, so stale snapshots are rebuilt
+    iFormatVersion = 1
+
+    # Countries of the US, CA and MX marketplaces, in lookup order
+    liCountryCodes = ['US', 'CA', 'MX']
+
+    objDefault = None
+    objDefaultLock = threading.Lock()
+
+    def __init__(self, dictByCode, dictByName, liCountryCodes):
+        # (country code, upper case subdivision code without the country prefix) -> (country name, state name)
+        self.dictByCode = dictByCode
+        # (country code, case folded subdivision name) -> (country name, state name)
+        self.dictByName = dictByName
+        self.liCountryCodes = liCountryCodes
+
+    @staticmethod
+    def MGetDefault():
+        """
+        Get the process wide index. If the SUBDIVISION_INDEX_PATH environment variable is set,
+        the index is loaded from that snapshot, or built and saved there if it is missing or stale.
+
+        Returns:
+            CSubdivisionIndex: The shared index.
+        """
+        with CSubdivisionIndex.objDefaultLock:
+            if CSubdivisionIndex.objDefault is None:
+                strSnapshotPath = os.environ.get('SUBDIVISION_INDEX_PATH')
+                objIndex = CSubdivisionIndex.MLoad(strSnapshotPath) if strSnapshotPath else None
+                if objIndex is None:
+                    objIndex = CSubdivisionIndex.MBuild()
+                    if strSnapshotPath:
+                        objIndex.MSave(strSnapshotPath)
+                CSubdivisionIndex.objDefault = objIndex
+            return CSubdivisionIndex.objDefault
+
+    @staticmethod
+    def MBuild(liCountryCodes = None):
+        """
+        Build the index from pycountry.
+
+        Args:
+            liCountryCodes (list, optional): ISO 3166-1 alpha-2 codes of the countries to index, by default US, CA and MX.
+
+        Returns:
+            CSubdivisionIndex: The index.
+        """
+        liCountryCodes = list(liCountryCodes or CSubdivisionIndex.liCountryCodes)
+        dictByCode = {}
+        dictByName = {}
+        for strCountryCode in liCountryCodes:
+            strCountryName = pycountry.countries.get(alpha_2=strCountryCode).name
+            for subdivision in pycountry.subdivisions.get(country_code=strCountryCode) or []:
+                tNames = (strCountryName, subdivision.name)
+                # 'US-CA' -> 'CA'
+                dictByCode[(strCountryCode, subdivision.code.split('-', 1)[1].upper())] = tNames
+                dictByName[(strCountryCode, subdivision.name.casefold())] = tNames
+        return CSubdivisionIndex(dictByCode, dictByName, liCountryCodes)
+
+    @staticmethod
+    def MLoad(strSnapshotPath):
+        """
+        Load an index snapshot.
+
+        Args:
+            strSnapshotPath (str): The path of the snapshot.
+
+        Returns:
+            CSubdivisionIndex: The index, or None if the snapshot is missing, unreadable or of another format version.
+        """
+        if not os.path.exists(strSnapshotPath):
+            return None
+        try:
+            with open(strSnapshotPath, 'rb') as f:
+                dictSnapshot = pickle.load(f)
+        except Exception as e:
+            objLogger.logError(f'Could not load the subdivision index snapshot {strSnapshotPath}: {e}')
+            return None
+        if dictSnapshot.get('iFormatVersion') != CSubdivisionIndex.iFormatVersion:
+            return None
+        return CSubdivisionIndex(dictSnapshot['dictByCode'], dictSnapshot['dictByName'], dictSnapshot['liCountryCodes'])
+
+    def MSave(self, strSnapshotPath):
+        """
+        Save the index as a snapshot. The file is written under a temporary name and renamed,
+        so concurrent readers never see a partial snapshot.
+
+        Args:
+            strSnapshotPath (str): The path of the snapshot.
+        """
+        dictSnapshot = {
+            'iFormatVersion': CSubdivisionIndex.iFormatVersion,
+            'dictByCode': self.dictByCode,
+            'dictByName': self.dictByName,
+            'liCountryCodes': self.liCountryCodes,
+        }
+        strTempPath = f'{strSnapshotPath}.{os.getpid()}.tmp'
+        try:
+            strFolder = os.path.dirname(strSnapshotPath)
+            if strFolder:
+                os.makedirs(strFolder, exist_ok=True)
+            with open(strTempPath, 'wb') as f:
+                pickle.dump(dictSnapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(strTempPath, strSnapshotPath)
+        except OSError as e:
+            objLogger.logError(f'Could not save the subdivision index snapshot {strSnapshotPath}: {e}')
+
+    def MLookup(self, strValue, liCountryCodes = None):
+        """
+        Resolve a subdivision code (e.g. 'CA', 'ON', 'JAL') or name (e.g. 'Ontario').
+        The codes of the indexed countries do not overlap, the order only matters for names.
+
+        Args:
+            strValue (str): The subdivision code or name, in any case.
+            liCountryCodes (list, optional): The countries to search, in order, by default all the indexed ones.
+
+        Returns:
+            tuple: The country name and the state name, or (None, None) if not found.
+        """
+        if not isinstance(strValue, str):
+            return None, None
+        strValue = strValue.strip()
+        strCode = strValue.upper()
+        strName = strValue.casefold()
+        for strCountryCode in liCountryCodes or self.liCountryCodes:
+            tNames = self.dictByCode.get((strCountryCode, strCode)) or self.dictByName.get((strCountryCode, strName))
+            if tNames is not None:
+                return tNames
+        return None, None
+
+    def MIsCode(self, strValue):
+        """
+        Returns:
+            bool: True if the value is the subdivision code (e.g. 'NY', 'JAL') of an indexed country, not a name.
+        """
+        if not isinstance(strValue, str):
+            return False
+        strCode = strValue.strip().upper()
+        return any((strCountryCode, strCode) in self.dictByCode for strCountryCode in self.liCountryCodes)
@@ -0,0 +1,72 @@
+import time
+import asyncio
+import pytest
+from asyncGeocoder import CAsyncGeocoder, CGeocodingError
+from nominatimStandIn import CNominatimStandIn
+
+
+@pytest.fixture
+def fnStandIn():
+    liStandIns = []
+    def fnStart(**kwargs):
+        objStandIn = CNominatimStandIn(**kwargs)
+        liStandIns.append(objStandIn)
+        return objStandIn, objStandIn.MStart()
+    yield fnStart
+    for objStandIn in liStandIns:
+        objStandIn.MStop()
+
+
+def test_throttled_request_is_retried_after_retry_after(fnStandIn):
+    objStandIn, strUrl = fnStandIn(fRatePerSecond=2.0)
+    objGeocoder = CAsyncGeocoder(strUrl, fRatePerSecond=100.0, iBurst=5, iMaxConcurrency=2, fDeadlineSeconds=10.0,
+                                 iMaxRetries=3, fBackoffSeconds=0.01)
+    fStart = time.monotonic()
+    dictResults = objGeocoder.MSearchMany(['Toronto, ON', 'Austin, TX'])
+    fElapsed = time.monotonic() - fStart
+
+    assert dictResults['Toronto, ON'] == [{'display_name': 'Toronto, Ontario, Canada'}]
+    assert dictResults['Austin, TX'] == [{'display_name': 'Austin, Texas, United States'}]
+    assert objStandIn.MGetStats()['throttled'] >= 1
+    assert objGeocoder.MGetStats()['retries'] >= 1
+    # The stand-in asks for 'Retry-After: 1', which wins over the tiny backoff
+    assert fElapsed >= 1.0
+
+
+def test_concurrent_calls_for_a_query_share_one_request(fnStandIn):
+    objStandIn, strUrl = fnStandIn(fLatencySeconds=0.3)
+    objGeocoder = CAsyncGeocoder(strUrl, fRatePerSecond=100.0, iBurst=5, iMaxConcurrency=4, fDeadlineSeconds=10.0)
+    dictResults = objGeocoder.MSearchMany(['Toronto, ON'] * 5 + ['Austin, TX'])
+
+    assert dictResults['Toronto, ON'] == [{'display_name': 'Toronto, Ontario, Canada'}]
+    assert objStandIn.MGetStats()['requests'] == 2
+    dictStats = objGeocoder.MGetStats()
+    assert dictStats['calls'] == 6
+    assert dictStats['coalesced'] == 4
+
+
+def test_deadline_bounds_a_slow_request(fnStandIn):
+    objStandIn, strUrl = fnStandIn(fLatencySeconds=2.0)
+    objGeocoder = CAsyncGeocoder(strUrl, fRatePerSecond=100.0, iBurst=5, fDeadlineSeconds=10.0)
+    fStart = time.monotonic()
+    with pytest.raises(CGeocodingError):
+        objGeocoder.MSearch('Toronto, ON', fDeadlineSeconds=0.3)
+    assert time.monotonic() - fStart < 1.5
+
+
+def test_coalesced_call_extends_the_deadline_of_the_shared_request(fnStandIn):
+    objStandIn, strUrl = fnStandIn(fLatencySeconds=1.0)
+    objGeocoder = CAsyncGeocoder(strUrl, fRatePerSecond=100.0, iBurst=5, fDeadlineSeconds=10.0, fBackoffSeconds=0.01)
+
+    async def MGather():
+        # The second call joins the request of the first one, whose deadline is too short for the stand-in
+        return await asyncio.gather(
+            objGeocoder.MSearchAsync('Toronto, ON', fDeadlineSeconds=0.3),
+            objGeocoder.MSearchAsync('Toronto, ON', fDeadlineSeconds=5.0),
+            return_exceptions=True
+        )
+
+    liResults = asyncio.run_coroutine_threadsafe(MGather(), objGeocoder.MStartLoop()).result()
+    assert isinstance(liResults[0], CGeocodingError)
+    assert liResults[1] == [{'display_name': 'Toronto, Ontario, Canada'}]
+    assert objGeocoder.MGetStats()['coalesced'] == 1
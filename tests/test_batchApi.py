@@ -0,0 +1,107 @@
+import io
+import csv
+import os
+import json
+import zipfile
+import pandas as pd
+import pytest
+import AmzB2CBatch
+from app import app
+from fxProvider import CFxProvider
+from fxRateMemo import CFxRateMemo
+from reportCache import CReportCache
+from geocoderBackends import CGeocoderChain, CGazetteerBackend
+
+strUploads = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
+strUsReportPath = os.path.join(strUploads, '2024Nov16-2024Nov30CustomUnifiedTransaction_US.csv')
+strCaReportPath = os.path.join(strUploads, '2024OctMonthlyTransaction_CA.csv')
+
+pytestmark = pytest.mark.skipif(not (os.path.exists(strUsReportPath) and os.path.exists(strCaReportPath)), reason='sample reports not available')
+
+
+@pytest.fixture
+def objClient(monkeypatch, tmp_path):
+    def MGetMatrix(self, liCurrencies, strStartDate, strEndDate, strApiKey, objBudget = None):
+        idxDays = pd.bdate_range(strStartDate, strEndDate)
+        return pd.DataFrame({**{strCurrency: 1.25 for strCurrency in liCurrencies}, 'USD': 1.0}, index=idxDays)
+    monkeypatch.setattr(CFxProvider, 'MGetMatrix', MGetMatrix)
+    monkeypatch.setattr(CFxRateMemo, 'objDefault', CFxRateMemo())
+    monkeypatch.setattr(CGeocoderChain, 'objDefault', CGeocoderChain([CGazetteerBackend()]))
+    monkeypatch.setattr(CReportCache, 'objDefault', CReportCache(str(tmp_path / 'report_cache')))
+
+    # Process the reports in this process, where the upstream calls are stubbed
+    def MNoPool(*args, **kwargs):
+        raise OSError('no process pool in the tests')
+    monkeypatch.setattr(AmzB2CBatch, 'ProcessPoolExecutor', MNoPool)
+
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setitem(app.config, 'OUTPUT_FOLDER', str(tmp_path / 'output'))
+    monkeypatch.setitem(app.config, 'FX_WARMER_ENABLED', False)
+    return app.test_client()
+
+
+def MPost(objClient, liReports):
+    dictData = {
+        'file': [(open(strPath, 'rb'), os.path.basename(strPath)) for strPath, _ in liReports],
+        'strOrg': [strOrg for _, strOrg in liReports],
+        'startdate': '2024-10-01',
+        'enddate': '2024-11-30',
+    }
+    return objClient.post('/processAmzBatchCsv', data=dictData, content_type='multipart/form-data')
+
+
+def MWriteUnbalancedReport(tmp_path):
+    """
+    Copy the US sample report with the total of its first order row off by a cent.
+    """
+    with open(strUsReportPath, encoding='utf-8') as objFile:
+        liLines = objFile.read().splitlines(keepends=True)
+    liHeader = next(csv.reader([liLines[7]]))
+    for i, strLine in enumerate(liLines[8:], 8):
+        liCells = next(csv.reader([strLine]))
+        if liCells[liHeader.index('type')] == 'Order':
+            iTotal = liHeader.index('total')
+            liCells[iTotal] = f"{float(liCells[iTotal].replace(',', '')) - 0.01:.2f}"
+            objBuffer = io.StringIO()
+            csv.writer(objBuffer, quoting=csv.QUOTE_ALL, lineterminator='\n').writerow(liCells)
+            liLines[i] = objBuffer.getvalue()
+            break
+    strPath = tmp_path / 'unbalanced_US.csv'
+    strPath.write_text(''.join(liLines), encoding='utf-8')
+    return str(strPath)
+
+
+def test_batch_returns_one_folder_per_marketplace(objClient):
+    response = MPost(objClient, [(strUsReportPath, 'USA'), (strCaReportPath, 'Canada')])
+    assert response.status_code == 200
+    liNames = zipfile.ZipFile(io.BytesIO(response.data)).namelist()
+    assert 'USA/November Sales Order 2024.csv' in liNames
+    assert 'Canada/October Invoice 2024.csv' in liNames
+    assert response.headers['X-Degraded-Rows'] == '0'
+
+
+def test_failed_marketplace_comes_with_its_diagnostics(objClient, tmp_path):
+    response = MPost(objClient, [(MWriteUnbalancedReport(tmp_path), 'USA'), (strCaReportPath, 'Canada')])
+    assert response.status_code == 404
+    dictBody = response.get_json()
+    assert dictBody['marketplaces'] == ['USA']
+    dictUsa = dictBody['diagnostics']['USA']
+    assert dictUsa['error']
+    assert len(dictUsa['reconciliation']['offendingRows']) == 1
+    assert 'Canada' not in dictBody['diagnostics']
+
+
+def test_diagnostics_of_the_reports_are_zipped(tmp_path):
+    strFile = tmp_path / 'Sales Order.csv'
+    strFile.write_text('a\n1\n', encoding='utf-8')
+    dictDiagnostics = {'USA': {'exchangeRateGaps': {'missingDates': ['30-11-2024']}}, 'Canada': {}}
+    strZipPath = AmzB2CBatch.CAmzB2CBatch.MZipOutputs({'USA': [str(strFile)], 'Canada': [str(strFile)]}, str(tmp_path / 'out.zip'), dictDiagnostics)
+    with zipfile.ZipFile(strZipPath) as zipf:
+        assert sorted(zipf.namelist()) == ['Canada/Sales Order.csv', 'USA/Sales Order.csv', 'diagnostics.json']
+        assert json.loads(zipf.read('diagnostics.json')) == {'USA': dictDiagnostics['USA']}
+
+
+def test_duplicate_marketplace_is_rejected(objClient):
+    response = MPost(objClient, [(strUsReportPath, 'USA'), (strUsReportPath, 'usa')])
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'More than one USA report in the batch'
@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+from AmzB2CHelperFunc import CAmzB2CHelperFunc
+from fxProvider import CFxProvider
+from fxRateMemo import CFxRateMemo
+
+
+@pytest.fixture
+def liRequests(monkeypatch):
+    liRequests = []
+    def MGetMatrix(self, liCurrencies, strStartDate, strEndDate, strApiKey, objBudget = None):
+        liRequests.append((strStartDate, strEndDate))
+        # A different rate every trading day, so the day a rate was filled from shows
+        idxDays = pd.bdate_range(strStartDate, strEndDate)
+        return pd.DataFrame({'MXN': [0.05 + i / 1000 for i in range(len(idxDays))], 'USD': 1.0}, index=idxDays)
+    monkeypatch.setattr(CFxProvider, 'MGetMatrix', MGetMatrix)
+    monkeypatch.setattr(CFxRateMemo, 'objDefault', CFxRateMemo())
+    monkeypatch.setenv('FX_MAX_GAP_DAYS', '7')
+    return liRequests
+
+
+def test_range_starting_on_a_weekend_takes_the_rate_of_the_friday_before(liRequests):
+    # 1 September 2024 is a Sunday
+    dictRates = CAmzB2CHelperFunc.MGetExchangeRatesFinalDict('mexico', '01-09-2024', '30-09-2024')
+    assert liRequests == [('2024-08-25', '2024-09-30')]
+    assert len(dictRates) == 30
+    # Friday 30 August is the 5th trading day from Monday 26 August
+    assert dictRates['01-09-2024'] == pytest.approx(0.054)
@@ -0,0 +1,49 @@
+from fxGapFiller import CFxGapFiller
+
+
+def MGetDates(strMonth, iFirstDay, iLastDay):
+    return [f'{iDay:02d}-{strMonth}' for iDay in range(iFirstDay, iLastDay + 1)]
+
+
+def test_weekend_across_the_month_boundary_takes_the_friday_rate():
+    # Friday 29 November 2024 is the last rate, the month ends on the weekend
+    dictRates = {'28-11-2024': 1.39, '29-11-2024': 1.40, '02-12-2024': 1.41}
+    liDates = MGetDates('11-2024', 28, 30) + MGetDates('12-2024', 1, 2)
+    dictDiagnostics = {}
+    dictFilled = CFxGapFiller.MFillMissingDates(dictRates, liDates, iMaxGapDays=7, dictDiagnostics=dictDiagnostics)
+    assert list(dictFilled) == liDates
+    assert dictFilled['30-11-2024'] == 1.40
+    assert dictFilled['01-12-2024'] == 1.40
+    assert dictFilled['02-12-2024'] == 1.41
+    assert dictDiagnostics == {'filledDates': ['30-11-2024', '01-12-2024'], 'missingDates': []}
+
+
+def test_fill_stops_at_the_max_gap():
+    dictRates = {'01-10-2024': 1.35}
+    liDates = MGetDates('10-2024', 1, 12)
+    dictDiagnostics = {}
+    dictFilled = CFxGapFiller.MFillMissingDates(dictRates, liDates, iMaxGapDays=7, dictDiagnostics=dictDiagnostics)
+    assert list(dictFilled) == MGetDates('10-2024', 1, 8)
+    assert dictDiagnostics['missingDates'] == MGetDates('10-2024', 9, 12)
+    # Without a limit every date takes the last rate
+    assert len(CFxGapFiller.MFillMissingDates(dictRates, liDates)) == 12
+
+
+def test_dates_before_the_first_rate_take_the_next_one():
+    # The calendar starts on Sunday 1 September 2024, the first rate is on the Monday
+    dictRates = {'02-09-2024': 1.35, '03-09-2024': 1.36}
+    dictFilled = CFxGapFiller.MFillMissingDates(dictRates, MGetDates('09-2024', 1, 3), iMaxGapDays=7)
+    assert dictFilled == {'01-09-2024': 1.35, '02-09-2024': 1.35, '03-09-2024': 1.36}
+    # Beyond the limit they stay missing
+    dictFilled = CFxGapFiller.MFillMissingDates({'10-09-2024': 1.35}, MGetDates('09-2024', 1, 10), iMaxGapDays=7)
+    assert min(dictFilled) == '03-09-2024'
+    assert '02-09-2024' not in dictFilled
+
+
+def test_max_gap_days_from_the_environment(monkeypatch):
+    monkeypatch.setenv('FX_MAX_GAP_DAYS', '4')
+    assert CFxGapFiller.MGetMaxGapDays() == 4
+    monkeypatch.setenv('FX_MAX_GAP_DAYS', 'none')
+    assert CFxGapFiller.MGetMaxGapDays() is None
+    monkeypatch.delenv('FX_MAX_GAP_DAYS')
+    assert CFxGapFiller.MGetMaxGapDays() == 7
@@ -0,0 +1,90 @@
+import threading
+import time
+import pytest
+from fxRateMemo import CFxRateMemo
+
+
+def MGetRates(strMonth, iLastDay):
+    return {f'{iDay:02d}-{strMonth}': 1.0 + iDay / 100 for iDay in range(1, iLastDay + 1)}
+
+
+def test_concurrent_misses_load_once():
+    objMemo = CFxRateMemo()
+    liLoads = []
+    objRelease = threading.Event()
+
+    def fnLoad():
+        liLoads.append(threading.get_ident())
+        objRelease.wait(5)
+        return MGetRates('10-2024', 31), True
+
+    liResults = []
+    liThreads = [
+        threading.Thread(target=lambda: liResults.append(objMemo.MGet('Canada', '01-10-2024', '31-10-2024', fnLoad)))
+        for _ in range(8)
+    ]
+    for objThread in liThreads:
+        objThread.start()
+    time.sleep(0.2)
+    objRelease.set()
+    for objThread in liThreads:
+        objThread.join(5)
+    assert len(liLoads) == 1
+    assert len(liResults) == 8
+    assert all(dictRates == MGetRates('10-2024', 31) for dictRates in liResults)
+
+
+def test_failed_load_reaches_the_waiting_callers_and_is_not_kept():
+    objMemo = CFxRateMemo()
+    def fnLoad():
+        raise RuntimeError('rate source down')
+    with pytest.raises(RuntimeError):
+        objMemo.MGet('canada', '01-10-2024', '31-10-2024', fnLoad)
+    assert objMemo.MLookup('canada', '01-10-2024', '31-10-2024') is None
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    fNow = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: fNow[0])
+    objMemo = CFxRateMemo(iTtlSeconds=600)
+    liLoads = []
+    def fnLoad():
+        liLoads.append(1)
+        return MGetRates('10-2024', 31), True
+    objMemo.MGet('canada', '01-10-2024', '31-10-2024', fnLoad)
+    fNow[0] += 599
+    objMemo.MGet('canada', '01-10-2024', '31-10-2024', fnLoad)
+    assert len(liLoads) == 1
+    fNow[0] += 2
+    objMemo.MGet('canada', '01-10-2024', '31-10-2024', fnLoad)
+    assert len(liLoads) == 2
+
+
+def test_incomplete_rates_are_not_kept():
+    objMemo = CFxRateMemo()
+    liLoads = []
+    def fnLoad():
+        liLoads.append(1)
+        return MGetRates('10-2024', 20), False
+    assert len(objMemo.MGet('canada', '01-10-2024', '31-10-2024', fnLoad)) == 20
+    objMemo.MGet('canada', '01-10-2024', '31-10-2024', fnLoad)
+    assert len(liLoads) == 2
+
+
+def test_range_inside_a_wider_one_is_sliced():
+    objMemo = CFxRateMemo()
+    objMemo.MGet('mexico', '01-10-2024', '31-10-2024', lambda: (MGetRates('10-2024', 31), True))
+    def fnLoad():
+        raise AssertionError('the wider range should be sliced')
+    dictRates = objMemo.MGet('Mexico', '16-10-2024', '20-10-2024', fnLoad)
+    assert dictRates == {strDate: fRate for strDate, fRate in MGetRates('10-2024', 31).items() if '16' <= strDate[:2] <= '20'}
+    # Another marketplace, or a range that sticks out, is not served from it
+    assert objMemo.MLookup('canada', '16-10-2024', '20-10-2024') is None
+    assert objMemo.MLookup('mexico', '16-10-2024', '01-11-2024') is None
+
+
+def test_the_caller_gets_a_copy():
+    objMemo = CFxRateMemo()
+    dictRates = objMemo.MGet('canada', '01-10-2024', '31-10-2024', lambda: (MGetRates('10-2024', 31), True))
+    dictRates.clear()
+    assert len(objMemo.MLookup('canada', '01-10-2024', '31-10-2024')) == 31
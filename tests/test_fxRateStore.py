@@ -0,0 +1,51 @@
+import os
+from datetime import date, timedelta
+from fxRateStore import CFxRateStore
+
+
+def MGetWeekdayRates(strLastDate, iDays = 60):
+    objDate = date.fromisoformat(strLastDate)
+    dictRates = {}
+    for i in range(iDays):
+        objDay = objDate - timedelta(days=i)
+        if objDay.weekday() < 5:
+            dictRates[objDay.isoformat()] = 0.7
+    return dictRates
+
+
+def test_weekend_at_the_end_of_the_range_is_not_downloaded_again(tmp_path, monkeypatch):
+    objStore = CFxRateStore(str(tmp_path / 'fx.sqlite3'), iRefreshSeconds=0)
+    liCalls = []
+    def MFetch(strFromSymbol, strToSymbol, strApiKey, bFull = False, objBudget = None):
+        liCalls.append(bFull)
+        # The last trading day before the weekend of 2 and 3 November 2024
+        return MGetWeekdayRates('2024-11-01')
+    monkeypatch.setattr(objStore, 'MFetch', MFetch)
+
+    dictRates = objStore.MGetRates('CAD', 'USD', '2024-10-28', '2024-11-03', 'key')
+    assert max(dictRates) == '2024-11-01'
+    assert objStore.MGetMissingDates('CADUSD', '2024-10-28', '2024-11-03') == []
+    objStore.MGetRates('CAD', 'USD', '2024-10-28', '2024-11-03', 'key')
+    assert len(liCalls) == 1
+
+
+def test_missing_weekday_after_the_coverage_is_downloaded_again(tmp_path):
+    objStore = CFxRateStore(str(tmp_path / 'fx.sqlite3'), iRefreshSeconds=0)
+    objStore.MStore('CADUSD', MGetWeekdayRates('2024-10-31'))
+    # Friday 1 November has no rate yet, the weekend after it is not missing on its own
+    assert objStore.MGetMissingDates('CADUSD', '2024-10-28', '2024-11-03') == ['2024-11-01']
+    assert CFxRateStore.MGetCoveredEnd(MGetWeekdayRates('2024-10-31'), '2024-11-03') is None
+    assert CFxRateStore.MGetCoveredEnd(MGetWeekdayRates('2024-11-01'), '2024-11-03') == '2024-11-03'
+
+
+def test_forked_process_opens_its_own_connection(tmp_path):
+    objStore = CFxRateStore(str(tmp_path / 'fx.sqlite3'))
+    objStore.MStore('CADUSD', {'2024-11-01': 0.7})
+    objParentConnection = objStore.MGetConnection()[1]
+    iPid = os.fork()
+    if iPid == 0:
+        bOk = objStore.MGetConnection()[1] is not objParentConnection and \
+            objStore.MLookup('CADUSD', '2024-11-01', '2024-11-01') == {'2024-11-01': 0.7}
+        os._exit(0 if bOk else 1)
+    assert os.waitpid(iPid, 0)[1] == 0
+    assert objStore.MGetConnection()[1] is objParentConnection
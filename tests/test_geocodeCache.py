@@ -0,0 +1,15 @@
+import os
+from geocodeCache import CGeocodeCache
+
+
+def test_forked_process_opens_its_own_connection(tmp_path):
+    objCache = CGeocodeCache(str(tmp_path / 'geocode.sqlite3'))
+    objCache.MPut('New York', 'NY', ('U.S.A', 'New York'))
+    objParentConnection = objCache.MGetConnection()[1]
+    iPid = os.fork()
+    if iPid == 0:
+        bOk = objCache.MGetConnection()[1] is not objParentConnection and \
+            objCache.MGet('new  york', 'ny') == (True, ('U.S.A', 'New York'))
+        os._exit(0 if bOk else 1)
+    assert os.waitpid(iPid, 0)[1] == 0
+    assert objCache.MGetConnection()[1] is objParentConnection
@@ -0,0 +1,108 @@
+import pytest
+import requests
+import httpClient
+from httpClient import CHttpClient
+
+strUrl = 'https://api.example.com/query'
+
+
+class CStubResponse:
+    def __init__(self, iStatus, dictHeaders = None):
+        self.status_code = iStatus
+        self.headers = dictHeaders or {}
+        self.bClosed = False
+
+    def close(self):
+        self.bClosed = True
+
+
+class CStubSession:
+    """
+    Answers the requests with the scripted responses or exceptions, in order.
+    """
+    def __init__(self, liAnswers):
+        self.liAnswers = list(liAnswers)
+        self.liRequests = []
+
+    def request(self, strMethod, strUrl, **kwargs):
+        self.liRequests.append((strMethod, strUrl, kwargs))
+        objAnswer = self.liAnswers.pop(0)
+        if isinstance(objAnswer, Exception):
+            raise objAnswer
+        return objAnswer
+
+
+@pytest.fixture
+def liSleeps(monkeypatch):
+    liSleeps = []
+    monkeypatch.setattr(httpClient.time, 'sleep', liSleeps.append)
+    # The largest jitter, so the backoff is deterministic
+    monkeypatch.setattr(httpClient.random, 'uniform', lambda fLow, fHigh: fHigh)
+    return liSleeps
+
+
+def MGetClient(monkeypatch, liAnswers, **kwargs):
+    objClient = CHttpClient(fBackoffSeconds=0.5, **kwargs)
+    objSession = CStubSession(liAnswers)
+    monkeypatch.setattr(objClient, 'MGetSession', lambda strUrl: objSession)
+    return objClient, objSession
+
+
+def test_retries_with_exponential_backoff(monkeypatch, liSleeps):
+    objClient, objSession = MGetClient(monkeypatch, [CStubResponse(503), requests.ConnectionError(), CStubResponse(200)], iMaxRetries=2)
+    response = objClient.MGet(strUrl)
+    assert response.status_code == 200
+    assert liSleeps == [0.5, 1.0]
+    # The default timeouts are applied
+    assert objSession.liRequests[0][2]['timeout'] == (5.0, 30.0)
+    dictStats = objClient.MGetStats()['api.example.com']
+    assert (dictStats['requests'], dictStats['errors'], dictStats['retries']) == (3, 2, 2)
+
+
+def test_retry_after_is_honoured_within_the_limit(monkeypatch, liSleeps):
+    objStub = CStubResponse(429, {'Retry-After': '3'})
+    objClient, _ = MGetClient(monkeypatch, [objStub, CStubResponse(200)], fMaxBackoffSeconds=5.0)
+    assert objClient.MGet(strUrl).status_code == 200
+    assert liSleeps == [3.0]
+    assert objStub.bClosed
+
+
+def test_retry_after_over_the_limit_returns_the_response(monkeypatch, liSleeps):
+    objStub = CStubResponse(429, {'Retry-After': '3600'})
+    objClient, objSession = MGetClient(monkeypatch, [objStub, CStubResponse(200)], fMaxBackoffSeconds=5.0)
+    assert objClient.MGet(strUrl) is objStub
+    assert liSleeps == []
+    assert len(objSession.liRequests) == 1
+    assert objClient.MGetStats()['api.example.com']['retries'] == 0
+
+
+def test_backoff_is_capped(monkeypatch, liSleeps):
+    objClient, _ = MGetClient(monkeypatch, [requests.Timeout()] * 4 + [CStubResponse(200)], iMaxRetries=4, fMaxBackoffSeconds=1.5)
+    assert objClient.MGet(strUrl).status_code == 200
+    assert liSleeps == [0.5, 1.0, 1.5, 1.5]
+
+
+def test_last_failure_is_raised(monkeypatch, liSleeps):
+    objClient, _ = MGetClient(monkeypatch, [requests.ConnectionError(), requests.ConnectionError()], iMaxRetries=1)
+    with pytest.raises(requests.ConnectionError):
+        objClient.MGet(strUrl)
+    assert len(liSleeps) == 1
+    dictStats = objClient.MGetStats()['api.example.com']
+    assert (dictStats['requests'], dictStats['errors'], dictStats['retries']) == (2, 2, 1)
+
+
+def test_non_idempotent_requests_are_not_retried(monkeypatch, liSleeps):
+    objClient, objSession = MGetClient(monkeypatch, [CStubResponse(503), CStubResponse(200)])
+    assert objClient.MRequest('post', strUrl).status_code == 503
+    assert liSleeps == []
+    assert objSession.liRequests[0][0] == 'POST'
+
+
+def test_stats_are_kept_per_host(monkeypatch, liSleeps):
+    objClient, _ = MGetClient(monkeypatch, [CStubResponse(200), CStubResponse(404)])
+    objClient.MGet(strUrl)
+    objClient.MGet('https://other.example.com/search')
+    dictStats = objClient.MGetStats()
+    assert dictStats['api.example.com']['errors'] == 0
+    assert dictStats['other.example.com']['errors'] == 1
+    assert dictStats['other.example.com']['retries'] == 0
@@ -0,0 +1,30 @@
+import os
+import pytest
+from geocoderBackends import CGeocoderChain, CGazetteerBackend
+from AmzB2CHelperFunc import CAmzB2CHelperFunc
+from AmzB2CBatch import CAmzB2CBatch
+from reportCache import CReportCache
+
+strReportPath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads', '2024OctMonthlyTransaction_CA.csv')
+
+
+@pytest.fixture
+def offlineChain(monkeypatch):
+    monkeypatch.setattr(CGeocoderChain, 'objDefault', CGeocoderChain([CGazetteerBackend()]))
+
+
+@pytest.mark.skipif(not os.path.exists(strReportPath), reason='sample report not available')
+def test_local_dates_reach_the_report_rows(offlineChain):
+    dfWallClock = CAmzB2CHelperFunc.MPrepareOrderFrame(strReportPath, 'canada', CAmzB2CBatch.cols_to_sum, {}, bUseCache=False)
+    dfLocal = CAmzB2CHelperFunc.MPrepareOrderFrame(strReportPath, 'canada', CAmzB2CBatch.cols_to_sum, {}, bUseCache=False, bLocalDate=True)
+    assert len(dfLocal) == len(dfWallClock)
+    # The report prints Pacific time, so the late evening orders move to the next day in Toronto
+    assert (dfLocal['date/time'] >= dfWallClock['date/time']).all()
+    assert (dfLocal['date/time'] != dfWallClock['date/time']).any()
+
+
+@pytest.mark.skipif(not os.path.exists(strReportPath), reason='sample report not available')
+def test_local_dates_are_cached_apart(tmp_path):
+    objCache = CReportCache(str(tmp_path))
+    assert objCache.MGetKey(strReportPath, 'canada', CAmzB2CBatch.cols_to_sum) != \
+        objCache.MGetKey(strReportPath, 'canada', CAmzB2CBatch.cols_to_sum, bLocalDate=True)
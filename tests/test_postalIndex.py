@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+from geocoderBackends import CGeocoderChain, CGazetteerBackend
+from AmzB2CHelperFunc import CAmzB2CHelperFunc
+
+
+@pytest.fixture
+def offlineChain(monkeypatch):
+    # Offline backend only, so the rows the postal codes do not resolve never reach Nominatim
+    monkeypatch.setattr(CGeocoderChain, 'objDefault', CGeocoderChain([CGazetteerBackend()]))
+
+
+def MResolve(liRows, strOrg):
+    df = pd.DataFrame(liRows, columns=['order city', 'order state', 'order postal'])
+    df = CAmzB2CHelperFunc.MGetAllCountriesAndStates(df, strOrg=strOrg)
+    return list(zip(df['country'], df['state']))
+
+
+def test_foreign_rows_ignore_numeric_postal_codes(offlineChain):
+    liResults = MResolve([
+        ('Berlin', 'Berlin', '10115'),
+        ('Paris', 'Île-de-France', '75001'),
+        ('Sydney', 'NSW', '2000'),
+    ], 'usa')
+    assert liResults[0] == ('Germany', 'Berlin')
+    assert liResults[1] == ('France', 'Île-de-France')
+    assert liResults[2][0] != 'U.S.A'
+
+
+def test_postal_code_used_when_state_is_missing_or_consistent(offlineChain):
+    liResults = MResolve([
+        ('New York', 'NY', '10001'),
+        ('Austin', '', '78701'),
+        ('Springfield', 'Illinois', '62701'),
+    ], 'usa')
+    assert liResults == [('U.S.A', 'New York'), ('U.S.A', 'Texas'), ('U.S.A', 'Illinois')]
+
+
+def test_state_code_of_another_state_wins_over_postal_code(offlineChain):
+    # 10001 is a New York ZIP code, the row says Texas
+    assert MResolve([('Houston', 'TX', '10001')], 'usa') == [('U.S.A', 'Texas')]
+
+
+def test_canadian_report_with_foreign_row(offlineChain):
+    liResults = MResolve([
+        ('Toronto', 'ON', 'M5V 2T6'),
+        ('Berlin', 'Berlin', '10115'),
+    ], 'canada')
+    assert liResults == [('Canada', 'Ontario'), ('Germany', 'Berlin')]
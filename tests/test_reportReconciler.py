@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+from reportReconciler import CReportReconciler
+
+liColsToSum = ['product sales', 'selling fees', 'fba fees']
+
+
+def test_to_cents_removes_the_float_residue():
+    df = pd.DataFrame({'a': [0.1 + 0.2, 129.99, -6.72], 'b': ['1,5', None, '3.005']})
+    arrCents = CReportReconciler.MToCents(df, ['a', 'b', 'missing'])
+    assert arrCents.dtype == np.int64
+    # A value that is not a number and a missing column count as 0
+    assert arrCents.tolist() == [[30, 0, 0], [12999, 0, 0], [-672, 300, 0]]
+
+
+def test_float_residue_is_not_an_offender():
+    # 0.1 + 0.2 != 0.3 in float64, but the row adds up to the cent
+    df = pd.DataFrame({
+        'settlement id': ['1', '2'],
+        'product sales': [0.1, 129.99],
+        'selling fees': [0.2, -19.5],
+        'fba fees': [0.0, -6.72],
+        'total': [0.3, 103.77],
+    })
+    assert 0.1 + 0.2 != 0.3
+    objReport = CReportReconciler.MReconcileTotals(df, liColsToSum)
+    assert objReport.bBalanced
+    assert objReport.iOffenders == 0
+    assert objReport.iDeltaCents == 0
+
+
+def test_one_cent_offender_is_reported():
+    df = pd.DataFrame({
+        'settlement id': ['1', '2', '3'],
+        'product sales': [0.1, 129.99, 64.99],
+        'selling fees': [0.2, -19.5, -9.75],
+        'fba fees': [0.0, -6.72, -4.27],
+        'total': [0.3, 103.76, 50.97],
+    }, index=[10, 11, 12])
+    objReport = CReportReconciler.MReconcileTotals(df, liColsToSum)
+    assert not objReport.bBalanced
+    assert objReport.iOffenders == 1
+    assert objReport.iDeltaCents == 1
+    assert objReport.MToDict()['offendingRows'] == [{'row': 11, 'settlement id': '2', 'delta': 0.01}]
+
+
+def test_empty_report_is_not_balanced():
+    df = pd.DataFrame(columns=['settlement id', *liColsToSum, 'total'])
+    assert not CReportReconciler.MReconcileTotals(df, liColsToSum).bBalanced
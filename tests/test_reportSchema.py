@@ -0,0 +1,47 @@
+import io
+import csv
+import os
+import pytest
+from AmzB2CHelperFunc import CAmzB2CHelperFunc
+from AmzB2CBatch import CAmzB2CBatch
+
+strReportPath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads', '2024Nov16-2024Nov30CustomUnifiedTransaction_US.csv')
+
+
+def MWriteReport(tmp_path, fnEdit = None):
+    with open(strReportPath, encoding='utf-8') as objFile:
+        liLines = objFile.read().splitlines(keepends=True)
+    if fnEdit is not None:
+        liLines = fnEdit(liLines)
+    strPath = tmp_path / 'report.csv'
+    strPath.write_text(''.join(liLines), encoding='utf-8')
+    return str(strPath)
+
+
+@pytest.mark.skipif(not os.path.exists(strReportPath), reason='sample report not available')
+def test_quantity_is_an_integer_and_money_is_float(tmp_path):
+    dictPartitions = CAmzB2CHelperFunc.MProcessCsvTillPartition(MWriteReport(tmp_path), 'date/time', 'settlement id', 'order id', 'usa', CAmzB2CBatch.cols_to_sum)
+    dfOrders = dictPartitions['Order']
+    assert str(dfOrders['quantity'].dtype) == 'Int64'
+    assert str(dfOrders['product sales'].dtype) == 'float64'
+
+
+@pytest.mark.skipif(not os.path.exists(strReportPath), reason='sample report not available')
+def test_malformed_money_cell_fails_the_sums_not_the_read(tmp_path):
+    def MBreakCell(liLines):
+        # The 'product sales' cell of the first order row (the header follows the 7 preamble lines)
+        liHeader = next(csv.reader([liLines[7]]))
+        for i, strLine in enumerate(liLines[8:], 8):
+            liCells = next(csv.reader([strLine]))
+            if liCells[liHeader.index('type')] == 'Order':
+                liCells[liHeader.index('product sales')] = 'n/a'
+                objBuffer = io.StringIO()
+                csv.writer(objBuffer, quoting=csv.QUOTE_ALL, lineterminator='\n').writerow(liCells)
+                liLines[i] = objBuffer.getvalue()
+                return liLines
+    strPath = MWriteReport(tmp_path, MBreakCell)
+
+    dictDiagnostics = {}
+    dictPartitions = CAmzB2CHelperFunc.MProcessCsvTillPartition(strPath, 'date/time', 'settlement id', 'order id', 'usa', CAmzB2CBatch.cols_to_sum, dictDiagnostics)
+    assert dictPartitions is None
+    assert len(dictDiagnostics['reconciliation']['offendingRows']) == 1
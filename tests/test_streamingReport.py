@@ -0,0 +1,85 @@
+import io
+import csv
+import os
+import pandas as pd
+import pytest
+from geocoderBackends import CGeocoderChain, CGazetteerBackend
+from AmzB2CHelperFunc import CAmzB2CHelperFunc
+from AmzB2CBatch import CAmzB2CBatch
+
+strReportPath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads', '2024Nov16-2024Nov30CustomUnifiedTransaction_US.csv')
+
+# Small enough for the sample report to span many chunks
+iChunkSize = 5
+
+
+@pytest.fixture
+def offlineChain(monkeypatch):
+    monkeypatch.setattr(CGeocoderChain, 'objDefault', CGeocoderChain([CGazetteerBackend()]))
+
+
+def MWriteReport(tmp_path, dictEdits = None):
+    """
+    Copy the sample report, adding dictEdits[column] to that column of every third order row.
+    """
+    with open(strReportPath, encoding='utf-8') as objFile:
+        liLines = objFile.read().splitlines(keepends=True)
+    liHeader = next(csv.reader([liLines[7]]))
+    iOrders = 0
+    for i, strLine in enumerate(liLines[8:], 8):
+        liCells = next(csv.reader([strLine]))
+        if not dictEdits or liCells[liHeader.index('type')] != 'Order':
+            continue
+        iOrders += 1
+        if iOrders % 3:
+            continue
+        for col, fDelta in dictEdits.items():
+            iCol = liHeader.index(col)
+            liCells[iCol] = f"{float(liCells[iCol].replace(',', '')) + fDelta:.2f}"
+        objBuffer = io.StringIO()
+        csv.writer(objBuffer, quoting=csv.QUOTE_ALL, lineterminator='\n').writerow(liCells)
+        liLines[i] = objBuffer.getvalue()
+    strPath = tmp_path / 'report.csv'
+    strPath.write_text(''.join(liLines), encoding='utf-8')
+    return str(strPath)
+
+
+def MPrepare(strPath, iChunk, dictDiagnostics):
+    dictRates = {strDate: 1.25 for strDate in CAmzB2CHelperFunc.MGetLastMonthDates('16-11-2024', '30-11-2024')}
+    return CAmzB2CHelperFunc.MPrepareReportPartitions(
+        strPath, 'usa', CAmzB2CBatch.cols_to_sum, dictRates, iChunk, CAmzB2CBatch.tax_columns,
+        bUseCache=False, dictDiagnostics=dictDiagnostics, liPartitionTypes=['Order']
+    )
+
+
+@pytest.mark.skipif(not os.path.exists(strReportPath), reason='sample report not available')
+def test_streamed_order_rows_match_the_in_memory_ones(tmp_path, offlineChain):
+    strPath = MWriteReport(tmp_path)
+    dfInMemory = MPrepare(strPath, None, {})['Order']
+    dfStreamed = MPrepare(strPath, iChunkSize, {})['Order']
+    assert len(dfInMemory) > 3 * iChunkSize
+    # A streamed column only has the categories of the rows that were kept
+    dictCategories = {col: object for col in dfInMemory.columns if isinstance(dfInMemory[col].dtype, pd.CategoricalDtype)}
+    pd.testing.assert_frame_equal(dfStreamed.astype(dictCategories), dfInMemory.astype(dictCategories))
+
+
+@pytest.mark.skipif(not os.path.exists(strReportPath), reason='sample report not available')
+def test_streamed_reconciliation_matches_the_in_memory_one(tmp_path, offlineChain):
+    # Rows off by a cent in several chunks
+    strPath = MWriteReport(tmp_path, {'total': -0.01})
+    dictInMemory = {}
+    dictStreamed = {}
+    assert MPrepare(strPath, None, dictInMemory) is None
+    assert MPrepare(strPath, iChunkSize, dictStreamed) is None
+    assert len(dictInMemory['reconciliation']['offendingRows']) > 1
+    assert dictStreamed['reconciliation'] == dictInMemory['reconciliation']
+
+
+@pytest.mark.skipif(not os.path.exists(strReportPath), reason='sample report not available')
+def test_streamed_report_with_unbalanced_tax_is_rejected(tmp_path, offlineChain):
+    # The rows still add up to their total, but the tax columns of the orders no longer sum to zero
+    strPath = MWriteReport(tmp_path, {'product sales tax': 0.01, 'total': 0.01})
+    dfInMemory = MPrepare(strPath, None, {})['Order']
+    # A report read in one go is rejected by the builders
+    assert not CAmzB2CHelperFunc.MCheckTaxColsAndDropZeroSumCols(dfInMemory, CAmzB2CBatch.tax_columns, 1e-10)[1]
+    assert MPrepare(strPath, iChunkSize, {}) is None